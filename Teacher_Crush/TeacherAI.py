@@ -0,0 +1,332 @@
+# A move advisor for hints and the attract mode autoplayer.
+#
+# findBestMove() searches the live game with expectimax: the player picks
+# the best swap, then the TEACHERs that drop in are a chance event. Chance
+# nodes are estimated by playing each swap out with CHANCESAMPLES different
+# refills (copyGame() gives each its own random.Random, so the refills come
+# from the same getDropSlots() rules as the real game). The same sample
+# seeds are used for every swap at a node, so swaps are compared on the same
+# luck. Past the search depth, the best swap is only scored for its first
+# match (getSwapScore()), which is cheap enough to run on every leaf.
+#
+# The search deepens one move at a time until its time budget runs out, and
+# returns the best move of the deepest search that finished (or, if not even
+# the first one did, the move that scores most right away). On big boards
+# there are far too many moves to look at them all: only the
+# MAXBRANCHMOVES that score most right away are searched at each position,
+# and leaves only look at MAXLEAFMOVES of theirs. Values are
+# kept in a transposition table keyed by the board's Zobrist hash (see
+# newBoardHash() in TeacherEngine.py), so positions reached
+# again (by swaps in a different order, or in the next deeper search) are
+# not searched twice.
+#
+# startSearch() runs the search in a separate process (see
+# startSearchProcess()), on a copy of the game, so the game loop keeps
+# drawing while it thinks and the search doesn't have to take turns with it
+# for the interpreter lock. With SEARCHINPROCESS off it runs in a background
+# thread instead.
+#
+# Run this file directly to see how many positions it searches per second.
+
+import sys, time, random, itertools, threading, multiprocessing, signal
+from TeacherEngine import *
+
+SEARCHBUDGET = 0.2 # seconds a search may take
+MAXDEPTH = 4 # moves to look ahead at most
+CHANCESAMPLES = 2 # refills tried for each swap
+GAMEOVERVALUE = -100 # what running out of moves is worth
+MAXTABLESIZE = 200000 # transposition table entries kept before starting over
+MAXBRANCHMOVES = 30 # moves searched at each position at most
+MAXLEAFMOVES = 60 # moves a leaf scores at most
+SEARCHINPROCESS = True # False runs the searches of startSearch() in a thread
+
+SEARCHPROCESS = {'process': None, # the multiprocessing.Process the searches run in
+                 'connection': None, # the game's end of the pipe to it
+                 'cancelled': None, # shared array, see cancelSearch()
+                 'pending': {}, # searches waiting for results, by id
+                 'nextId': 0} # the id of the next search started
+CANCELLEDSLOTS = 64 # searches that can be waiting or running at once
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+def newSearch(game, budget=SEARCHBUDGET, maxDepth=MAXDEPTH, seed=None):
+    # A search dict for findBestMove(): the position to search, its limits
+    # and, once it has run, its results.
+    rng = random.Random(seed)
+    return {'game': game,
+            'budget': budget,
+            'maxDepth': maxDepth,
+            'sampleSeeds': [rng.getrandbits(32) for i in range(CHANCESAMPLES)],
+            'table': {},
+            'deadline': None,
+            'stop': False, # set by cancelSearch()
+            'done': False,
+            'bestMove': None,
+            'bestValue': None,
+            'depth': 0, # deepest search that finished
+            'nodes': 0, # positions looked at
+            'time': 0.0,
+            'id': None} # set for searches run in the search process
+
+
+def findBestMove(search):
+    # Runs the search and returns the best move found, as an
+    # ((x1, y1), (x2, y2)) tuple (None if there are no moves). The results
+    # are also left in the search dict.
+    startTime = time.perf_counter()
+    search['deadline'] = startTime + search['budget']
+    game = search['game']
+    moves = getCandidateMoves(game)
+    # Until a search finishes, the best move is the one that scores most
+    # right away.
+    search['bestMove'] = moves[0] if moves else None
+    search['bestValue'] = getSwapScore(game, moves[0]) if moves else None
+    try:
+        for depth in range(1, search['maxDepth'] + 1):
+            values = {}
+            for move in moves:
+                values[move] = getMoveValue(search, game, move, depth)
+            # Search the best moves first next time (and keep the order
+            # stable for ties, so results don't depend on set order).
+            moves.sort(key=lambda move: -values[move])
+            search['bestMove'] = moves[0] if moves else None
+            search['bestValue'] = values[moves[0]] if moves else None
+            search['depth'] = depth
+    except SearchTimeout:
+        pass # keep the result of the last search that finished
+    search['time'] = time.perf_counter() - startTime
+    search['done'] = True
+    return search['bestMove']
+
+
+def getMoveValue(search, game, move, depth):
+    # The expected points from making move and then the best depth - 1
+    # moves after it, averaged over the refill samples.
+    checkTime(search)
+    total = 0
+    for seed in search['sampleSeeds']:
+        gameCopy = copyGame(game, seed)
+        playMove(gameCopy, {'x': move[0][0], 'y': move[0][1]}, {'x': move[1][0], 'y': move[1][1]})
+        search['nodes'] += 1
+        total += gameCopy['score'] - game['score'] + getPositionValue(search, gameCopy, depth - 1)
+    return total / float(len(search['sampleSeeds']))
+
+
+def getPositionValue(search, game, depth):
+    # The expected points of the best depth moves from this position.
+    if isGameOver(game):
+        return GAMEOVERVALUE
+    if depth == 0:
+        # Leaf: only score what the best swap matches right away (of the
+        # first MAXLEAFMOVES moves, on a board with more than that).
+        leafMoves = list(itertools.islice(game['validMoves'], MAXLEAFMOVES))
+        search['nodes'] += len(leafMoves)
+        return max([getSwapScore(game, move) for move in leafMoves])
+
+    key = (game['hash']['value'], depth)
+    value = search['table'].get(key)
+    if value != None:
+        return value
+
+    value = None
+    for move in getCandidateMoves(game):
+        moveValue = getMoveValue(search, game, move, depth)
+        if value == None or moveValue > value:
+            value = moveValue
+    if len(search['table']) >= MAXTABLESIZE:
+        search['table'].clear()
+    search['table'][key] = value
+    return value
+
+
+def getCandidateMoves(game):
+    # The valid moves worth searching, best first by what they score right
+    # away (ties in move order): all of them, or the best MAXBRANCHMOVES.
+    scores = {}
+    for move in game['validMoves']:
+        scores[move] = getSwapScore(game, move)
+    moves = sorted(scores, key=lambda move: (-scores[move], move))
+    return moves[:MAXBRANCHMOVES]
+
+
+def checkTime(search):
+    if search['stop'] or time.perf_counter() > search['deadline']:
+        raise SearchTimeout()
+    if search['id'] != None and SEARCHPROCESS['cancelled'][search['id'] % CANCELLEDSLOTS] == search['id']:
+        raise SearchTimeout()
+
+
+def startSearchProcess():
+    # Start the process startSearch() runs its searches in, if it isn't
+    # running (or has died). It takes a moment to start, so the game calls
+    # this at the start rather than leaving it to the first search. The
+    # process is spawned rather than forked: the game has threads of its own
+    # (sounds, statistics) that a forked copy would be left holding the
+    # locks of. It's a plain Process and Pipe rather than a
+    # multiprocessing.Pool, whose terminate() hangs if a worker died (to a
+    # Ctrl-C sent to the whole process group, say) while it held the
+    # pool's queue lock.
+    if SEARCHPROCESS['process'] != None and SEARCHPROCESS['process'].is_alive():
+        return
+    stopSearchProcess()
+    context = multiprocessing.get_context('spawn')
+    cancelled = context.RawArray('q', [-1] * CANCELLEDSLOTS)
+    connection, processConnection = context.Pipe()
+    process = context.Process(target=runSearchProcess, args=(processConnection, cancelled), name='move search')
+    process.daemon = True
+    process.start()
+    processConnection.close()
+    SEARCHPROCESS['process'] = process
+    SEARCHPROCESS['connection'] = connection
+    SEARCHPROCESS['cancelled'] = cancelled
+
+
+def stopSearchProcess():
+    if SEARCHPROCESS['process'] != None:
+        SEARCHPROCESS['connection'].close()
+        SEARCHPROCESS['process'].terminate()
+        SEARCHPROCESS['process'].join()
+        SEARCHPROCESS['process'] = None
+        SEARCHPROCESS['connection'] = None
+    finishPendingSearches()
+
+
+def finishPendingSearches():
+    # Searches the search process won't answer any more end without a move.
+    for search in SEARCHPROCESS['pending'].values():
+        search['done'] = True
+    SEARCHPROCESS['pending'].clear()
+
+
+def runSearchProcess(connection, cancelled):
+    # The search process: search each position sent to it and send back
+    # the results, until the game closes its end of the pipe. Ctrl-C is
+    # left to the game, which stops this process when it quits.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    SEARCHPROCESS['cancelled'] = cancelled
+    while True:
+        try:
+            task = connection.recv()
+        except EOFError:
+            return
+        connection.send((task[-1], searchPositionTask(*task)))
+
+
+def getSearchPosition(game):
+    # What the search process needs of game: a copy of everything but its
+    # random.Random (each sample gets its own) and its hash's keys (the
+    # process makes the same ones itself, see getZobristKeys()).
+    return {'board': copyBoard(game['board']),
+            'numTEACHERTypes': game['numTEACHERTypes'],
+            'score': game['score'],
+            'moves': game['moves'],
+            'hashValue': game['hash']['value'],
+            'validMoves': set(game['validMoves'])}
+
+
+def searchPositionTask(position, budget, maxDepth, seed, searchId):
+    # Runs in the search process: search a position from
+    # getSearchPosition() and return the results.
+    board = position['board']
+    game = {'board': board,
+            'random': random.Random(),
+            'seed': None,
+            'numTEACHERTypes': position['numTEACHERTypes'],
+            'score': position['score'],
+            'moves': position['moves'],
+            'hash': {'value': position['hashValue'],
+                     'keys': getZobristKeys(len(board), len(board[0]), position['numTEACHERTypes'])},
+            'validMoves': position['validMoves']}
+    search = newSearch(game, budget, maxDepth, seed)
+    search['id'] = searchId
+    findBestMove(search)
+    return {'bestMove': search['bestMove'],
+            'bestValue': search['bestValue'],
+            'depth': search['depth'],
+            'nodes': search['nodes'],
+            'time': search['time']}
+
+
+def startSearch(game, budget=SEARCHBUDGET, maxDepth=MAXDEPTH, seed=None):
+    # Start searching a copy of game in the search process (or a background
+    # thread) and return the search dict right away. Poll isSearchDone(),
+    # then read 'bestMove'.
+    if not SEARCHINPROCESS:
+        search = newSearch(copyGame(game), budget, maxDepth, seed)
+        thread = threading.Thread(target=findBestMove, args=(search,), name='move search')
+        thread.daemon = True
+        thread.start()
+        search['thread'] = thread
+        return search
+
+    startSearchProcess()
+    search = newSearch(None, budget, maxDepth, seed)
+    search['id'] = SEARCHPROCESS['nextId']
+    SEARCHPROCESS['nextId'] += 1
+    SEARCHPROCESS['pending'][search['id']] = search
+    try:
+        SEARCHPROCESS['connection'].send((getSearchPosition(game), budget, maxDepth, seed, search['id']))
+    except OSError:
+        stopSearchProcess() # it died; the next search starts another
+    return search
+
+
+def isSearchDone(search):
+    # Results come back in the order the searches were started, and each
+    # poll takes all that have, whichever search they're for.
+    if SEARCHPROCESS['connection'] != None:
+        try:
+            while SEARCHPROCESS['connection'].poll():
+                searchId, results = SEARCHPROCESS['connection'].recv()
+                finished = SEARCHPROCESS['pending'].pop(searchId)
+                finished.update(results)
+                finished['done'] = True
+        except (EOFError, OSError):
+            stopSearchProcess()
+    return search['done']
+
+
+def cancelSearch(search):
+    # Ask a running search to stop. It finishes soon after, on its own. A
+    # search in the search process sees its id in the shared array (in one
+    # of CANCELLEDSLOTS slots, which older searches are long done with by
+    # the time it's used again).
+    search['stop'] = True
+    if search['id'] != None and SEARCHPROCESS['cancelled'] != None:
+        SEARCHPROCESS['cancelled'][search['id'] % CANCELLEDSLOTS] = search['id']
+
+
+if __name__ == '__main__':
+    # Search some positions and report the speed.
+    budget = float(sys.argv[1]) if len(sys.argv) > 1 else SEARCHBUDGET
+    totalNodes = 0
+    totalTime = 0.0
+    for seed in range(10):
+        game = newGame(seed)
+        search = newSearch(game, budget, MAXDEPTH, seed)
+        move = findBestMove(search)
+        totalNodes += search['nodes']
+        totalTime += search['time']
+        print('seed %s: best move %s (%.1f points expected), depth %s, %s positions' %
+              (seed, move, search['bestValue'] if search['bestValue'] != None else 0, search['depth'], search['nodes']))
+    print('%.0f positions per second' % (totalNodes / totalTime))
+
+    for name in sorted(MEMOSTATS):
+        stats = MEMOSTATS[name]
+        lookups = max(1, stats['hits'] + stats['misses'])
+        print('%s memo: %.0f%% hits, %s evictions' % (name, 100.0 * stats['hits'] / lookups, stats['evictions']))
+
+    # The same searches the way the game runs them, in the search process.
+    totalNodes = 0
+    totalTime = 0.0
+    for seed in range(10):
+        search = startSearch(newGame(seed), budget, MAXDEPTH, seed)
+        while not isSearchDone(search):
+            time.sleep(0.01)
+        totalNodes += search['nodes']
+        totalTime += search['time']
+    stopSearchProcess()
+    print('%.0f positions per second in the search process' % (totalNodes / totalTime))
@@ -0,0 +1,432 @@
+# NumPy versions of the board functions in TeacherEngine.py. The board is
+# stored as a (width, height) int8 array so board[x][y] still works, and
+# matches, valid moves, gravity and refills are all worked out with
+# whole-array operations instead of looking at one space at a time. Set
+# TeacherEngine.USENUMPYBOARD to True to use them.
+#
+# Run this file directly to check that it finds exactly the same matches and
+# valid moves as the list version on a batch of random boards, that the
+# batched gravity and refill follow the same rules as the list version, and
+# that games played on array boards keep their matches and valid moves up
+# to date; and to time moves on both kinds of board.
+
+import sys, time, random
+import numpy
+import TeacherEngine
+from TeacherEngine import EMPTY_SPACE, DOWN, MovingTEACHER, getMatchesFromCandidates, findMatchingTEACHERs, \
+                          pullDownAllTEACHERs, getFallingTEACHERs, pullDownAndRefill, newBoardHash, getValidMoves, \
+                          newGame, isGameOver, playMove, clearMemos
+
+OFFBOARD = -2 # what getSwapMask() pads the board with; never matches a TEACHER or EMPTY_SPACE
+KEYARRAYS = {} # id of a list of Zobrist keys -> the same keys as a uint64 array
+
+
+def getBlankBoardArray(width, height):
+    return numpy.full((width, height), EMPTY_SPACE, dtype=numpy.int8)
+
+
+def boardToArray(board):
+    # Convert a list-of-columns board into the array form.
+    return numpy.array(board, dtype=numpy.int8)
+
+
+def findMatchingTEACHERsArray(board):
+    # Returns the same list of matched TEACHER sets as findMatchingTEACHERs().
+    board = numpy.asarray(board, dtype=numpy.int8)
+
+    # A run of three starts at x if spaces x, x+1 and x+2 hold the same
+    # (non-empty) TEACHER. Compare shifted slices of the whole board at once.
+    start = board[:-2, :]
+    horizontal = (start == board[1:-1, :]) & (start == board[2:, :]) & (start != EMPTY_SPACE)
+    start = board[:, :-2]
+    vertical = (start == board[:, 1:-1]) & (start == board[:, 2:]) & (start != EMPTY_SPACE)
+
+    candidates = []
+    for x, y in zip(*numpy.nonzero(horizontal)):
+        candidates.append((int(x), int(y), False))
+    for x, y in zip(*numpy.nonzero(vertical)):
+        candidates.append((int(x), int(y), True))
+    if candidates == []:
+        return []
+    # Only the few candidate spaces are looked at one by one, to split up
+    # runs that cross each other the same way the list version does.
+    return getMatchesFromCandidates(board.tolist(), candidates)
+
+
+def findMatchingTEACHERsNearArray(board, changedSpaces):
+    # Returns the same list as findMatchingTEACHERsNear(). Every match goes
+    # through a changed space (see there), and only a run of 2 unchanged
+    # TEACHERs can be on either end of one (3 would have been a match
+    # already), so the whole of every match is within 2 spaces of the box
+    # around the changed spaces. That box is scanned like a whole board.
+    if len(changedSpaces) == 0:
+        return []
+    width, height = board.shape
+    x0, x1, y0, y1 = getBox(changedSpaces, 2, 2, width, height)
+    matchedTEACHERs = findMatchingTEACHERsArray(board[x0:x1, y0:y1])
+    if x0 != 0 or y0 != 0:
+        matchedTEACHERs = [[(x + x0, y + y0) for x, y in TEACHERSet] for TEACHERSet in matchedTEACHERs]
+    if TeacherEngine.CHECKINCREMENTALMATCHES:
+        fullMatchedTEACHERs = findMatchingTEACHERsArray(board)
+        assert matchedTEACHERs == fullMatchedTEACHERs, \
+            'incremental matches %s differ from full scan %s (changed spaces %s)' % (matchedTEACHERs, fullMatchedTEACHERs, sorted(changedSpaces))
+    return matchedTEACHERs
+
+
+def getBox(spaces, marginBefore, marginAfter, width, height):
+    # The box around the (x, y) tuples in spaces, widened by marginBefore
+    # to the left and top and marginAfter to the right and bottom and cut
+    # to the board, as x0, x1, y0, y1 (x1 and y1 are one past the end, for
+    # slicing).
+    xs, ys = zip(*spaces)
+    return (max(min(xs) - marginBefore, 0), min(max(xs) + marginAfter + 1, width),
+            max(min(ys) - marginBefore, 0), min(max(ys) + marginAfter + 1, height))
+
+
+def getSwapMask(board):
+    # Returns a (width - 1, height) array that is True at (x, y) if swapping
+    # the TEACHERs at (x, y) and (x + 1, y) makes a match, the way
+    # isValidSwap() decides it. (Pass board.T and transpose what comes back
+    # for the swaps with the space below.)
+    width, height = board.shape
+    padded = numpy.pad(board, 3, constant_values=OFFBOARD)
+
+    def shifted(dx, dy):
+        # What is dx, dy from the left space of each swap.
+        return padded[3 + dx:3 + dx + width - 1, 3 + dy:3 + dy + height]
+
+    def makesMatch(dx, TEACHER, awayX):
+        # True where TEACHER, moved into the space dx from the left one, is
+        # in a run of 3: up and down its column, or the two spaces further
+        # along the row (awayX is -1 or 1) away from the other swapped space.
+        up = shifted(dx, -1) == TEACHER
+        down = shifted(dx, 1) == TEACHER
+        vertical = (up & down) | (up & (shifted(dx, -2) == TEACHER)) | (down & (shifted(dx, 2) == TEACHER))
+        horizontal = (shifted(dx + awayX, 0) == TEACHER) & (shifted(dx + 2 * awayX, 0) == TEACHER)
+        return (vertical | horizontal) & (TEACHER != EMPTY_SPACE)
+
+    left = shifted(0, 0)
+    right = shifted(1, 0)
+    return (left != right) & (makesMatch(0, right, -1) | makesMatch(1, left, 1))
+
+
+def getValidMovesArray(board):
+    # Returns the same set as getValidMoves().
+    return getMovesFromMasks(getSwapMask(board), getSwapMask(board.T).T, 0, 0)
+
+
+def getMovesFromMasks(horizontal, vertical, x0, y0):
+    # The ((x1, y1), (x2, y2)) tuples of the swaps that are True in the
+    # masks from getSwapMask(), whose (0, 0) is space (x0, y0) of the board.
+    moves = set()
+    xs, ys = numpy.nonzero(horizontal)
+    for x, y in zip((xs + x0).tolist(), (ys + y0).tolist()):
+        moves.add(((x, y), (x + 1, y)))
+    xs, ys = numpy.nonzero(vertical)
+    for x, y in zip((xs + x0).tolist(), (ys + y0).tolist()):
+        moves.add(((x, y), (x, y + 1)))
+    return moves
+
+
+def updateValidMovesArray(validMoves, board, changedSpaces):
+    # Does what updateValidMoves() does, for a box of the board at once.
+    # Whether a swap makes a match depends on the spaces from 2 before its
+    # first space to 2 after its second one (and 2 either side of the row
+    # or column it's in), so those are the swaps worked out again: all of
+    # them together, from a box reaching 5 spaces past the changed spaces.
+    # Changed columns far apart (the cascades of a move on a big board) get
+    # a box each, so the empty stretch between them isn't worked on.
+    if len(changedSpaces) == 0:
+        return
+    width, height = board.shape
+    changed = numpy.zeros((width, height), dtype=bool)
+    xs, ys = zip(*changedSpaces)
+    changed[xs, ys] = True
+    changedXs = numpy.nonzero(changed.any(axis=1))[0]
+    splits = numpy.nonzero(numpy.diff(changedXs) > 2 * 5)[0] + 1
+    for columns in numpy.split(changedXs, splits):
+        x0 = max(int(columns[0]) - 5, 0)
+        x1 = min(int(columns[-1]) + 6, width)
+        changedYs = numpy.nonzero(changed[x0:x1].any(axis=0))[0]
+        y0 = max(int(changedYs[0]) - 5, 0)
+        y1 = min(int(changedYs[-1]) + 6, height)
+        window = board[x0:x1, y0:y1]
+        windowChanged = changed[x0:x1, y0:y1]
+        horizontal = getSwapMask(window)
+        vertical = getSwapMask(window.T).T
+        horizontalAffected = getAffectedSwaps(windowChanged)
+        verticalAffected = getAffectedSwaps(windowChanged.T).T
+        validMoves.difference_update(getMovesFromMasks(horizontalAffected & ~horizontal, verticalAffected & ~vertical, x0, y0))
+        validMoves.update(getMovesFromMasks(horizontalAffected & horizontal, verticalAffected & vertical, x0, y0))
+    if TeacherEngine.CHECKINCREMENTALMATCHES:
+        assert validMoves == getValidMovesArray(board), 'valid move index is out of date after changes at %s' % (sorted(changedSpaces))
+
+
+def getAffectedSwaps(changed):
+    # Returns a mask like getSwapMask()'s that is True for the swaps of a
+    # space with the one to its right that read a space where changed is
+    # True: from 2 left of the swap to 2 right of it, up to 2 above or below.
+    width, height = changed.shape
+    padded = numpy.pad(changed, 3)
+    rows = numpy.zeros((width + 6, height), dtype=bool)
+    for dy in range(-2, 3):
+        rows |= padded[:, 3 + dy:3 + dy + height]
+    affected = numpy.zeros((width - 1, height), dtype=bool)
+    for dx in range(-2, 4):
+        affected |= rows[3 + dx:3 + dx + width - 1, :]
+    return affected
+
+
+def fillBoardArray(board, numTEACHERTypes, rng, boardHash=None):
+    # The whole of TeacherEngine.fillBoard() for an array board, in place
+    # and in one go: every column is pulled down at once, and the empty
+    # spaces left at the top are all given new TEACHERs together. Returns a
+    # (width, height) array with how far the TEACHER now in each space fell
+    # (0 if it didn't move), so the fall of every TEACHER can be animated
+    # at once. See getFallingTEACHERsArray() for them as MovingTEACHERs.
+    #
+    # Only the box from the first to the last column with a gap in it, and
+    # from the top down to the lowest gap, can change, so only that box is
+    # worked on. boardHash (from newBoardHash()) is updated if there is one.
+    width, height = board.shape
+    fallDistances = numpy.zeros((width, height), dtype=numpy.intp)
+    isNew = numpy.zeros((width, height), dtype=bool)
+    isEmpty = board == EMPTY_SPACE
+    gapXs = numpy.nonzero(isEmpty.any(axis=1))[0]
+    if len(gapXs) == 0:
+        refillArray(board, isNew, numTEACHERTypes, rng) # still uses up the same random numbers
+        return fallDistances
+    x0 = int(gapXs[0])
+    x1 = int(gapXs[-1]) + 1
+    y1 = int(numpy.nonzero(isEmpty.any(axis=0))[0][-1]) + 1
+    box = board[x0:x1, :y1]
+    oldBox = box.copy()
+
+    # Gravity: a stable sort of each column on "isn't empty" puts the empty
+    # spaces on top and keeps the TEACHERs in order below them. fromY says
+    # which row each space's TEACHER came from.
+    fromY = numpy.argsort(oldBox != EMPTY_SPACE, axis=1, kind='stable')
+    box[:] = numpy.take_along_axis(oldBox, fromY, axis=1)
+    numEmpty = (box == EMPTY_SPACE).sum(axis=1)
+    rows = numpy.arange(y1)
+    isNewBox = rows[numpy.newaxis, :] < numEmpty[:, numpy.newaxis]
+    fallDistances[x0:x1, :y1] = numpy.where(isNewBox, numEmpty[:, numpy.newaxis], rows[numpy.newaxis, :] - fromY)
+    isNew[x0:x1, :y1] = isNewBox
+
+    refillArray(board, isNew, numTEACHERTypes, rng)
+    if boardHash != None:
+        updateHashArray(boardHash, oldBox, box, x0, 0)
+    return fallDistances
+
+
+def refillArray(board, isNew, numTEACHERTypes, rng):
+    # Puts a random TEACHER in every space where isNew is True, never the
+    # same as one in the space above, below, left or right of it (the same
+    # rule getDropSlots() follows). The spaces are split like the squares of
+    # a checkerboard: none of the spaces of one color are next to each
+    # other, so all of them can be picked at once, first the new spaces on
+    # one color (next to the TEACHERs already there) and then the rest
+    # (next to everything). All the random numbers for a call come from one
+    # numbers generator seeded from rng, so the same rng gives the same
+    # TEACHERs (though not the ones the list board would get).
+    width, height = board.shape
+    generator = numpy.random.default_rng(rng.getrandbits(64))
+    allXs, allYs = numpy.nonzero(isNew)
+    colors = (allXs + allYs) % 2
+    for color in (0, 1):
+        spaceXs = allXs[colors == color]
+        spaceYs = allYs[colors == color]
+        if len(spaceXs) == 0:
+            continue
+        excluded = numpy.zeros((len(spaceXs), numTEACHERTypes), dtype=bool)
+        spaceNums = numpy.arange(len(spaceXs))
+        for offsetX, offsetY in ((0, -1), (1, 0), (0, 1), (-1, 0)):
+            neighborXs = spaceXs + offsetX
+            neighborYs = spaceYs + offsetY
+            onBoard = (neighborXs >= 0) & (neighborXs < width) & (neighborYs >= 0) & (neighborYs < height)
+            neighborTEACHERs = numpy.full(len(spaceXs), EMPTY_SPACE, dtype=board.dtype)
+            neighborTEACHERs[onBoard] = board[neighborXs[onBoard], neighborYs[onBoard]]
+            hasTEACHER = neighborTEACHERs != EMPTY_SPACE
+            excluded[spaceNums[hasTEACHER], neighborTEACHERs[hasTEACHER]] = True
+        # Pick the choice-th of the TEACHERs that are left for each space:
+        # it's the one at the first column where the running count of
+        # TEACHERs left goes past choice.
+        possible = ~excluded
+        choice = (generator.random(len(spaceXs)) * possible.sum(axis=1)).astype(numpy.intp)
+        board[spaceXs, spaceYs] = (numpy.cumsum(possible, axis=1) <= choice[:, numpy.newaxis]).sum(axis=1)
+
+
+def updateHashArray(boardHash, oldBoard, board, x0=0, y0=0):
+    # Update boardHash for the spaces that are different in board than in
+    # oldBoard, with one XOR reduction for all of them. The two can be a
+    # box of the board whose top left space is (x0, y0).
+    keys = boardHash['keys']
+    if id(keys) not in KEYARRAYS:
+        KEYARRAYS[id(keys)] = numpy.array(keys, dtype=numpy.uint64)
+    keyArray = KEYARRAYS[id(keys)]
+    xs, ys = numpy.nonzero(oldBoard != board)
+    if len(xs) == 0:
+        return
+    changes = keyArray[xs + x0, ys + y0, oldBoard[xs, ys].astype(numpy.intp) + 1] ^ keyArray[xs + x0, ys + y0, board[xs, ys].astype(numpy.intp) + 1]
+    boardHash['value'] ^= int(numpy.bitwise_xor.reduce(changes))
+
+
+def getFallingTEACHERsArray(board, fallDistances):
+    # The MovingTEACHERs of getFallingTEACHERs() for a board filled by
+    # fillBoardArray(): every TEACHER that fell, at the space it fell from
+    # (new TEACHERs start above the board, at negative y values).
+    fallingTEACHERs = []
+    for x, y in zip(*numpy.nonzero(fallDistances)):
+        x = int(x)
+        y = int(y)
+        distance = int(fallDistances[x, y])
+        fallingTEACHERs.append(MovingTEACHER(int(board[x, y]), x, y - distance, DOWN, distance))
+    return fallingTEACHERs
+
+
+def compareWithListBoard(numBoards=10000, seed=0):
+    # Check findMatchingTEACHERsArray() against findMatchingTEACHERs(), and
+    # getValidMovesArray() against getValidMoves(), on random boards of
+    # different sizes. Returns the number of mismatches.
+    rng = random.Random(seed)
+    mismatches = 0
+    for i in range(numBoards):
+        width = rng.randint(1, 12)
+        height = rng.randint(1, 12)
+        numTEACHERTypes = rng.randint(2, 7) # few types, so there are lots of runs
+        board = []
+        for x in range(width):
+            board.append([rng.randint(EMPTY_SPACE, numTEACHERTypes - 1) for y in range(height)])
+
+        expected = findMatchingTEACHERs(board)
+        got = findMatchingTEACHERsArray(boardToArray(board))
+        if got != expected:
+            mismatches += 1
+            print('Mismatch on board %s: expected %s, got %s' % (board, expected, got))
+        expectedMoves = getValidMoves(board)
+        gotMoves = getValidMovesArray(boardToArray(board))
+        if gotMoves != expectedMoves:
+            mismatches += 1
+            print('Valid moves mismatch on board %s: expected %s, got %s' % (board, sorted(expectedMoves), sorted(gotMoves)))
+    return mismatches
+
+
+def checkFillBoardArray(numBoards=2000, seed=0):
+    # Check fillBoardArray() on random boards with random gaps: the old
+    # TEACHERs have to end up where pullDownAllTEACHERs() puts them, fall as
+    # far as getFallingTEACHERs() says, and the new ones can't be next to
+    # the same TEACHER. Returns the number of boards that are wrong.
+    rng = random.Random(seed)
+    problems = 0
+    for i in range(numBoards):
+        width = rng.randint(1, 12)
+        height = rng.randint(1, 12)
+        numTEACHERTypes = rng.randint(5, 7)
+        board = []
+        for x in range(width):
+            board.append([rng.randrange(numTEACHERTypes) if rng.random() < 0.7 else EMPTY_SPACE for y in range(height)])
+
+        expected = [list(column) for column in board]
+        expectedFalls = getFallingTEACHERs(expected, [[] for x in range(width)])
+        pullDownAllTEACHERs(expected)
+        boardArray = boardToArray(board)
+        boardHash = newBoardHash(boardArray, numTEACHERTypes)
+        fallDistances = fillBoardArray(boardArray, numTEACHERTypes, rng, boardHash)
+        got = boardArray.tolist()
+
+        wrong = []
+        for x in range(width):
+            for y in range(height):
+                if expected[x][y] != EMPTY_SPACE and got[x][y] != expected[x][y]:
+                    wrong.append('(%s, %s) is %s, not %s' % (x, y, got[x][y], expected[x][y]))
+                if expected[x][y] == EMPTY_SPACE:
+                    if not 0 <= got[x][y] < numTEACHERTypes:
+                        wrong.append('(%s, %s) was refilled with %s' % (x, y, got[x][y]))
+                    for neighborX, neighborY in ((x, y - 1), (x + 1, y), (x, y + 1), (x - 1, y)):
+                        if 0 <= neighborX < width and 0 <= neighborY < height and got[neighborX][neighborY] == got[x][y]:
+                            wrong.append('(%s, %s) is next to the same TEACHER' % (x, y))
+        for TEACHER in expectedFalls:
+            if fallDistances[TEACHER.x, TEACHER.y + TEACHER.distance] != TEACHER.distance:
+                wrong.append('(%s, %s) fell %s, not %s' % (TEACHER.x, TEACHER.y, fallDistances[TEACHER.x, TEACHER.y + TEACHER.distance], TEACHER.distance))
+        if boardHash['value'] != newBoardHash(boardArray, numTEACHERTypes)['value']:
+            wrong.append('the board hash is out of date')
+        if wrong:
+            problems += 1
+            print('Board %s: %s' % (board, '; '.join(wrong)))
+    return problems
+
+
+def timeFillBoard(size=256, numTEACHERTypes=7, calls=20, seed=0):
+    # Seconds per call of fillBoardArray() and of the list version,
+    # pullDownAndRefill(), on boards with a fifth of the spaces empty.
+    rng = random.Random(seed)
+    boards = []
+    for i in range(calls):
+        boards.append([[rng.randrange(numTEACHERTypes) if rng.random() < 0.8 else EMPTY_SPACE for y in range(size)]
+                       for x in range(size)])
+    startTime = time.perf_counter()
+    for board in boards:
+        fillBoardArray(boardToArray(board), numTEACHERTypes, rng)
+    arrayTime = (time.perf_counter() - startTime) / calls
+    startTime = time.perf_counter()
+    for board in boards:
+        pullDownAndRefill(board, numTEACHERTypes, rng)
+    listTime = (time.perf_counter() - startTime) / calls
+    return arrayTime, listTime
+
+
+def checkGames(numGames=30, movesPerGame=60, seed=0):
+    # Play random moves in games on array boards with
+    # TeacherEngine.CHECKINCREMENTALMATCHES on, so every incremental match
+    # and valid move update is checked against a full scan. Returns the
+    # number of games where one was wrong.
+    rng = random.Random(seed)
+    problems = 0
+    TeacherEngine.CHECKINCREMENTALMATCHES = True
+    try:
+        for i in range(numGames):
+            clearMemos()
+            game = newGame(rng.getrandbits(32), rng.randint(4, 20), rng.randint(4, 20), rng.randint(5, 7), True)
+            try:
+                for moveNum in range(movesPerGame):
+                    if isGameOver(game):
+                        break
+                    move = rng.choice(sorted(game['validMoves']))
+                    playMove(game, {'x': move[0][0], 'y': move[0][1]}, {'x': move[1][0], 'y': move[1][1]})
+            except AssertionError as e:
+                problems += 1
+                print('Game %s: %s' % (game['seed'], e))
+    finally:
+        TeacherEngine.CHECKINCREMENTALMATCHES = False
+    return problems
+
+
+def timeMoves(size, numpyBoard, numMoves=50, seed=0):
+    # Milliseconds per playMove() of random moves on a size x size board.
+    clearMemos()
+    rng = random.Random(seed)
+    game = newGame(seed, size, size, numpyBoard=numpyBoard)
+    moveTime = 0.0
+    movesMade = 0
+    while movesMade < numMoves and not isGameOver(game):
+        move = rng.choice(sorted(game['validMoves']))
+        startTime = time.perf_counter()
+        playMove(game, {'x': move[0][0], 'y': move[0][1]}, {'x': move[1][0], 'y': move[1][1]})
+        moveTime += time.perf_counter() - startTime
+        movesMade += 1
+    return moveTime / max(movesMade, 1) * 1000
+
+
+if __name__ == '__main__':
+    mismatches = compareWithListBoard()
+    print('%s mismatches' % mismatches)
+    problems = checkFillBoardArray()
+    print('%s boards filled wrong' % problems)
+    gameProblems = checkGames()
+    print('%s games out of date' % gameProblems)
+    arrayTime, listTime = timeFillBoard()
+    print('filling a 256x256 board: %.2f ms on an array board, %.2f ms on a list board' % (arrayTime * 1000, listTime * 1000))
+    for size in (16, 64, 128, 256):
+        print('a move on a %sx%s board: %.2f ms on a list board, %.2f ms on an array board'
+              % (size, size, timeMoves(size, False), timeMoves(size, True)))
+    sys.exit(1 if mismatches or problems or gameProblems else 0)
@@ -0,0 +1,82 @@
+# Loading of the images used by TeacherCrush.py (the sounds are in
+# TeacherAudio.py).
+#
+# The TEACHER images are scaled once and packed side by side into a single
+# atlas surface in the display's pixel format, so blitting them needs no
+# conversion. The scaled atlas is saved in ASSETCACHEDIR, named after the
+# image size and the modification times of the source images, so later
+# runs can skip the scaling (and pick up changed images automatically).
+
+import os, hashlib, pygame
+from pygame.locals import *
+
+ASSETCACHEDIR = 'assetcache' # where scaled atlases are saved
+
+# Atlases already loaded in this run, by (numImages, imageSize), so zooming
+# back to a size doesn't load it again.
+LOADEDIMAGES = {}
+
+def getAtlasCachePath(imageFiles, imageSize):
+    # The cache file name changes whenever an image file is changed or
+    # the size the images are scaled to is different.
+    key = hashlib.sha1()
+    for imageFile in imageFiles:
+        key.update(('%s:%s;' % (imageFile, os.path.getmtime(imageFile))).encode('utf-8'))
+    return os.path.join(ASSETCACHEDIR, 'TEACHERatlas-%s-%s.png' % (imageSize, key.hexdigest()[:16]))
+
+
+def buildAtlas(imageFiles, imageSize):
+    # Load and scale each image, and copy it into its slot in the atlas.
+    images = []
+    hasAlpha = False
+    for imageFile in imageFiles:
+        image = pygame.image.load(imageFile)
+        if image.get_size() != (imageSize, imageSize):
+            image = pygame.transform.smoothscale(image, (imageSize, imageSize))
+        if image.get_flags() & SRCALPHA:
+            hasAlpha = True
+        images.append(image)
+
+    if hasAlpha:
+        atlas = pygame.Surface((imageSize * len(images), imageSize), SRCALPHA)
+    else:
+        atlas = pygame.Surface((imageSize * len(images), imageSize))
+    for i in range(len(images)):
+        atlas.blit(images[i], (i * imageSize, 0))
+    return atlas
+
+
+def loadTEACHERImages(numImages, imageSize):
+    # Returns a list of numImages surfaces of imageSize x imageSize pixels,
+    # all of them pieces of one display-format atlas. Must be called after
+    # pygame.display.set_mode().
+    if (numImages, imageSize) in LOADEDIMAGES:
+        return LOADEDIMAGES[(numImages, imageSize)]
+
+    imageFiles = []
+    for i in range(1, numImages + 1):
+        imageFiles.append('TEACHER%s.png' % i)
+
+    cachePath = getAtlasCachePath(imageFiles, imageSize)
+    if os.path.exists(cachePath):
+        atlas = pygame.image.load(cachePath)
+    else:
+        atlas = buildAtlas(imageFiles, imageSize)
+        try:
+            if not os.path.isdir(ASSETCACHEDIR):
+                os.makedirs(ASSETCACHEDIR)
+            pygame.image.save(atlas, cachePath)
+        except (OSError, pygame.error):
+            pass # no cache this time; the images were still loaded fine
+
+    if atlas.get_flags() & SRCALPHA:
+        atlas = atlas.convert_alpha()
+    else:
+        atlas = atlas.convert()
+
+    TEACHERImages = []
+    for i in range(numImages):
+        TEACHERImages.append(atlas.subsurface((i * imageSize, 0, imageSize, imageSize)))
+    LOADEDIMAGES[(numImages, imageSize)] = TEACHERImages
+    return TEACHERImages
+
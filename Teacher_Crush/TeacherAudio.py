@@ -0,0 +1,122 @@
+# The game's sounds.
+#
+# newSoundManager() returns right away and does the slow parts in a
+# background thread: opening the audio device (with a small buffer, so
+# sounds start soon after they're played) and loading the .wav files,
+# which pygame decodes into memory as it loads them, so nothing is read or
+# decoded while the game runs. Until that's done, or if there is no audio
+# device, playSound() does nothing.
+#
+# Each kind of sound has its own reserved mixer channels (RESERVEDCHANNELS),
+# so a long combo's match sounds can't take the channel the bad swap sound
+# needs, and nothing else pygame plays can take theirs. Match sounds asked
+# for less than MATCHSOUNDGAP seconds after the last one are coalesced:
+# the requests are merged into one sound played when the gap is up (from
+# updateSounds(), which the game loop calls every frame), so a fast
+# cascade doesn't pile up sounds and restart them over each other.
+
+import time, random, threading, pygame
+
+MIXERFREQUENCY = 44100
+MIXERSIZE = -16 # signed 16 bit samples
+MIXERCHANNELS = 2 # stereo
+MIXERBUFFER = 512 # samples; smaller means less delay before a sound starts
+
+# How many mixer channels each kind of sound gets to itself. They are
+# reserved, so pygame never hands them out for anything else.
+RESERVEDCHANNELS = {'match': 2, 'bad swap': 1}
+NUMMIXERCHANNELS = 8 # channels in all, reserved or not
+
+MATCHSOUNDGAP = 0.08 # seconds; match sounds closer together than this are merged
+
+
+def newSoundManager(numMatchSounds):
+    # Returns the sound manager dict for playSound() and updateSounds() and
+    # starts setting it up in a background thread.
+    soundManager = {'ready': False, # True once the sounds are loaded
+                    'sounds': {'bad swap': None, 'match': []},
+                    'channels': {}, # kind of sound -> list of pygame.mixer.Channel
+                    'nextChannel': {}, # kind of sound -> index of the channel to use next
+                    'lastPlayed': {}, # kind of sound -> time it was last played
+                    'pending': {}, # kind of sound -> number of coalesced requests waiting
+                    'stats': {'played': 0, 'coalesced': 0, 'skipped': 0},
+                    'error': None}
+    thread = threading.Thread(target=loadSounds, args=(soundManager, numMatchSounds), name='sound loader')
+    thread.daemon = True
+    thread.start()
+    return soundManager
+
+
+def loadSounds(soundManager, numMatchSounds):
+    # Runs in the sound loader thread. Opens the mixer, reserves the
+    # channels and loads the sounds.
+    try:
+        if not pygame.mixer.get_init():
+            pygame.mixer.init(MIXERFREQUENCY, MIXERSIZE, MIXERCHANNELS, MIXERBUFFER)
+        numReserved = sum(RESERVEDCHANNELS.values())
+        pygame.mixer.set_num_channels(max(NUMMIXERCHANNELS, numReserved))
+        pygame.mixer.set_reserved(numReserved)
+        channelNum = 0
+        for name in sorted(RESERVEDCHANNELS):
+            soundManager['channels'][name] = []
+            for i in range(RESERVEDCHANNELS[name]):
+                soundManager['channels'][name].append(pygame.mixer.Channel(channelNum))
+                channelNum += 1
+            soundManager['nextChannel'][name] = 0
+            soundManager['lastPlayed'][name] = 0
+            soundManager['pending'][name] = 0
+
+        soundManager['sounds']['bad swap'] = pygame.mixer.Sound('badswap.wav')
+        for i in range(numMatchSounds):
+            soundManager['sounds']['match'].append(pygame.mixer.Sound('match%s.wav' % i))
+    except (pygame.error, IOError) as e:
+        # No audio device (or a missing file): play the game without sound.
+        soundManager['error'] = str(e)
+        return
+    soundManager['ready'] = True
+
+
+def playSound(soundManager, name):
+    # Play the named sound (for 'match', a random one of the match sounds)
+    # on one of its reserved channels, or merge it into the last one if
+    # it's a match sound that came too soon after it.
+    if not soundManager['ready']:
+        soundManager['stats']['skipped'] += 1
+        return
+    if name == 'match' and time.time() - soundManager['lastPlayed'][name] < MATCHSOUNDGAP:
+        soundManager['pending'][name] += 1
+        soundManager['stats']['coalesced'] += 1
+        return
+    startSound(soundManager, name)
+
+
+def updateSounds(soundManager):
+    # Call once a frame: plays the coalesced sounds whose gap is up.
+    if not soundManager['ready']:
+        return
+    for name in soundManager['pending']:
+        if soundManager['pending'][name] > 0 and time.time() - soundManager['lastPlayed'][name] >= MATCHSOUNDGAP:
+            soundManager['pending'][name] = 0
+            startSound(soundManager, name)
+
+
+def startSound(soundManager, name):
+    # Plays on the first free channel for this kind of sound. If they're
+    # all busy, the channels are taken in turn, so the sound that has been
+    # playing longest is the one cut off.
+    sound = soundManager['sounds'][name]
+    if name == 'match':
+        sound = random.choice(sound)
+    channels = soundManager['channels'][name]
+    channel = None
+    for i in range(len(channels)):
+        if not channels[i].get_busy():
+            channel = channels[i]
+            soundManager['nextChannel'][name] = (i + 1) % len(channels)
+            break
+    if channel == None:
+        channel = channels[soundManager['nextChannel'][name]]
+        soundManager['nextChannel'][name] = (soundManager['nextChannel'][name] + 1) % len(channels)
+    channel.play(sound)
+    soundManager['lastPlayed'][name] = time.time()
+    soundManager['stats']['played'] += 1
@@ -0,0 +1,176 @@
+# Benchmarks for the board functions in TeacherEngine.py, run headlessly on
+# seeded boards of several sizes and numbers of TEACHER types.
+#
+#   python TeacherBench.py --save baseline.json
+#   python TeacherBench.py --compare baseline.json --threshold 0.2
+#
+# For each function, board size and type count it reports calls per second
+# and the peak memory allocated during one call (measured with tracemalloc).
+# --compare exits with status 1 if anything got slower, or allocates more,
+# than the baseline by more than the threshold.
+
+import sys, time, random, json, platform, argparse, tracemalloc
+from TeacherEngine import *
+
+BENCHSIZES = [6, 16, 64, 256] # boards are BENCHSIZES x BENCHSIZES
+BENCHTYPES = [5, 7]
+MINTIME = 0.2 # seconds to keep calling each function for
+MAXCALLS = 100000
+THRESHOLD = 0.2 # 20% slower (or bigger) than the baseline is a regression
+
+
+def getRandomBoard(size, numTEACHERTypes, rng, emptyChance=0.0):
+    # A board of random TEACHERs. It can have matches in it, which is fine
+    # for timing. With emptyChance, some spaces are left empty.
+    board = getBlankBoard(size, size)
+    for x in range(size):
+        for y in range(size):
+            if rng.random() >= emptyChance:
+                board[x][y] = rng.randrange(numTEACHERTypes)
+    return board
+
+
+def getNoMovesBoard(size, numTEACHERTypes):
+    # A board where no move is possible, so canMakeMove() has to look at
+    # every space. Spaces (x, y) and (x + 2, y - 1) are the closest ones to
+    # share a TEACHER, which is never enough for a match in one move.
+    board = getBlankBoard(size, size)
+    for x in range(size):
+        for y in range(size):
+            board[x][y] = (x + 2 * y) % numTEACHERTypes
+    return board
+
+
+# Each benchmark is (function to time, setup function). The setup function
+# returns the arguments for one call, and isn't timed.
+def setupFindMatching(size, numTEACHERTypes, rng):
+    return (getRandomBoard(size, numTEACHERTypes, rng),)
+
+def setupCanMakeMove(size, numTEACHERTypes, rng):
+    return (getNoMovesBoard(size, numTEACHERTypes),)
+
+def setupDropSlots(size, numTEACHERTypes, rng):
+    return (getRandomBoard(size, numTEACHERTypes, rng, 0.2), numTEACHERTypes, rng)
+
+def setupBoardWithGaps(size, numTEACHERTypes, rng):
+    return (getRandomBoard(size, numTEACHERTypes, rng, 0.2),)
+
+def setupBoardCopyMinus(size, numTEACHERTypes, rng):
+    board = getRandomBoard(size, numTEACHERTypes, rng, 0.2)
+    return (board, getDroppingTEACHERs(board))
+
+def setupCascadeStep(size, numTEACHERTypes, rng):
+    game = newGame(rng.random(), size, size, numTEACHERTypes)
+    x = rng.randrange(size)
+    return (game, [[(x, y) for y in range(size // 2, size // 2 + 3)]])
+
+def cascadeStep(game, matchedTEACHERs):
+    # One step of a cascade, the way resolveCascades() does it: remove the
+    # matched TEACHERs, refill the board and look for new matches.
+    board = game['board']
+    for TEACHERSet in matchedTEACHERs:
+        for x, y in TEACHERSet:
+            board[x][y] = EMPTY_SPACE
+    fillBoard(board, game['numTEACHERTypes'], game['random'])
+    findMatchingTEACHERsNear(board, getCascadeChangedSpaces(matchedTEACHERs))
+
+BENCHMARKS = {'findMatchingTEACHERs': (findMatchingTEACHERs, setupFindMatching),
+              'canMakeMove': (canMakeMove, setupCanMakeMove),
+              'getDropSlots': (getDropSlots, setupDropSlots),
+              'pullDownAllTEACHERs': (pullDownAllTEACHERs, setupBoardWithGaps),
+              'pullDownAndRefill': (pullDownAndRefill, setupDropSlots),
+              'getDroppingTEACHERs': (getDroppingTEACHERs, setupBoardWithGaps),
+              'getBoardCopyMinusTEACHERs': (getBoardCopyMinusTEACHERs, setupBoardCopyMinus),
+              'cascadeStep': (cascadeStep, setupCascadeStep)}
+
+
+def runBenchmark(name, size, numTEACHERTypes, minTime=MINTIME, maxCalls=MAXCALLS):
+    # Returns a dict with the calls per second and the peak bytes allocated
+    # by one call of the named benchmark.
+    function, setup = BENCHMARKS[name]
+    rng = random.Random('%s-%s-%s' % (name, size, numTEACHERTypes))
+
+    # Time the calls one at a time so the setup isn't counted.
+    calls = 0
+    totalTime = 0.0
+    while (totalTime < minTime and calls < maxCalls) or calls == 0:
+        args = setup(size, numTEACHERTypes, rng)
+        startTime = time.perf_counter()
+        function(*args)
+        totalTime += time.perf_counter() - startTime
+        calls += 1
+
+    args = setup(size, numTEACHERTypes, rng)
+    tracemalloc.start()
+    function(*args)
+    peakBytes = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {'opsPerSec': calls / totalTime, 'peakAllocBytes': peakBytes, 'calls': calls}
+
+
+def runAll(names, sizes, typeCounts, minTime=MINTIME, out=sys.stdout):
+    results = {}
+    for name in names:
+        for size in sizes:
+            for numTEACHERTypes in typeCounts:
+                key = '%s/%sx%s/%s' % (name, size, size, numTEACHERTypes)
+                results[key] = runBenchmark(name, size, numTEACHERTypes, minTime)
+                out.write('%-40s %12.1f ops/s %10.1f KB\n' % (key, results[key]['opsPerSec'], results[key]['peakAllocBytes'] / 1024.0))
+                out.flush()
+    return results
+
+
+def compareResults(baseline, results, threshold=THRESHOLD):
+    # Returns a list of messages, one for each benchmark that is slower, or
+    # allocates more, than in baseline by more than threshold (0.2 = 20%).
+    regressions = []
+    for key in sorted(results):
+        if key not in baseline:
+            continue
+        old = baseline[key]
+        new = results[key]
+        if new['opsPerSec'] < old['opsPerSec'] * (1 - threshold):
+            regressions.append('%s: %.1f ops/s, was %.1f (%+.0f%%)' %
+                               (key, new['opsPerSec'], old['opsPerSec'], (new['opsPerSec'] / old['opsPerSec'] - 1) * 100))
+        if new['peakAllocBytes'] > old['peakAllocBytes'] * (1 + threshold) and new['peakAllocBytes'] - old['peakAllocBytes'] > 1024:
+            regressions.append('%s: %.1f KB allocated, was %.1f KB' %
+                               (key, new['peakAllocBytes'] / 1024.0, old['peakAllocBytes'] / 1024.0))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the Teacher Crush board functions.')
+    parser.add_argument('--functions', default=','.join(BENCHMARKS), help='comma separated names of functions to benchmark')
+    parser.add_argument('--sizes', default=','.join(map(str, BENCHSIZES)), help='comma separated board sizes')
+    parser.add_argument('--types', default=','.join(map(str, BENCHTYPES)), help='comma separated numbers of TEACHER types')
+    parser.add_argument('--min-time', type=float, default=MINTIME, help='seconds to spend on each benchmark')
+    parser.add_argument('--save', help='write the results to this JSON file as a baseline')
+    parser.add_argument('--compare', help='compare the results against this baseline JSON file')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD, help='fraction slower than the baseline that counts as a regression')
+    args = parser.parse_args(argv)
+
+    names = args.functions.split(',')
+    for name in names:
+        if name not in BENCHMARKS:
+            parser.error('unknown function %r, choose from %s' % (name, ', '.join(BENCHMARKS)))
+    results = runAll(names, [int(s) for s in args.sizes.split(',')], [int(t) for t in args.types.split(',')], args.min_time)
+
+    if args.save:
+        with open(args.save, 'w') as baselineFile:
+            json.dump({'python': platform.python_version(), 'results': results}, baselineFile, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as baselineFile:
+            baseline = json.load(baselineFile)['results']
+        regressions = compareResults(baseline, results, args.threshold)
+        for message in regressions:
+            print('REGRESSION ' + message)
+        if regressions:
+            return 1
+        print('No regressions against %s' % args.compare)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,25 +1,41 @@
-import random, time, pygame, sys, copy
+import time, pygame, sys, collections, argparse
 from pygame.locals import *
+from TeacherEngine import *
+import TeacherAssets, TeacherAudio, TeacherTween, TeacherReplay, TeacherAI, TeacherProfile, TeacherStats
 
 FPS = 30 # frames per second to update the screen
 WINDOWWIDTH = 1000  # width of the program's window, in pixels
 WINDOWHEIGHT = 1000 # height in pixels
 
-BOARDWIDTH = 6 # how many columns in the board
-BOARDHEIGHT = 6 # how many rows in the board
-TEACHERIMAGESIZE = 128 # width & height of each space in pixels
-
-# NUMTEACHERIMAGES is the number of TEACHER types. You will need .png image
-# files named TEACHER0.png, TEACHER1.png, etc. up to TEACHER(N-1).png.
-NUMTEACHERIMAGES = 7
-assert NUMTEACHERIMAGES >= 5 # game needs at least 5 types of TEACHERs to work
+TEACHERIMAGESIZE = 128 # width & height of each space in pixels, before zooming
+ZOOMSIZES = [24, 32, 48, 64, 96, 128, 160] # space sizes the view zooms through
+SCROLLSTEP = 64 # pixels the view moves for each arrow key press
 
 # NUMMATCHSOUNDS is the number of different sounds to choose from when
 # a match is made. The .wav files are named match0.wav, match1.wav, etc.
 NUMMATCHSOUNDS = 6
 
-MOVERATE = 25 # 1 to 100, larger num means faster animations
-DEDUCTSPEED = 0.8 # reduces score by 1 point every DEDUCTSPEED seconds.
+MOVETIME = 0.133 # seconds a TEACHER takes to move one space, smaller is faster
+
+# When True, only the parts of the window that changed since the last frame
+# are redrawn and passed to pygame.display.update(). When False, the whole
+# window is redrawn every frame.
+DIRTYRECTRENDERING = True
+
+TEXTCACHESIZE = 64 # how many rendered text surfaces renderText() keeps
+
+RECORDREPLAYS = True # save a log of every game in TeacherReplay.REPLAYDIR
+REPLAYMOVEDELAY = 0.5 # seconds between swaps when showing a replay at speed 1
+RECORDSTATS = True # keep every game's score and statistics in TeacherStats.STATSPATH
+
+HINTBUDGET = 0.3 # seconds the hint (H key) may think for
+AUTOPLAYBUDGET = 0.5 # seconds the autoplayer thinks for each move
+ATTRACTMODEDELAY = 60 # seconds without input before the game plays itself
+AUTOPLAYRESTARTDELAY = 3 # seconds the autoplayer shows the final score for
+
+PROFILEKEY = K_F3 # shows and hides the frame timing overlay (see TeacherProfile.py)
+PROFILEUPDATETIME = 0.5 # seconds between updates of the overlay's numbers
+PROFILEFONTSIZE = 16
 
 #             R    G    B
 PURPLE    = (255,   0, 255)
@@ -28,75 +44,130 @@ BLUE      = (  0,   0, 255)
 RED       = (255, 100, 100)
 BLACK     = (  0,   0,   0)
 BROWN     = ( 85,  65,   0)
+GREEN     = (  0, 160,   0)
 HIGHLIGHTCOLOR = PURPLE # color of the selected TEACHER's border
+HINTCOLOR = GREEN # color of the border around the TEACHERs of a hint
 BGCOLOR = LIGHTBLUE # background color on the screen
 GRIDCOLOR = BLUE # color of the game board
 GAMEOVERCOLOR = RED # color of the "Game over" text.
 GAMEOVERBGCOLOR = BLACK # background color of the "Game over" text.
 SCORECOLOR = BROWN # color of the text for the player's score
-
-# The amount of space to the sides of the board to the edge of the window
-# is used several times, so calculate it once here and store in variables.
-XMARGIN = int((WINDOWWIDTH - TEACHERIMAGESIZE * BOARDWIDTH) / 2)
-YMARGIN = int((WINDOWHEIGHT - TEACHERIMAGESIZE * BOARDHEIGHT) / 2)
-
-# constants for direction values
-UP = 'up'
-DOWN = 'down'
-LEFT = 'left'
-RIGHT = 'right'
-
-EMPTY_SPACE = -1 # an arbitrary, nonpositive value
-ROWABOVEBOARD = 'row above board' # an arbitrary, noninteger value
+PROFILECOLOR = GREEN # color of the frame timing overlay's text
+PROFILEBGCOLOR = BLACK
+
+# The part of the board that is shown in the window. Boards can be far
+# bigger than the window, so nothing is kept for each space: where a space
+# is on the screen is worked out from the space size and the pixel position
+# of the board's top left corner (left and top, which are negative when the
+# view is scrolled). Change it with setView(), scrollView() and zoomView().
+VIEW = {'boardWidth': BOARDWIDTH,
+        'boardHeight': BOARDHEIGHT,
+        'spaceSize': TEACHERIMAGESIZE,
+        'left': 0,
+        'top': 0}
 
 def main():
-    global FPSCLOCK, DISPLAYSURF, TEACHERIMAGES, GAMESOUNDS, BASICFONT, BOARDRECTS
-
-    # Initial set up.
-    pygame.init()
+    global FPSCLOCK, DISPLAYSURF, GAMESOUNDS, BASICFONT, PROFILEFONT, BOARDBACKGROUND, AUTOPLAY, SHOWPROFILE, STATSSTORE
+
+    parser = argparse.ArgumentParser(description='Teacher Crush')
+    parser.add_argument('--width', type=int, default=BOARDWIDTH, help='number of columns on the board')
+    parser.add_argument('--height', type=int, default=BOARDHEIGHT, help='number of rows on the board')
+    parser.add_argument('--space-size', type=int, default=TEACHERIMAGESIZE, help='size of each space in pixels (zoom with the mouse wheel)')
+    parser.add_argument('--replay', metavar='LOG', help='show a recorded game instead of playing')
+    parser.add_argument('--speed', type=float, default=1.0, help='how many times faster than normal to show the replay')
+    parser.add_argument('--seek', type=int, default=0, help='start the replay after this many swaps')
+    parser.add_argument('--autoplay', action='store_true', help='let the computer play (press A to toggle)')
+    parser.add_argument('--profile', action='store_true', help='show frame timings (press F3 to toggle)')
+    parser.add_argument('--profile-output', metavar='FILE', help='write the time of every frame to a .csv file or a Chrome trace (.json)')
+    args = parser.parse_args()
+    if args.speed <= 0:
+        parser.error('--speed must be more than 0')
+    if args.width < 3 or args.height < 3:
+        parser.error('the board must be at least 3x3')
+    if args.space_size < 8:
+        parser.error('--space-size must be at least 8')
+    replay = None
+    if args.replay != None:
+        replay = TeacherReplay.loadLog(args.replay)
+        args.width = replay['header']['width'] # replays are on the board they were played on
+        args.height = replay['header']['height']
+
+    # Initial set up. The mixer is left for TeacherAudio to open in the
+    # background.
+    pygame.display.init()
+    pygame.font.init()
     FPSCLOCK = pygame.time.Clock()
     DISPLAYSURF = pygame.display.set_mode((WINDOWWIDTH, WINDOWHEIGHT))
     pygame.display.set_caption('TeacherGem')
     BASICFONT = pygame.font.Font('freesansbold.ttf', 36)
+    PROFILEFONT = pygame.font.Font('freesansbold.ttf', PROFILEFONTSIZE)
+
+    # Time the frames if they're shown or saved.
+    SHOWPROFILE = args.profile
+    if args.profile or args.profile_output != None:
+        TeacherProfile.startProfiling(args.profile_output)
 
-    # Load the images
-    TEACHERIMAGES = []
-    for i in range(1, NUMTEACHERIMAGES+1):
-        TEACHERImage = pygame.image.load('TEACHER%s.png' % i)
-        if TEACHERImage.get_size() != (TEACHERIMAGESIZE, TEACHERIMAGESIZE):
-            TEACHERImage = pygame.transform.smoothscale(TEACHERImage, (TEACHERIMAGESIZE, TEACHERIMAGESIZE))
-        TEACHERIMAGES.append(TEACHERImage)
-
-    # Load the sounds.
-    GAMESOUNDS = {}
-    GAMESOUNDS['bad swap'] = pygame.mixer.Sound('badswap.wav')
-    GAMESOUNDS['match'] = []
-    for i in range(NUMMATCHSOUNDS):
-        GAMESOUNDS['match'].append(pygame.mixer.Sound('match%s.wav' % i))
-
-    # Create pygame.Rect objects for each board space to
-    # do board-coordinate-to-pixel-coordinate conversions.
-    BOARDRECTS = []
-    for x in range(BOARDWIDTH):
-        BOARDRECTS.append([])
-        for y in range(BOARDHEIGHT):
-            r = pygame.Rect((XMARGIN + (x * TEACHERIMAGESIZE),
-                             YMARGIN + (y * TEACHERIMAGESIZE),
-                             TEACHERIMAGESIZE,
-                             TEACHERIMAGESIZE))
-            BOARDRECTS[x].append(r)
+    # Start loading the sounds.
+    GAMESOUNDS = TeacherAudio.newSoundManager(NUMMATCHSOUNDS)
+
+    # The background and the empty grid only change when the view is
+    # scrolled or zoomed, so they're drawn onto this (see drawBackground()).
+    # In dirty rect mode, pieces of this are copied back to the window to
+    # erase whatever was drawn there in the previous frame.
+    BOARDBACKGROUND = pygame.Surface((WINDOWWIDTH, WINDOWHEIGHT)).convert()
+
+    # Also loads the images for the space size.
+    setView(args.width, args.height, args.space_size)
+
+    # When True, the computer picks the moves (see TeacherAI.py).
+    AUTOPLAY = args.autoplay
+
+    # Where the statistics of the games played go (written in the
+    # background, see TeacherStats.py). Replays aren't counted.
+    STATSSTORE = None
+    if RECORDSTATS and replay == None:
+        STATSSTORE = TeacherStats.openStats()
+
+    # Hints and the autoplayer think in a process of their own.
+    if replay == None and TeacherAI.SEARCHINPROCESS:
+        TeacherAI.startSearchProcess()
+
+    if replay != None:
+        runGame(replay, args.speed, args.seek)
+        TeacherProfile.stopProfiling()
+        pygame.quit()
+        sys.exit()
 
     while True:
         runGame()
 
 
-def runGame():
+def runGame(replay=None, replaySpeed=1.0, replaySeek=0):
     # Plays through a single game. When the game is over, this function returns.
+    # If replay is a log from TeacherReplay.loadLog(), the swaps in it are
+    # shown (replaySpeed times faster than normal, from swap replaySeek on)
+    # instead of taking clicks.
+    global AUTOPLAY, SHOWPROFILE
 
     # initalize the board
-    gameBoard = getBlankBoard()
-    score = 0
-    fillBoardAndAnimate(gameBoard, [], score) # Drop the initial TEACHERs.
+    recorder = None
+    gameStats = None
+    if replay != None:
+        game = TeacherReplay.seekReplay(replay, replaySeek)
+        nextReplaySwap = min(max(replaySeek, 0), len(replay['swaps']))
+        nextReplaySwapTime = 0
+    else:
+        game = newGame(TeacherReplay.getSeed(), VIEW['boardWidth'], VIEW['boardHeight'], len(TEACHERIMAGES))
+        if RECORDREPLAYS:
+            recorder = TeacherReplay.newRecorder(game)
+        if STATSSTORE != None:
+            gameStats = TeacherStats.startGameStats(STATSSTORE, game, AUTOPLAY)
+    animations = TeacherTween.newScheduler()
+    pointsText = [] # the points text shown while a cascade is falling
+
+    # moveInProgress is a generator that plays out the current move. It
+    # starts animations and then yields, and is resumed once they finish.
+    moveInProgress = dropInitialTEACHERs(game, animations)
 
     # initialize variables for the start of a new game
     firstSelectedTEACHER = None
@@ -105,19 +176,65 @@ def runGame():
     gameIsOver = False
     lastScoreDeduction = time.time()
     clickContinueTextSurf = None
+    lastInputTime = time.time()
+    gameOverTime = None
+
+    # Move searches running in the background (see TeacherAI.startSearch()).
+    hintSearch = None
+    hintMove = None # the move the hint search found, shown until a move is made
+    autoplaySearch = None
 
     while True: # main game loop
+        TeacherProfile.startFrame()
+        TeacherProfile.startSpan('events')
         clickedSpace = None
         for event in pygame.event.get(): # event handling loop
+            if event.type in (KEYUP, MOUSEBUTTONUP):
+                lastInputTime = time.time()
             if event.type == QUIT or (event.type == KEYUP and event.key == K_ESCAPE):
+                stopRecording(recorder, gameStats, game, moveInProgress)
+                if STATSSTORE != None:
+                    TeacherStats.closeStats(STATSSTORE) # writes what's still queued
+                TeacherAI.stopSearchProcess()
+                TeacherProfile.stopProfiling()
                 pygame.quit()
                 sys.exit()
             elif event.type == KEYUP and event.key == K_BACKSPACE:
+                stopRecording(recorder, gameStats, game, moveInProgress)
                 return # start a new game
+            elif event.type == KEYDOWN and event.key in (K_LEFT, K_RIGHT, K_UP, K_DOWN):
+                scrollView(SCROLLSTEP * ((event.key == K_RIGHT) - (event.key == K_LEFT)),
+                           SCROLLSTEP * ((event.key == K_DOWN) - (event.key == K_UP)))
+            elif event.type == KEYDOWN and event.key in (K_EQUALS, K_PLUS, K_KP_PLUS):
+                zoomView(1, (WINDOWWIDTH // 2, WINDOWHEIGHT // 2))
+            elif event.type == KEYDOWN and event.key in (K_MINUS, K_KP_MINUS):
+                zoomView(-1, (WINDOWWIDTH // 2, WINDOWHEIGHT // 2))
+            elif event.type in (MOUSEBUTTONDOWN, MOUSEBUTTONUP) and event.button in (4, 5):
+                # mouse wheel, zoom in or out around the mouse pointer
+                if event.type == MOUSEBUTTONDOWN:
+                    zoomView(1 if event.button == 4 else -1, event.pos)
+            elif event.type == KEYUP and event.key == K_a and replay == None:
+                AUTOPLAY = not AUTOPLAY
+            elif event.type == KEYUP and event.key == PROFILEKEY:
+                SHOWPROFILE = not SHOWPROFILE
+                if SHOWPROFILE:
+                    TeacherProfile.startProfiling() # does nothing if already timing
+            elif event.type == KEYUP and event.key == K_h and replay == None and not AUTOPLAY:
+                # Look for a good move in the background and show it.
+                if hintSearch != None:
+                    TeacherAI.cancelSearch(hintSearch)
+                hintSearch = TeacherAI.startSearch(game, HINTBUDGET)
+                hintMove = None
 
             elif event.type == MOUSEBUTTONUP:
+                if AUTOPLAY and replay == None:
+                    AUTOPLAY = False # a click stops the autoplayer
+                    continue
                 if gameIsOver:
+                    stopRecording(recorder, gameStats, game, moveInProgress)
                     return # after games ends, click to start a new game
+                if moveInProgress != None or replay != None:
+                    continue # can't select TEACHERs while they're moving
 
                 if event.pos == (lastMouseDownX, lastMouseDownY):
                     # This event is a mouse click, not the end of a mouse drag.
@@ -133,400 +250,538 @@ def runGame():
             elif event.type == MOUSEBUTTONDOWN:
                 # this is the start of a mouse click or mouse drag
                 lastMouseDownX, lastMouseDownY = event.pos
+        TeacherProfile.endSpan('events')
 
+        TeacherProfile.startSpan('logic')
         if clickedSpace and not firstSelectedTEACHER:
             # This was the first TEACHER clicked on.
             firstSelectedTEACHER = clickedSpace
         elif clickedSpace and firstSelectedTEACHER:
             # Two TEACHERs have been clicked on and selected. Swap the TEACHERs.
-            firstSwappingTEACHER, secondSwappingTEACHER = getSwappingTEACHERs(gameBoard, firstSelectedTEACHER, clickedSpace)
-            if firstSwappingTEACHER == None and secondSwappingTEACHER == None:
-                # If both are None, then the TEACHERs were not adjacent
-                firstSelectedTEACHER = None # deselect the first TEACHER
-                continue
-
-            # Show the swap animation on the screen.
-            boardCopy = getBoardCopyMinusTEACHERs(gameBoard, (firstSwappingTEACHER, secondSwappingTEACHER))
-            animateMovingTEACHERs(boardCopy, [firstSwappingTEACHER, secondSwappingTEACHER], [], score)
-
-            # Swap the TEACHERs in the board data structure.
-            gameBoard[firstSwappingTEACHER['x']][firstSwappingTEACHER['y']] = secondSwappingTEACHER['imageNum']
-            gameBoard[secondSwappingTEACHER['x']][secondSwappingTEACHER['y']] = firstSwappingTEACHER['imageNum']
-
-            # See if this is a matching move.
-            matchedTEACHERs = findMatchingTEACHERs(gameBoard)
-            if matchedTEACHERs == []:
-                # Was not a matching move; swap the TEACHERs back
-                GAMESOUNDS['bad swap'].play()
-                animateMovingTEACHERs(boardCopy, [firstSwappingTEACHER, secondSwappingTEACHER], [], score)
-                gameBoard[firstSwappingTEACHER['x']][firstSwappingTEACHER['y']] = firstSwappingTEACHER['imageNum']
-                gameBoard[secondSwappingTEACHER['x']][secondSwappingTEACHER['y']] = secondSwappingTEACHER['imageNum']
-            else:
-                # This was a matching move.
-                scoreAdd = 0
-                while matchedTEACHERs != []:
-                    # Remove matched TEACHERs, then pull down the board.
-
-                    # points is a list of dicts that tells fillBoardAndAnimate()
-                    # where on the screen to display text to show how many
-                    # points the player got. points is a list because if
-                    # the playergets multiple matches, then multiple points text should appear.
-                    points = []
-                    for TEACHERSet in matchedTEACHERs:
-                        scoreAdd += (10 + (len(TEACHERSet) - 3) * 10)
-                        for TEACHER in TEACHERSet:
-                            gameBoard[TEACHER[0]][TEACHER[1]] = EMPTY_SPACE
-                        points.append({'points': scoreAdd,
-                                       'x': TEACHER[0] * TEACHERIMAGESIZE + XMARGIN,
-                                       'y': TEACHER[1] * TEACHERIMAGESIZE + YMARGIN})
-                    random.choice(GAMESOUNDS['match']).play()
-                    score += scoreAdd
-
-                    # Drop the new TEACHERs.
-                    fillBoardAndAnimate(gameBoard, points, score)
-
-                    # Check if there are any new matches.
-                    matchedTEACHERs = findMatchingTEACHERs(gameBoard)
-            firstSelectedTEACHER = None
-
-            if not canMakeMove(gameBoard):
-                gameIsOver = True
+            # (If they were not adjacent, nothing happens.)
+            moveInProgress = startMove(game, animations, pointsText, recorder, gameStats, firstSelectedTEACHER, clickedSpace)
+            firstSelectedTEACHER = None # deselect the first TEACHER
+
+        if replay != None and moveInProgress == None and not gameIsOver and time.time() >= nextReplaySwapTime:
+            # Show the next swap of the replay.
+            swap = replay['swaps'][nextReplaySwap]
+            nextReplaySwap += 1
+            TeacherReplay.deductPoints(game, swap['deducted'])
+            moveInProgress = startMove(game, animations, pointsText, None, None,
+                                       {'x': swap['first'][0], 'y': swap['first'][1]},
+                                       {'x': swap['second'][0], 'y': swap['second'][1]})
+
+        if replay == None and not AUTOPLAY and time.time() - lastInputTime > ATTRACTMODEDELAY:
+            AUTOPLAY = True # nobody is playing, so show the game playing itself
+        if AUTOPLAY and replay == None and moveInProgress == None and not gameIsOver:
+            # Think about the next move in the background, and make it once
+            # the search is done.
+            if autoplaySearch == None:
+                autoplaySearch = TeacherAI.startSearch(game, AUTOPLAYBUDGET)
+            elif TeacherAI.isSearchDone(autoplaySearch):
+                move = autoplaySearch['bestMove']
+                autoplaySearch = None
+                if move != None:
+                    moveInProgress = startMove(game, animations, pointsText, recorder, gameStats,
+                                               {'x': move[0][0], 'y': move[0][1]},
+                                               {'x': move[1][0], 'y': move[1][1]})
+        if AUTOPLAY and replay == None and gameIsOver and time.time() - gameOverTime > AUTOPLAYRESTARTDELAY:
+            stopRecording(recorder, gameStats, game, moveInProgress)
+            return # start another game
+
+        if hintSearch != None and TeacherAI.isSearchDone(hintSearch):
+            hintMove = hintSearch['bestMove']
+            hintSearch = None
+        if moveInProgress != None:
+            # The board is changing, so any hint (or search for one) is out of date.
+            hintMove = None
+            if hintSearch != None:
+                TeacherAI.cancelSearch(hintSearch)
+                hintSearch = None
+            if autoplaySearch != None:
+                TeacherAI.cancelSearch(autoplaySearch)
+                autoplaySearch = None
+
+        if moveInProgress != None and TeacherTween.isIdle(animations):
+            # The last step's animations are done, on to the next step.
+            try:
+                next(moveInProgress)
+            except StopIteration as moveDone:
+                moveInProgress = None
+                if recorder != None:
+                    TeacherReplay.recordMoveDone(recorder, game)
+                if gameStats != None:
+                    TeacherStats.recordMoveDoneStats(gameStats, game, moveDone.value)
+                if replay != None:
+                    nextReplaySwapTime = time.time() + REPLAYMOVEDELAY / replaySpeed
+                    if nextReplaySwap == len(replay['swaps']):
+                        # The end of the log. Its final deduction is the
+                        # time the player took to give up (or click on).
+                        if replay['end'] != None:
+                            TeacherReplay.deductPoints(game, replay['end']['deducted'])
+                        gameIsOver = True
+                if isGameOver(game):
+                    gameIsOver = True
+                if gameIsOver:
+                    gameOverTime = time.time()
+                    if gameStats != None:
+                        TeacherStats.endGameStats(gameStats, game)
+        TeacherProfile.endSpan('logic')
 
         # Draw the board.
-        DISPLAYSURF.fill(BGCOLOR)
-        drawBoard(gameBoard)
+        overlays = []
+        if hintMove != None:
+            for x, y in hintMove:
+                overlays.append((HINTSURF, getSpaceRect(x, y)))
         if firstSelectedTEACHER != None:
-            highlightSpace(firstSelectedTEACHER['x'], firstSelectedTEACHER['y'])
+            overlays.append(getHighlightOverlay(firstSelectedTEACHER['x'], firstSelectedTEACHER['y']))
         if gameIsOver:
             if clickContinueTextSurf == None:
                 # Only render the text once. In future iterations, just
                 # use the Surface object already in clickContinueTextSurf
-                clickContinueTextSurf = BASICFONT.render('Final Score: %s (Click to continue)' % (score), 1, GAMEOVERCOLOR, GAMEOVERBGCOLOR)
+                TeacherProfile.startSpan('text')
+                clickContinueTextSurf = BASICFONT.render('Final Score: %s (Click to continue)' % (game['score']), 1, GAMEOVERCOLOR, GAMEOVERBGCOLOR)
+                TeacherProfile.endSpan('text')
                 clickContinueTextRect = clickContinueTextSurf.get_rect()
                 clickContinueTextRect.center = int(WINDOWWIDTH / 2), int(WINDOWHEIGHT / 2)
-            DISPLAYSURF.blit(clickContinueTextSurf, clickContinueTextRect)
-        elif score > 0 and time.time() - lastScoreDeduction > DEDUCTSPEED:
-            # score drops over time
-            score -= 1
+            overlays.append((clickContinueTextSurf, clickContinueTextRect))
+        elif replay == None and moveInProgress == None and game['score'] > 0 and time.time() - lastScoreDeduction > DEDUCTSPEED:
+            # score drops over time (replays take off what the log says)
+            game['score'] -= 1
             lastScoreDeduction = time.time()
-        drawScore(score)
-        pygame.display.update()
-        FPSCLOCK.tick(FPS)
-
-
-def getSwappingTEACHERs(board, firstXY, secondXY):
-    # If the TEACHERs at the (X, Y) coordinates of the two TEACHERs are adjacent,
-    # then their 'direction' keys are set to the appropriate direction
-    # value to be swapped with each other.
-    # Otherwise, (None, None) is returned.
-    firstTEACHER = {'imageNum': board[firstXY['x']][firstXY['y']],
-                'x': firstXY['x'],
-                'y': firstXY['y']}
-    secondTEACHER = {'imageNum': board[secondXY['x']][secondXY['y']],
-                 'x': secondXY['x'],
-                 'y': secondXY['y']}
-    highlightedTEACHER = None
-    if firstTEACHER['x'] == secondTEACHER['x'] + 1 and firstTEACHER['y'] == secondTEACHER['y']:
-        firstTEACHER['direction'] = LEFT
-        secondTEACHER['direction'] = RIGHT
-    elif firstTEACHER['x'] == secondTEACHER['x'] - 1 and firstTEACHER['y'] == secondTEACHER['y']:
-        firstTEACHER['direction'] = RIGHT
-        secondTEACHER['direction'] = LEFT
-    elif firstTEACHER['y'] == secondTEACHER['y'] + 1 and firstTEACHER['x'] == secondTEACHER['x']:
-        firstTEACHER['direction'] = UP
-        secondTEACHER['direction'] = DOWN
-    elif firstTEACHER['y'] == secondTEACHER['y'] - 1 and firstTEACHER['x'] == secondTEACHER['x']:
-        firstTEACHER['direction'] = DOWN
-        secondTEACHER['direction'] = UP
-    else:
-        # These TEACHERs are not adjacent and can't be swapped.
-        return None, None
-    return firstTEACHER, secondTEACHER
-
-
-def getBlankBoard():
-    # Create and return a blank board data structure.
-    board = []
-    for x in range(BOARDWIDTH):
-        board.append([EMPTY_SPACE] * BOARDHEIGHT)
-    return board
-
-
-def canMakeMove(board):
-    # Return True if the board is in a state where a matching
-    # move can be made on it. Otherwise return False.
-
-    # The patterns in oneOffPatterns represent TEACHERs that are configured
-    # in a way where it only takes one move to make a triplet.
-    oneOffPatterns = (((0,1), (1,0), (2,0)),
-                      ((0,1), (1,1), (2,0)),
-                      ((0,0), (1,1), (2,0)),
-                      ((0,1), (1,0), (2,1)),
-                      ((0,0), (1,0), (2,1)),
-                      ((0,0), (1,1), (2,1)),
-                      ((0,0), (0,2), (0,3)),
-                      ((0,0), (0,1), (0,3)))
-
-    # The x and y variables iterate over each space on the board.
-    # If we use + to represent the currently iterated space on the
-    # board, then this pattern: ((0,1), (1,0), (2,0))refers to identical
-    # TEACHERs being set up like this:
-    #
-    #     +A
-    #     B
-    #     C
-    #
-    # That is, TEACHER A is offset from the + by (0,1), TEACHER B is offset
-    # by (1,0), and TEACHER C is offset by (2,0). In this case, TEACHER A can
-    # be swapped to the left to form a vertical three-in-a-row triplet.
-    #
-    # There are eight possible ways for the TEACHERs to be one move
-    # away from forming a triple, hence oneOffPattern has 8 patterns.
-
-    for x in range(BOARDWIDTH):
-        for y in range(BOARDHEIGHT):
-            for pat in oneOffPatterns:
-                # check each possible pattern of "match in next move" to
-                # see if a possible move can be made.
-                if (getTEACHERAt(board, x+pat[0][0], y+pat[0][1]) == \
-                    getTEACHERAt(board, x+pat[1][0], y+pat[1][1]) == \
-                    getTEACHERAt(board, x+pat[2][0], y+pat[2][1]) != None) or \
-                   (getTEACHERAt(board, x+pat[0][1], y+pat[0][0]) == \
-                    getTEACHERAt(board, x+pat[1][1], y+pat[1][0]) == \
-                    getTEACHERAt(board, x+pat[2][1], y+pat[2][0]) != None):
-                    print(x,y,pat)
-                    return True # return True the first time you find a pattern
-    return False
-
-
-def drawMovingTEACHER(TEACHER, progress):
-    # Draw a TEACHER sliding in the direction that its 'direction' key
-    # indicates. The progress parameter is a number from 0 (just
-    # starting) to 100 (slide complete).
-    movex = 0
-    movey = 0
-    progress *= 0.01
-
-    if TEACHER['direction'] == UP:
-        movey = -int(progress * TEACHERIMAGESIZE)
-    elif TEACHER['direction'] == DOWN:
-        movey = int(progress * TEACHERIMAGESIZE)
-    elif TEACHER['direction'] == RIGHT:
-        movex = int(progress * TEACHERIMAGESIZE)
-    elif TEACHER['direction'] == LEFT:
-        movex = -int(progress * TEACHERIMAGESIZE)
-
-    basex = TEACHER['x']
-    basey = TEACHER['y']
-    if basey == ROWABOVEBOARD:
-        basey = -1
-
-    pixelx = XMARGIN + (basex * TEACHERIMAGESIZE)
-    pixely = YMARGIN + (basey * TEACHERIMAGESIZE)
-    r = pygame.Rect( (pixelx + movex, pixely + movey, TEACHERIMAGESIZE, TEACHERIMAGESIZE) )
-    DISPLAYSURF.blit(TEACHERIMAGES[TEACHER['imageNum']], r)
-
-
-def pullDownAllTEACHERs(board):
-    # pulls down TEACHERs on the board to the bottom to fill in any gaps
-    for x in range(BOARDWIDTH):
-        TEACHERsInColumn = []
-        for y in range(BOARDHEIGHT):
-            if board[x][y] != EMPTY_SPACE:
-                TEACHERsInColumn.append(board[x][y])
-        board[x] = ([EMPTY_SPACE] * (BOARDHEIGHT - len(TEACHERsInColumn))) + TEACHERsInColumn
-
-
-def getTEACHERAt(board, x, y):
-    if x < 0 or y < 0 or x >= BOARDWIDTH or y >= BOARDHEIGHT:
-        return None
-    else:
-        return board[x][y]
-
-
-def getDropSlots(board):
-    # Creates a "drop slot" for each column and fills the slot with a
-    # number of TEACHERs that that column is lacking. This function assumes
-    # that the TEACHERs have been gravity dropped already.
-    boardCopy = copy.deepcopy(board)
-    pullDownAllTEACHERs(boardCopy)
-
-    dropSlots = []
-    for i in range(BOARDWIDTH):
-        dropSlots.append([])
-
-    # count the number of empty spaces in each column on the board
-    for x in range(BOARDWIDTH):
-        for y in range(BOARDHEIGHT-1, -1, -1): # start from bottom, going up
-            if boardCopy[x][y] == EMPTY_SPACE:
-                possibleTEACHERs = list(range(len(TEACHERIMAGES)))
-                for offsetX, offsetY in ((0, -1), (1, 0), (0, 1), (-1, 0)):
-                    # Narrow down the possible TEACHERs we should put in the
-                    # blank space so we don't end up putting an two of
-                    # the same TEACHERs next to each other when they drop.
-                    neighborTEACHER = getTEACHERAt(boardCopy, x + offsetX, y + offsetY)
-                    if neighborTEACHER != None and neighborTEACHER in possibleTEACHERs:
-                        possibleTEACHERs.remove(neighborTEACHER)
-
-                newTEACHER = random.choice(possibleTEACHERs)
-                boardCopy[x][y] = newTEACHER
-                dropSlots[x].append(newTEACHER)
-    return dropSlots
-
-
-def findMatchingTEACHERs(board):
-    TEACHERsToRemove = [] # a list of lists of TEACHERs in matching triplets that should be removed
-    boardCopy = copy.deepcopy(board)
-
-    # loop through each space, checking for 3 adjacent identical TEACHERs
-    for x in range(BOARDWIDTH):
-        for y in range(BOARDHEIGHT):
-            # look for horizontal matches
-            if getTEACHERAt(boardCopy, x, y) == getTEACHERAt(boardCopy, x + 1, y) == getTEACHERAt(boardCopy, x + 2, y) and getTEACHERAt(boardCopy, x, y) != EMPTY_SPACE:
-                targetTEACHER = boardCopy[x][y]
-                offset = 0
-                removeSet = []
-                while getTEACHERAt(boardCopy, x + offset, y) == targetTEACHER:
-                    # keep checking if there's more than 3 TEACHERs in a row
-                    removeSet.append((x + offset, y))
-                    boardCopy[x + offset][y] = EMPTY_SPACE
-                    offset += 1
-                TEACHERsToRemove.append(removeSet)
-
-            # look for vertical matches
-            if getTEACHERAt(boardCopy, x, y) == getTEACHERAt(boardCopy, x, y + 1) == getTEACHERAt(boardCopy, x, y + 2) and getTEACHERAt(boardCopy, x, y) != EMPTY_SPACE:
-                targetTEACHER = boardCopy[x][y]
-                offset = 0
-                removeSet = []
-                while getTEACHERAt(boardCopy, x, y + offset) == targetTEACHER:
-                    # keep checking, in case there's more than 3 TEACHERs in a row
-                    removeSet.append((x, y + offset))
-                    boardCopy[x][y + offset] = EMPTY_SPACE
-                    offset += 1
-                TEACHERsToRemove.append(removeSet)
-
-    return TEACHERsToRemove
-
-
-def highlightSpace(x, y):
-    pygame.draw.rect(DISPLAYSURF, HIGHLIGHTCOLOR, BOARDRECTS[x][y], 4)
-
-
-def getDroppingTEACHERs(board):
-    # Find all the TEACHERs that have an empty space below them
-    boardCopy = copy.deepcopy(board)
-    droppingTEACHERs = []
-    for x in range(BOARDWIDTH):
-        for y in range(BOARDHEIGHT - 2, -1, -1):
-            if boardCopy[x][y + 1] == EMPTY_SPACE and boardCopy[x][y] != EMPTY_SPACE:
-                # This space drops if not empty but the space below it is
-                droppingTEACHERs.append( {'imageNum': boardCopy[x][y], 'x': x, 'y': y, 'direction': DOWN} )
-                boardCopy[x][y] = EMPTY_SPACE
-    return droppingTEACHERs
-
-
-def animateMovingTEACHERs(board, TEACHERs, pointsText, score):
-    # pointsText is a dictionary with keys 'x', 'y', and 'points'
-    progress = 0 # progress at 0 represents beginning, 100 means finished.
-    while progress < 100: # animation loop
-        DISPLAYSURF.fill(BGCOLOR)
-        drawBoard(board)
-        for TEACHER in TEACHERs: # Draw each TEACHER.
-            drawMovingTEACHER(TEACHER, progress)
-        drawScore(score)
+            if recorder != None:
+                TeacherReplay.recordDeduction(recorder)
+        overlays.append(getScoreOverlay(game['score']))
         for pointText in pointsText:
-            pointsSurf = BASICFONT.render(str(pointText['points']), 1, SCORECOLOR)
+            pointsSurf = renderText(str(pointText['points']), SCORECOLOR)
             pointsRect = pointsSurf.get_rect()
-            pointsRect.center = (pointText['x'], pointText['y'])
-            DISPLAYSURF.blit(pointsSurf, pointsRect)
+            pointsRect.center = getSpaceRect(pointText['x'], pointText['y']).topleft
+            overlays.append((pointsSurf, pointsRect))
+        if SHOWPROFILE:
+            overlays.append(getProfileOverlay())
+        drawFrame(game['board'], TeacherTween.getHiddenSpaces(animations), TeacherTween.getMovingTEACHERs(animations), overlays)
+
+        # Animations run on the real time between frames, not the frame
+        # count, so they take as long at any frame rate.
+        TeacherAudio.updateSounds(GAMESOUNDS)
+        TeacherProfile.startSpan('wait')
+        elapsed = FPSCLOCK.tick(FPS)
+        TeacherProfile.endSpan('wait')
+        TeacherTween.updateScheduler(animations, elapsed / 1000.0 * replaySpeed)
+        TeacherProfile.endFrame()
+
+
+def startMove(game, animations, pointsText, recorder, gameStats, firstXY, secondXY):
+    # Start swapping the TEACHERs at firstXY and secondXY (dicts with keys x
+    # and y), recording the swap if recorder and gameStats aren't None.
+    # Returns the animateMove() generator, or None if the TEACHERs aren't
+    # adjacent.
+    firstSwappingTEACHER, secondSwappingTEACHER = getSwappingTEACHERs(game['board'], firstXY, secondXY)
+    if firstSwappingTEACHER == None or secondSwappingTEACHER == None:
+        return None
+    if recorder != None:
+        TeacherReplay.recordSwap(recorder, firstXY, secondXY)
+    if gameStats != None:
+        TeacherStats.recordSwapStats(gameStats, game, firstXY, secondXY, AUTOPLAY)
+    return animateMove(game, animations, pointsText, firstSwappingTEACHER, secondSwappingTEACHER)
+
+
+def stopRecording(recorder, gameStats, game, moveInProgress):
+    # End the game's log and statistics. A move still being animated is
+    # finished first (without showing it), so neither ends on a board that's
+    # halfway through a cascade, with a score its moves don't add up to.
+    if moveInProgress != None:
+        cascadeSteps = finishMove(moveInProgress)
+        if recorder != None:
+            TeacherReplay.recordMoveDone(recorder, game)
+        if gameStats != None:
+            TeacherStats.recordMoveDoneStats(gameStats, game, cascadeSteps)
+    if recorder != None:
+        TeacherReplay.closeRecorder(recorder, game)
+    if gameStats != None:
+        TeacherStats.endGameStats(gameStats, game)
+
+
+def finishMove(moveInProgress):
+    # Run the rest of the moveInProgress generator at once, and return what
+    # it returns. The animations it starts are never shown.
+    while True:
+        try:
+            next(moveInProgress)
+        except StopIteration as moveDone:
+            return moveDone.value
+
+
+def dropInitialTEACHERs(game, animations):
+    # Show the TEACHERs of a new board falling in from above it. Only the
+    # ones in view are animated (a big board would take thousands of tweens).
+    board = game['board']
+    firstX, lastX, firstY, lastY = getVisibleSpaces()
+    for x in range(firstX, lastX + 1):
+        for y in range(firstY, lastY + 1):
+            addFallTween(animations, board[x][y], x, y - (lastY - firstY + 1), y)
+    yield
+
+
+def animateMove(game, animations, pointsText, firstSwappingTEACHER, secondSwappingTEACHER):
+    # Plays out a swap and the cascades that follow it, yielding after
+    # starting each step's animations. Updates the game's board, score and
+    # valid moves the same way the engine's playMove() does, and returns
+    # the same thing (the cascade steps, or None for a bad swap).
+    board = game['board']
+
+    # Swap the TEACHERs in the board data structure, and show them sliding
+    # into their new places.
+    setTEACHER(board, firstSwappingTEACHER.x, firstSwappingTEACHER.y, secondSwappingTEACHER.imageNum, game['hash'])
+    setTEACHER(board, secondSwappingTEACHER.x, secondSwappingTEACHER.y, firstSwappingTEACHER.imageNum, game['hash'])
+    addSwapTweens(animations, firstSwappingTEACHER, secondSwappingTEACHER)
+    yield
+
+    # See if this is a matching move. Only the two swapped
+    # TEACHERs can have made a new match.
+    changedSpaces = [(firstSwappingTEACHER.x, firstSwappingTEACHER.y),
+                     (secondSwappingTEACHER.x, secondSwappingTEACHER.y)]
+    matchedTEACHERs = getMatchesForGame(game, changedSpaces)
+    if matchedTEACHERs == []:
+        # Was not a matching move; swap the TEACHERs back
+        TeacherAudio.playSound(GAMESOUNDS, 'bad swap')
+        setTEACHER(board, firstSwappingTEACHER.x, firstSwappingTEACHER.y, firstSwappingTEACHER.imageNum, game['hash'])
+        setTEACHER(board, secondSwappingTEACHER.x, secondSwappingTEACHER.y, secondSwappingTEACHER.imageNum, game['hash'])
+        addSwapTweens(animations, secondSwappingTEACHER, firstSwappingTEACHER)
+        yield
+        return
+
+    # This was a matching move. The engine resolves it step by step, and
+    # each step is shown as it comes: the points for each matched set, then
+    # every TEACHER of the cascade falling at once.
+    game['moves'] += 1
+    for event in iterCascades(game, changedSpaces):
+        if event['type'] == 'match':
+            # pointsText is a list of dicts that tells the main loop where on
+            # the board to display text to show how many points the player
+            # got, one for each matched set.
+            pointsText[:] = []
+            for i in range(len(event['matchedTEACHERs'])):
+                x, y = event['matchedTEACHERs'][i][-1]
+                pointsText.append({'points': event['points'][i], 'x': x, 'y': y})
+            TeacherAudio.playSound(GAMESOUNDS, 'match')
+        elif event['type'] == 'gravity':
+            for TEACHER in event['fallingTEACHERs']:
+                addFallTween(animations, TEACHER.imageNum, TEACHER.x, TEACHER.y, TEACHER.y + TEACHER.distance)
+        elif event['type'] == 'refill':
+            for TEACHER in event['newTEACHERs']:
+                addFallTween(animations, TEACHER.imageNum, TEACHER.x, TEACHER.y, TEACHER.y + TEACHER.distance)
+            yield
+            pointsText[:] = []
+        elif event['type'] == 'done':
+            return event['cascadeSteps']
+
+
+def addSwapTweens(animations, firstTEACHER, secondTEACHER):
+    # Slide each TEACHER (MovingTEACHERs from getSwappingTEACHERs()) into the other's space.
+    firstXY = (firstTEACHER.x, firstTEACHER.y)
+    secondXY = (secondTEACHER.x, secondTEACHER.y)
+    TeacherTween.addTween(animations, firstTEACHER.imageNum, firstXY, secondXY, MOVETIME)
+    TeacherTween.addTween(animations, secondTEACHER.imageNum, secondXY, firstXY, MOVETIME)
+
+
+def addFallTween(animations, imageNum, x, fromY, toY):
+    TeacherTween.addTween(animations, imageNum, (x, fromY), (x, toY), (toY - fromY) * MOVETIME)
+
+
+def setView(boardWidth, boardHeight, spaceSize):
+    # Show a boardWidth x boardHeight board, centered, with spaces of
+    # spaceSize pixels.
+    VIEW['boardWidth'] = boardWidth
+    VIEW['boardHeight'] = boardHeight
+    VIEW['left'] = (WINDOWWIDTH - boardWidth * spaceSize) // 2
+    VIEW['top'] = (WINDOWHEIGHT - boardHeight * spaceSize) // 2
+    VIEW['spaceSize'] = spaceSize
+    setSpaceSize(spaceSize, (WINDOWWIDTH // 2, WINDOWHEIGHT // 2))
+
+
+def setSpaceSize(spaceSize, fixedPos):
+    # Zoom the view so spaces are spaceSize pixels, keeping the point of the
+    # board at the fixedPos pixel where it is. The TEACHER images are loaded
+    # again at the new size, rather than being scaled each time they're drawn.
+    global TEACHERIMAGES, HIGHLIGHTSURF, HINTSURF
+    oldSize = VIEW['spaceSize']
+    VIEW['left'] = fixedPos[0] - (fixedPos[0] - VIEW['left']) * spaceSize // oldSize
+    VIEW['top'] = fixedPos[1] - (fixedPos[1] - VIEW['top']) * spaceSize // oldSize
+    VIEW['spaceSize'] = spaceSize
+
+    # Load the images (scaled, converted and packed into one atlas).
+    TEACHERIMAGES = TeacherAssets.loadTEACHERImages(NUMTEACHERIMAGES, spaceSize)
+
+    # The border drawn around the selected TEACHER.
+    HIGHLIGHTSURF = pygame.Surface((spaceSize, spaceSize), SRCALPHA)
+    pygame.draw.rect(HIGHLIGHTSURF, HIGHLIGHTCOLOR, HIGHLIGHTSURF.get_rect(), 4)
+    HINTSURF = pygame.Surface((spaceSize, spaceSize), SRCALPHA)
+    pygame.draw.rect(HINTSURF, HINTCOLOR, HINTSURF.get_rect(), 4)
+
+    scrollView(0, 0)
+
+
+def scrollView(dx, dy):
+    # Move the view dx, dy pixels across the board. A board smaller than the
+    # window stays centered, and a bigger one can't be scrolled off it.
+    VIEW['left'] -= dx
+    VIEW['top'] -= dy
+    for side, windowSize, numSpaces in (('left', WINDOWWIDTH, VIEW['boardWidth']), ('top', WINDOWHEIGHT, VIEW['boardHeight'])):
+        boardSize = numSpaces * VIEW['spaceSize']
+        if boardSize <= windowSize:
+            VIEW[side] = (windowSize - boardSize) // 2
+        else:
+            VIEW[side] = min(0, max(windowSize - boardSize, VIEW[side]))
+    drawBackground()
 
-        pygame.display.update()
-        FPSCLOCK.tick(FPS)
-        progress += MOVERATE # progress the animation a little bit more for the next frame
 
+def zoomView(steps, fixedPos):
+    # Zoom in (steps > 0) or out through ZOOMSIZES.
+    zoomIndex = 0
+    for i in range(len(ZOOMSIZES)):
+        if abs(ZOOMSIZES[i] - VIEW['spaceSize']) < abs(ZOOMSIZES[zoomIndex] - VIEW['spaceSize']):
+            zoomIndex = i
+    zoomIndex = min(max(zoomIndex + steps, 0), len(ZOOMSIZES) - 1)
+    if ZOOMSIZES[zoomIndex] != VIEW['spaceSize']:
+        setSpaceSize(ZOOMSIZES[zoomIndex], fixedPos)
 
-def moveTEACHERs(board, movingTEACHERs):
-    # movingTEACHERs is a list of dicts with keys x, y, direction, imageNum
-    for TEACHER in movingTEACHERs:
-        if TEACHER['y'] != ROWABOVEBOARD:
-            board[TEACHER['x']][TEACHER['y']] = EMPTY_SPACE
-            movex = 0
-            movey = 0
-            if TEACHER['direction'] == LEFT:
-                movex = -1
-            elif TEACHER['direction'] == RIGHT:
-                movex = 1
-            elif TEACHER['direction'] == DOWN:
-                movey = 1
-            elif TEACHER['direction'] == UP:
-                movey = -1
-            board[TEACHER['x'] + movex][TEACHER['y'] + movey] = TEACHER['imageNum']
-        else:
-            # TEACHER is located above the board (where new TEACHERs come from)
-            board[TEACHER['x']][0] = TEACHER['imageNum'] # move to top row
 
+def getSpaceRect(x, y):
+    # The rect of board space (x, y) on the screen (it may be off the window).
+    spaceSize = VIEW['spaceSize']
+    return pygame.Rect(VIEW['left'] + x * spaceSize, VIEW['top'] + y * spaceSize, spaceSize, spaceSize)
 
-def fillBoardAndAnimate(board, points, score):
-    dropSlots = getDropSlots(board)
-    while dropSlots != [[]] * BOARDWIDTH:
-        # do the dropping animation as long as there are more TEACHERs to drop
-        movingTEACHERs = getDroppingTEACHERs(board)
-        for x in range(len(dropSlots)):
-            if len(dropSlots[x]) != 0:
-                # cause the lowest TEACHER in each slot to begin moving in the DOWN direction
-                movingTEACHERs.append({'imageNum': dropSlots[x][0], 'x': x, 'y': ROWABOVEBOARD, 'direction': DOWN})
 
-        boardCopy = getBoardCopyMinusTEACHERs(board, movingTEACHERs)
-        animateMovingTEACHERs(boardCopy, movingTEACHERs, points, score)
-        moveTEACHERs(board, movingTEACHERs)
+def getVisibleSpaces():
+    # Returns (firstX, lastX, firstY, lastY), the range of board spaces that
+    # are at least partly in the window.
+    spaceSize = VIEW['spaceSize']
+    firstX = max(0, -VIEW['left'] // spaceSize)
+    lastX = min(VIEW['boardWidth'] - 1, (WINDOWWIDTH - 1 - VIEW['left']) // spaceSize)
+    firstY = max(0, -VIEW['top'] // spaceSize)
+    lastY = min(VIEW['boardHeight'] - 1, (WINDOWHEIGHT - 1 - VIEW['top']) // spaceSize)
+    return firstX, lastX, firstY, lastY
 
-        # Make the next row of TEACHERs from the drop slots
-        # the lowest by deleting the previous lowest TEACHERs.
-        for x in range(len(dropSlots)):
-            if len(dropSlots[x]) == 0:
-                continue
-            board[x][0] = dropSlots[x][0]
-            del dropSlots[x][0]
 
+def drawBackground():
+    # Draw the background and the grid of the spaces in view on BOARDBACKGROUND.
+    BOARDBACKGROUND.fill(BGCOLOR)
+    firstX, lastX, firstY, lastY = getVisibleSpaces()
+    for x in range(firstX, lastX + 1):
+        for y in range(firstY, lastY + 1):
+            pygame.draw.rect(BOARDBACKGROUND, GRIDCOLOR, getSpaceRect(x, y), 1)
 
-def checkForTEACHERClick(pos):
-    # See if the mouse click was on the board
-    for x in range(BOARDWIDTH):
-        for y in range(BOARDHEIGHT):
-            if BOARDRECTS[x][y].collidepoint(pos[0], pos[1]):
-                return {'x': x, 'y': y}
-    return None # Click was not on the board.
 
+def getMovingTEACHERRect(TEACHER):
+    # Returns the rect of a moving TEACHER, an (imageNum, x, y) tuple where
+    # x and y are fractional board coordinates.
+    imageNum, x, y = TEACHER
+    spaceSize = VIEW['spaceSize']
+    pixelx = VIEW['left'] + int(x * spaceSize)
+    pixely = VIEW['top'] + int(y * spaceSize)
+    return pygame.Rect( (pixelx, pixely, spaceSize, spaceSize) )
 
-def drawBoard(board):
-    for x in range(BOARDWIDTH):
-        for y in range(BOARDHEIGHT):
-            pygame.draw.rect(DISPLAYSURF, GRIDCOLOR, BOARDRECTS[x][y], 1)
-            TEACHERToDraw = board[x][y]
-            if TEACHERToDraw != EMPTY_SPACE:
-                DISPLAYSURF.blit(TEACHERIMAGES[TEACHERToDraw], BOARDRECTS[x][y])
 
+def getHighlightOverlay(x, y):
+    return (HIGHLIGHTSURF, getSpaceRect(x, y))
 
-def getBoardCopyMinusTEACHERs(board, TEACHERs):
-    # Creates and returns a copy of the passed board data structure,
-    # with the TEACHERs in the "TEACHERs" list removed from it.
-    #
-    # TEACHERs is a list of dicts, with keys x, y, direction, imageNum
 
-    boardCopy = copy.deepcopy(board)
+def checkForTEACHERClick(pos):
+    # See if the mouse click was on the board
+    spaceSize = VIEW['spaceSize']
+    x = (pos[0] - VIEW['left']) // spaceSize
+    y = (pos[1] - VIEW['top']) // spaceSize
+    if 0 <= x < VIEW['boardWidth'] and 0 <= y < VIEW['boardHeight']:
+        return {'x': x, 'y': y}
+    return None # Click was not on the board.
 
-    # Remove some of the TEACHERs from this board data structure copy.
-    for TEACHER in TEACHERs:
-        if TEACHER['y'] != ROWABOVEBOARD:
-            boardCopy[TEACHER['x']][TEACHER['y']] = EMPTY_SPACE
-    return boardCopy
 
+def drawBoard(board, hiddenSpaces):
+    # Draws the TEACHERs in view (the grid is part of BOARDBACKGROUND).
+    firstX, lastX, firstY, lastY = getVisibleSpaces()
+    for x in range(firstX, lastX + 1):
+        for y in range(firstY, lastY + 1):
+            TEACHERToDraw = board[x][y]
+            if TEACHERToDraw != EMPTY_SPACE and (x, y) not in hiddenSpaces:
+                DISPLAYSURF.blit(TEACHERIMAGES[TEACHERToDraw], getSpaceRect(x, y))
 
-def drawScore(score):
-    scoreImg = BASICFONT.render(str(score), 1, SCORECOLOR)
+
+def getScoreOverlay(score):
+    scoreImg = renderText(str(score), SCORECOLOR)
     scoreRect = scoreImg.get_rect()
     scoreRect.bottomleft = (10, WINDOWHEIGHT - 6)
-    DISPLAYSURF.blit(scoreImg, scoreRect)
+    return (scoreImg, scoreRect)
+
+
+# Rendering text is slow, and the same few strings (the score, the points
+# of a match) are drawn over and over, so renderText() keeps the most
+# recently used surfaces. TEXTCACHESTATS counts how often that helped.
+TEXTCACHE = collections.OrderedDict()
+TEXTCACHESTATS = {'hits': 0, 'misses': 0}
+
+def renderText(text, color, bgcolor=None):
+    # Same as BASICFONT.render(text, 1, color, bgcolor), but cached.
+    key = (text, color, bgcolor)
+    textSurf = TEXTCACHE.get(key)
+    if textSurf != None:
+        TEXTCACHESTATS['hits'] += 1
+        TEXTCACHE.move_to_end(key)
+        return textSurf
+
+    TEXTCACHESTATS['misses'] += 1
+    TeacherProfile.startSpan('text')
+    textSurf = BASICFONT.render(text, 1, color, bgcolor)
+    TeacherProfile.endSpan('text')
+    TEXTCACHE[key] = textSurf
+    if len(TEXTCACHE) > TEXTCACHESIZE:
+        TEXTCACHE.popitem(last=False) # forget the least recently used text
+    return textSurf
+
+
+def getTextCacheStatsLine():
+    # How well renderText()'s cache is doing, for the frame timing overlay.
+    lookups = TEXTCACHESTATS['hits'] + TEXTCACHESTATS['misses']
+    hitRate = 100.0 * TEXTCACHESTATS['hits'] / lookups if lookups > 0 else 0.0
+    return 'text cache: %.0f%% hits (%s hits, %s misses)' % (hitRate, TEXTCACHESTATS['hits'], TEXTCACHESTATS['misses'])
+
+
+# The frame timing overlay. Its numbers only change every
+# PROFILEUPDATETIME seconds, so it can be read (and isn't rendered again,
+# or redrawn, every frame).
+PROFILEOVERLAY = {'overlay': None, 'time': 0}
+
+def getProfileOverlay():
+    # Returns a (surface, rect) overlay with the frame rate, frame times and
+    # the time of each phase, from TeacherProfile.getStats(), and the text
+    # cache's hit rate.
+    if PROFILEOVERLAY['overlay'] != None and time.time() - PROFILEOVERLAY['time'] < PROFILEUPDATETIME:
+        return PROFILEOVERLAY['overlay']
+    TeacherProfile.startSpan('text')
+    lines = TeacherProfile.getStatsLines() + [getTextCacheStatsLine()]
+    lineSurfs = [PROFILEFONT.render(line, 1, PROFILECOLOR, PROFILEBGCOLOR) for line in lines]
+    TeacherProfile.endSpan('text')
+    profileSurf = pygame.Surface((max([lineSurf.get_width() for lineSurf in lineSurfs]) + 8,
+                                  sum([lineSurf.get_height() for lineSurf in lineSurfs]) + 8))
+    profileSurf.fill(PROFILEBGCOLOR)
+    top = 4
+    for lineSurf in lineSurfs:
+        profileSurf.blit(lineSurf, (4, top))
+        top += lineSurf.get_height()
+    profileRect = profileSurf.get_rect()
+    profileRect.topleft = (10, 10)
+    PROFILEOVERLAY['overlay'] = (profileSurf, profileRect)
+    PROFILEOVERLAY['time'] = time.time()
+    return PROFILEOVERLAY['overlay']
+
+
+# What drawFrame() drew last time, so that in dirty rect mode it knows
+# which parts of the window have to be redrawn.
+LASTFRAME = {'board': None, 'view': None, 'movingRects': [], 'overlays': []}
+
+def drawFrame(board, hiddenSpaces, movingTEACHERs, overlays):
+    # Draws the board spaces in view (leaving out the spaces in hiddenSpaces),
+    # the moving TEACHERs (see getMovingTEACHERRect()) and then the overlays,
+    # a list of (surface, rect) tuples for text and the highlight, and
+    # updates the display. Only what is in the window is looked at, so the
+    # time this takes doesn't depend on the size of the board.
+    windowRect = DISPLAYSURF.get_rect()
+    movingRects = []
+    movingImages = []
+    for TEACHER in movingTEACHERs:
+        movingRect = getMovingTEACHERRect(TEACHER)
+        if movingRect.colliderect(windowRect):
+            movingRects.append(movingRect)
+            movingImages.append(TEACHERIMAGES[TEACHER[0]])
+
+    if not DIRTYRECTRENDERING:
+        TeacherProfile.startSpan('drawBoard')
+        DISPLAYSURF.blit(BOARDBACKGROUND, (0, 0))
+        drawBoard(board, hiddenSpaces)
+        for i in range(len(movingRects)):
+            DISPLAYSURF.blit(movingImages[i], movingRects[i])
+        for overlaySurf, overlayRect in overlays:
+            DISPLAYSURF.blit(overlaySurf, overlayRect)
+        TeacherProfile.endSpan('drawBoard')
+        TeacherProfile.startSpan('display.update')
+        pygame.display.update()
+        TeacherProfile.endSpan('display.update')
+        return
+
+    # Work out which parts of the window are different from the last frame:
+    # board spaces that changed, where the moving TEACHERs were and are now,
+    # and where overlays that changed were and are now. shownBoard is what
+    # is on screen: the spaces in view, with the hidden spaces masked out.
+    # It's kept from frame to frame and only the spaces that changed are
+    # written, so no board gets copied each frame.
+    TeacherProfile.startSpan('drawBoard')
+    firstX, lastX, firstY, lastY = getVisibleSpaces()
+    view = (firstX, firstY, VIEW['left'], VIEW['top'], VIEW['spaceSize'])
+    shownBoard = LASTFRAME['board']
+    if shownBoard == None or LASTFRAME['view'] != view:
+        # first frame, or the view moved, draw everything
+        dirtyRects = [windowRect]
+        shownBoard = [[EMPTY_SPACE] * (lastY - firstY + 1) for x in range(firstX, lastX + 1)]
+        LASTFRAME['board'] = shownBoard
+        LASTFRAME['view'] = view
+    else:
+        dirtyRects = []
+    for x in range(firstX, lastX + 1):
+        column = board[x]
+        shownColumn = shownBoard[x - firstX]
+        for y in range(firstY, lastY + 1):
+            if column[y] == EMPTY_SPACE or (hiddenSpaces and (x, y) in hiddenSpaces):
+                TEACHERShown = EMPTY_SPACE
+            else:
+                TEACHERShown = column[y]
+            if shownColumn[y - firstY] != TEACHERShown:
+                shownColumn[y - firstY] = TEACHERShown
+                dirtyRects.append(getSpaceRect(x, y))
+    dirtyRects.extend(LASTFRAME['movingRects'])
+    dirtyRects.extend(movingRects)
+    if overlays != LASTFRAME['overlays']:
+        for overlaySurf, overlayRect in LASTFRAME['overlays']:
+            if (overlaySurf, overlayRect) not in overlays:
+                dirtyRects.append(overlayRect)
+        for overlaySurf, overlayRect in overlays:
+            if (overlaySurf, overlayRect) not in LASTFRAME['overlays']:
+                dirtyRects.append(overlayRect)
+
+    # Any overlay touching a redrawn area has to be drawn again on top.
+    overlaysToDraw = []
+    for overlaySurf, overlayRect in overlays:
+        if overlayRect.collidelist(dirtyRects) != -1:
+            overlaysToDraw.append((overlaySurf, overlayRect))
+            dirtyRects.append(overlayRect)
+
+    spaceSize = VIEW['spaceSize']
+    for dirtyRect in dirtyRects:
+        # Erase the area with the background, then redraw the board spaces
+        # under it (clipped, so the rest of each space is left alone).
+        DISPLAYSURF.set_clip(dirtyRect)
+        DISPLAYSURF.blit(BOARDBACKGROUND, dirtyRect, dirtyRect)
+        left = max(firstX, (dirtyRect.left - VIEW['left']) // spaceSize)
+        right = min(lastX, (dirtyRect.right - 1 - VIEW['left']) // spaceSize)
+        top = max(firstY, (dirtyRect.top - VIEW['top']) // spaceSize)
+        bottom = min(lastY, (dirtyRect.bottom - 1 - VIEW['top']) // spaceSize)
+        for x in range(left, right + 1):
+            for y in range(top, bottom + 1):
+                TEACHERShown = shownBoard[x - firstX][y - firstY]
+                if TEACHERShown != EMPTY_SPACE:
+                    DISPLAYSURF.blit(TEACHERIMAGES[TEACHERShown], getSpaceRect(x, y))
+    DISPLAYSURF.set_clip(None)
+
+    for i in range(len(movingRects)):
+        DISPLAYSURF.blit(movingImages[i], movingRects[i])
+    for overlaySurf, overlayRect in overlaysToDraw:
+        DISPLAYSURF.blit(overlaySurf, overlayRect)
+    TeacherProfile.endSpan('drawBoard')
+    TeacherProfile.startSpan('display.update')
+    pygame.display.update(dirtyRects)
+    TeacherProfile.endSpan('display.update')
+
+    LASTFRAME['movingRects'] = movingRects
+    LASTFRAME['overlays'] = list(overlays)
 
 
 if __name__ == '__main__':
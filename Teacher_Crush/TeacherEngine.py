@@ -0,0 +1,1080 @@
+# The board logic for Teacher Crush. Nothing in here imports pygame, so the
+# same functions that run the game can also be used to simulate games
+# headlessly (for balancing, bots, and so on).
+#
+# A board is a list of columns: board[x][y] is the TEACHER number at column
+# x, row y (row 0 is the top). Functions that need the board size read it
+# from the board itself, so boards of any size work.
+#
+# This is plain Python, and one process plays about 9,000-10,000 random
+# moves a second on the default 6x6 board (dealing the games included),
+# far from hundreds of thousands. For bulk runs use TeacherSim.py, which
+# spreads games over a pool of processes, one per core; its throughput
+# grows with the number of cores, not the speed of one game.
+
+import random, collections, threading, itertools
+
+BOARDWIDTH = 6 # how many columns in the board
+BOARDHEIGHT = 6 # how many rows in the board
+
+# NUMTEACHERIMAGES is the number of TEACHER types. You will need .png image
+# files named TEACHER0.png, TEACHER1.png, etc. up to TEACHER(N-1).png.
+NUMTEACHERIMAGES = 7
+assert NUMTEACHERIMAGES >= 5 # game needs at least 5 types of TEACHERs to work
+
+DEDUCTSPEED = 0.8 # reduces score by 1 point every DEDUCTSPEED seconds.
+
+# constants for direction values
+UP = 'up'
+DOWN = 'down'
+LEFT = 'left'
+RIGHT = 'right'
+
+EMPTY_SPACE = -1 # an arbitrary, nonpositive value
+ROWABOVEBOARD = 'row above board' # an arbitrary, noninteger value
+
+# When True, getBlankBoard() makes int8 NumPy arrays instead of lists, and
+# the matching, valid move and refill functions use the vectorized versions
+# in TeacherArray.py (which work on a box of the board around what changed
+# at once). Needs NumPy. The arrays only pay off on big boards: a move is
+# slower than on a list board at 16x16 (2.5x), about even at 64x64 and
+# 128x128, and faster on bigger ones (1.4x at 256x256); run TeacherArray.py
+# for the numbers. The refills are picked differently (see refillArray()),
+# so a seed doesn't deal the same game on both kinds of board.
+USENUMPYBOARD = False
+
+# When True, every findMatchingTEACHERsNear() and updateValidMoves() call
+# also does the equivalent full scan of the board and fails if the results
+# differ. Slow; for debugging only.
+CHECKINCREMENTALMATCHES = False
+
+# Boards are hashed with Zobrist hashing: every TEACHER (or EMPTY_SPACE) in
+# every space has its own random 64 bit key, and a board's hash is the XOR
+# of the keys for what is in each of its spaces. Changing a space only takes
+# two XORs to keep the hash up to date, so a game keeps its board's hash in
+# game['hash'] (see newBoardHash()) and the functions that change the board
+# take it and update it as they go.
+ZOBRISTSEED = 20170325 # the keys are the same in every run and process
+ZOBRISTKEYS = {} # keys[x][y][TEACHER + 1], by (width, height, numTEACHERTypes)
+
+# The matches and valid moves of the boards a game goes through are
+# remembered by hash, in least recently used caches of MEMOSIZE boards, so
+# positions that come up again (which they do a lot in simulations and the
+# move search) aren't worked out again. MEMOSTATS counts how that's going.
+USEMEMO = True
+MEMOSIZE = 20000
+MEMOS = {'matches': collections.OrderedDict(), 'validMoves': collections.OrderedDict()}
+MEMOSTATS = {'matches': {'hits': 0, 'misses': 0, 'evictions': 0},
+             'validMoves': {'hits': 0, 'misses': 0, 'evictions': 0}}
+MEMOLOCK = threading.Lock() # the move search uses the memos from its own thread
+
+# Boards of up to SWAPTABLESPACES spaces (the default one, and anything a
+# full scan of isn't much slower than working out what to recheck) look up
+# their valid moves in a table made once for each board size: which pairs of
+# spaces make a match with each swapped TEACHER, and which swaps look at each
+# space. See getSwapTable().
+SWAPTABLESPACES = 1024
+SWAPTABLES = {} # by (width, height)
+
+# The TEACHERs pullDownAndRefill() can pick from for a space, by the number
+# of TEACHER types and the TEACHERs next to the space.
+DROPCHOICES = {}
+
+
+class MovingTEACHER(object):
+    # A TEACHER that is about to move: it is at (x, y) and moves distance
+    # spaces in direction. Lots of these are made during cascades, so
+    # __slots__ keeps them small (and quick to make and throw away).
+    __slots__ = ('imageNum', 'x', 'y', 'direction', 'distance')
+
+    def __init__(self, imageNum, x, y, direction=None, distance=1):
+        self.imageNum = imageNum
+        self.x = x
+        self.y = y
+        self.direction = direction
+        self.distance = distance
+
+    def __repr__(self):
+        return 'MovingTEACHER(%r, %r, %r, %r, %r)' % (self.imageNum, self.x, self.y, self.direction, self.distance)
+
+
+def getZobristKeys(width, height, numTEACHERTypes):
+    # Returns the Zobrist keys for boards of this size, making them the
+    # first time they're needed.
+    keysKey = (width, height, numTEACHERTypes)
+    if keysKey not in ZOBRISTKEYS:
+        rng = random.Random('%s-%s-%s-%s' % (ZOBRISTSEED, width, height, numTEACHERTypes))
+        keys = []
+        for x in range(width):
+            keys.append([])
+            for y in range(height):
+                keys[x].append([rng.getrandbits(64) for i in range(numTEACHERTypes + 1)])
+        ZOBRISTKEYS[keysKey] = keys
+    return ZOBRISTKEYS[keysKey]
+
+
+def newBoardHash(board, numTEACHERTypes=NUMTEACHERIMAGES):
+    # Hash the whole board. Returns a dict with the hash in 'value' and the
+    # keys used to update it in 'keys'; pass it to setTEACHER() and the
+    # other functions that change the board to keep 'value' up to date.
+    keys = getZobristKeys(len(board), len(board[0]), numTEACHERTypes)
+    value = 0
+    for x in range(len(board)):
+        for y in range(len(board[x])):
+            value ^= keys[x][y][board[x][y] + 1]
+    return {'value': value, 'keys': keys}
+
+
+def setTEACHER(board, x, y, TEACHER, boardHash=None):
+    # Put TEACHER in space (x, y), updating boardHash (from newBoardHash())
+    # if there is one.
+    if boardHash != None:
+        spaceKeys = boardHash['keys'][x][y]
+        boardHash['value'] ^= spaceKeys[board[x][y] + 1] ^ spaceKeys[TEACHER + 1]
+    board[x][y] = TEACHER
+
+
+def getMemo(name, boardHash):
+    # Returns what the named memo has for the board with this hash (a dict
+    # from newBoardHash()), or None. Don't modify what it returns.
+    if not USEMEMO:
+        return None
+    memo = MEMOS[name]
+    with MEMOLOCK:
+        value = memo.get(boardHash['value'])
+        if value == None:
+            MEMOSTATS[name]['misses'] += 1
+        else:
+            MEMOSTATS[name]['hits'] += 1
+            memo.move_to_end(boardHash['value'])
+    return value
+
+
+def putMemo(name, boardHash, value):
+    if not USEMEMO:
+        return
+    memo = MEMOS[name]
+    with MEMOLOCK:
+        memo[boardHash['value']] = value
+        if len(memo) > MEMOSIZE:
+            memo.popitem(last=False) # forget the least recently used board
+            MEMOSTATS[name]['evictions'] += 1
+
+
+def clearMemos():
+    with MEMOLOCK:
+        for name in MEMOS:
+            MEMOS[name].clear()
+            for stat in MEMOSTATS[name]:
+                MEMOSTATS[name][stat] = 0
+
+
+def getSwappingTEACHERs(board, firstXY, secondXY):
+    # If the TEACHERs at the (X, Y) coordinates of the two TEACHERs are adjacent,
+    # then their directions are set to the appropriate direction
+    # value to be swapped with each other.
+    # Otherwise, (None, None) is returned.
+    firstTEACHER = MovingTEACHER(board[firstXY['x']][firstXY['y']], firstXY['x'], firstXY['y'])
+    secondTEACHER = MovingTEACHER(board[secondXY['x']][secondXY['y']], secondXY['x'], secondXY['y'])
+    if firstTEACHER.x == secondTEACHER.x + 1 and firstTEACHER.y == secondTEACHER.y:
+        firstTEACHER.direction = LEFT
+        secondTEACHER.direction = RIGHT
+    elif firstTEACHER.x == secondTEACHER.x - 1 and firstTEACHER.y == secondTEACHER.y:
+        firstTEACHER.direction = RIGHT
+        secondTEACHER.direction = LEFT
+    elif firstTEACHER.y == secondTEACHER.y + 1 and firstTEACHER.x == secondTEACHER.x:
+        firstTEACHER.direction = UP
+        secondTEACHER.direction = DOWN
+    elif firstTEACHER.y == secondTEACHER.y - 1 and firstTEACHER.x == secondTEACHER.x:
+        firstTEACHER.direction = DOWN
+        secondTEACHER.direction = UP
+    else:
+        # These TEACHERs are not adjacent and can't be swapped.
+        return None, None
+    return firstTEACHER, secondTEACHER
+
+
+def getBlankBoard(width=BOARDWIDTH, height=BOARDHEIGHT, numpyBoard=None):
+    # Create and return a blank board data structure: a NumPy board if
+    # numpyBoard is True, a list board if it's False, and whichever
+    # USENUMPYBOARD says if it's None.
+    if numpyBoard == None:
+        numpyBoard = USENUMPYBOARD
+    if numpyBoard:
+        import TeacherArray
+        return TeacherArray.getBlankBoardArray(width, height)
+    board = []
+    for x in range(width):
+        board.append([EMPTY_SPACE] * height)
+    return board
+
+
+def copyBoard(board):
+    # The columns are lists of ints, so copying each one is all that's
+    # needed (and much faster than copy.deepcopy()).
+    if not isinstance(board, list):
+        return board.copy() # NumPy board
+    return [list(column) for column in board]
+
+
+def canMakeMove(board):
+    # Return True if the board is in a state where a matching
+    # move can be made on it. Otherwise return False.
+
+    # The patterns in oneOffPatterns represent TEACHERs that are configured
+    # in a way where it only takes one move to make a triplet.
+    oneOffPatterns = (((0,1), (1,0), (2,0)),
+                      ((0,1), (1,1), (2,0)),
+                      ((0,0), (1,1), (2,0)),
+                      ((0,1), (1,0), (2,1)),
+                      ((0,0), (1,0), (2,1)),
+                      ((0,0), (1,1), (2,1)),
+                      ((0,0), (0,2), (0,3)),
+                      ((0,0), (0,1), (0,3)))
+
+    # The x and y variables iterate over each space on the board.
+    # If we use + to represent the currently iterated space on the
+    # board, then this pattern: ((0,1), (1,0), (2,0))refers to identical
+    # TEACHERs being set up like this:
+    #
+    #     +A
+    #     B
+    #     C
+    #
+    # That is, TEACHER A is offset from the + by (0,1), TEACHER B is offset
+    # by (1,0), and TEACHER C is offset by (2,0). In this case, TEACHER A can
+    # be swapped to the left to form a vertical three-in-a-row triplet.
+    #
+    # There are eight possible ways for the TEACHERs to be one move
+    # away from forming a triple, hence oneOffPattern has 8 patterns.
+
+    for x in range(len(board)):
+        for y in range(len(board[x])):
+            for pat in oneOffPatterns:
+                # check each possible pattern of "match in next move" to
+                # see if a possible move can be made.
+                if (getTEACHERAt(board, x+pat[0][0], y+pat[0][1]) == \
+                    getTEACHERAt(board, x+pat[1][0], y+pat[1][1]) == \
+                    getTEACHERAt(board, x+pat[2][0], y+pat[2][1]) != None) or \
+                   (getTEACHERAt(board, x+pat[0][1], y+pat[0][0]) == \
+                    getTEACHERAt(board, x+pat[1][1], y+pat[1][0]) == \
+                    getTEACHERAt(board, x+pat[2][1], y+pat[2][0]) != None):
+                    return True # return True the first time you find a pattern
+    return False
+
+
+def pullDownAllTEACHERs(board, boardHash=None):
+    # pulls down TEACHERs on the board to the bottom to fill in any gaps
+    # (updating boardHash, from newBoardHash(), if there is one)
+    for x in range(len(board)):
+        column = board[x]
+        if EMPTY_SPACE not in column:
+            continue # nothing to pull down (most columns, after a match)
+        TEACHERsInColumn = [TEACHER for TEACHER in column if TEACHER != EMPTY_SPACE]
+        newColumn = ([EMPTY_SPACE] * (len(column) - len(TEACHERsInColumn))) + TEACHERsInColumn
+        if boardHash != None:
+            # Only the spaces from the lowest gap up can have changed.
+            columnKeys = boardHash['keys'][x]
+            for y in range(len(column) - 1 - column[::-1].index(EMPTY_SPACE), -1, -1):
+                if column[y] != newColumn[y]:
+                    boardHash['value'] ^= columnKeys[y][column[y] + 1] ^ columnKeys[y][newColumn[y] + 1]
+        board[x] = newColumn
+
+
+def getTEACHERAt(board, x, y):
+    if x < 0 or y < 0 or x >= len(board) or y >= len(board[x]):
+        return None
+    else:
+        return board[x][y]
+
+
+def getDropSlots(board, numTEACHERTypes=NUMTEACHERIMAGES, rng=random):
+    # Creates a "drop slot" for each column and fills the slot with a
+    # number of TEACHERs that that column is lacking. This function assumes
+    # that the TEACHERs have been gravity dropped already.
+    #
+    # rng is anything with a choice() method (the random module, or a
+    # random.Random object when the game needs to be reproducible).
+
+    # Work on the board as it will be once pulled down. Only the columns
+    # with gaps in them are different (and are written to below), so only
+    # those are copied.
+    boardCopy = []
+    for column in board:
+        if EMPTY_SPACE in column:
+            TEACHERsInColumn = [TEACHER for TEACHER in column if TEACHER != EMPTY_SPACE]
+            column = [EMPTY_SPACE] * (len(column) - len(TEACHERsInColumn)) + TEACHERsInColumn
+        boardCopy.append(column)
+
+    dropSlots = []
+    for i in range(len(board)):
+        dropSlots.append([])
+
+    # The empty spaces are at the top of each column, and are filled from
+    # the bottom one up, so the space above one being filled is always
+    # empty (or off the board): only the TEACHERs below, to the left (already
+    # filled) and to the right are ever neighbors. Narrow down the possible
+    # TEACHERs we should put in the blank space so we don't end up putting
+    # two of the same TEACHERs next to each other when they drop. (The
+    # possible TEACHERs stay in order, so rng.choice() picks the same ones
+    # for the same random numbers.)
+    TEACHERTypes = range(numTEACHERTypes)
+    width = len(boardCopy)
+    for x in range(width):
+        column = boardCopy[x]
+        if EMPTY_SPACE not in column:
+            continue
+        height = len(column)
+        for y in range(column.count(EMPTY_SPACE) - 1, -1, -1): # start from bottom, going up
+            neighborTEACHERs = (column[y + 1] if y + 1 < height else None,
+                                boardCopy[x - 1][y] if x > 0 else None,
+                                boardCopy[x + 1][y] if x + 1 < width else None)
+            newTEACHER = rng.choice([TEACHER for TEACHER in TEACHERTypes if TEACHER not in neighborTEACHERs])
+            column[y] = newTEACHER
+            dropSlots[x].append(newTEACHER)
+    return dropSlots
+
+
+def pullDownAndRefill(board, numTEACHERTypes=NUMTEACHERIMAGES, rng=random, boardHash=None):
+    # Does what pullDownAllTEACHERs(), getDropSlots() and refillBoard() do
+    # together, a column at a time: each column with gaps is pulled down
+    # into a new list (the old one is left as it was), refilled right away
+    # and hashed once, and nothing is copied or looked at twice. A column is
+    # refilled next to the column on its right already pulled down, which
+    # is what getDropSlots() sees, so the same TEACHERs are picked. Returns
+    # the drop slots.
+    width = len(board)
+    dropSlots = []
+    for i in range(width):
+        dropSlots.append([])
+    oldColumns = [None] * width # the columns that had gaps, before being pulled down
+
+    def pullDown(x):
+        column = board[x]
+        if oldColumns[x] == None and EMPTY_SPACE in column:
+            TEACHERsInColumn = [TEACHER for TEACHER in column if TEACHER != EMPTY_SPACE]
+            board[x] = [EMPTY_SPACE] * (len(column) - len(TEACHERsInColumn)) + TEACHERsInColumn
+            oldColumns[x] = column
+
+    TEACHERTypes = range(numTEACHERTypes)
+    if width > 0:
+        pullDown(0)
+    for x in range(width):
+        if x + 1 < width:
+            pullDown(x + 1)
+        oldColumn = oldColumns[x]
+        if oldColumn == None:
+            continue
+        column = board[x]
+        height = len(column)
+        for y in range(column.count(EMPTY_SPACE) - 1, -1, -1): # start from bottom, going up
+            neighborTEACHERs = (column[y + 1] if y + 1 < height else None,
+                                board[x - 1][y] if x > 0 else None,
+                                board[x + 1][y] if x + 1 < width else None)
+            choicesKey = (numTEACHERTypes, neighborTEACHERs)
+            if choicesKey not in DROPCHOICES:
+                DROPCHOICES[choicesKey] = [TEACHER for TEACHER in TEACHERTypes if TEACHER not in neighborTEACHERs]
+            newTEACHER = rng.choice(DROPCHOICES[choicesKey])
+            column[y] = newTEACHER
+            dropSlots[x].append(newTEACHER)
+        if boardHash != None:
+            # Only the spaces from the lowest gap up can have changed.
+            columnKeys = boardHash['keys'][x]
+            for y in range(height - 1 - oldColumn[::-1].index(EMPTY_SPACE), -1, -1):
+                if oldColumn[y] != column[y]:
+                    boardHash['value'] ^= columnKeys[y][oldColumn[y] + 1] ^ columnKeys[y][column[y] + 1]
+    return dropSlots
+
+
+def findMatchingTEACHERs(board):
+    if not isinstance(board, list):
+        # NumPy board, see USENUMPYBOARD
+        import TeacherArray
+        return TeacherArray.findMatchingTEACHERsArray(board)
+
+    TEACHERsToRemove = [] # a list of lists of TEACHERs in matching triplets that should be removed
+
+    # Rather than blanking out matched TEACHERs in a copy of the board, mark
+    # them in used (one byte per space) so they aren't matched again.
+    width = len(board)
+    height = len(board[0]) if width > 0 else 0
+    used = bytearray(width * height)
+
+    def isFree(x, y, targetTEACHER):
+        # True if (x, y) is on the board, holds targetTEACHER and isn't
+        # already in a set.
+        return 0 <= x < width and 0 <= y < height and board[x][y] == targetTEACHER and not used[x * height + y]
+
+    # loop through each space, checking for 3 adjacent identical TEACHERs
+    for x in range(width):
+        column = board[x]
+        if x < width - 2:
+            nextColumn = board[x + 1]
+            lastColumn = board[x + 2]
+        else:
+            nextColumn = lastColumn = None
+        for y in range(height):
+            targetTEACHER = column[y]
+            if targetTEACHER == EMPTY_SPACE:
+                continue
+            # look for horizontal matches (the quick test on the board comes
+            # first, since most spaces aren't the start of a run)
+            if nextColumn != None and nextColumn[y] == targetTEACHER == lastColumn[y] and \
+               isFree(x, y, targetTEACHER) and isFree(x + 1, y, targetTEACHER) and isFree(x + 2, y, targetTEACHER):
+                offset = 0
+                removeSet = []
+                while isFree(x + offset, y, targetTEACHER):
+                    # keep checking if there's more than 3 TEACHERs in a row
+                    removeSet.append((x + offset, y))
+                    used[(x + offset) * height + y] = 1
+                    offset += 1
+                TEACHERsToRemove.append(removeSet)
+
+            # look for vertical matches
+            if y < height - 2 and column[y + 1] == targetTEACHER == column[y + 2] and \
+               isFree(x, y, targetTEACHER) and isFree(x, y + 1, targetTEACHER) and isFree(x, y + 2, targetTEACHER):
+                offset = 0
+                removeSet = []
+                while isFree(x, y + offset, targetTEACHER):
+                    # keep checking, in case there's more than 3 TEACHERs in a row
+                    removeSet.append((x, y + offset))
+                    used[x * height + y + offset] = 1
+                    offset += 1
+                TEACHERsToRemove.append(removeSet)
+
+    return TEACHERsToRemove
+
+
+def getMatchesFromCandidates(board, candidates):
+    # Returns the same list findMatchingTEACHERs() would, given every
+    # (x, y, isVertical) position where three identical TEACHERs start a
+    # horizontal (isVertical False) or vertical run on the board.
+    #
+    # findMatchingTEACHERs() scans the board column by column, checking
+    # horizontal before vertical, and blanks out each set as it finds it, so
+    # a TEACHER is never in two sets. A set can only start on one of the
+    # candidate positions, so replaying that scan over just the candidates
+    # (in the same order) gives exactly the same sets.
+    TEACHERsToRemove = []
+    removed = set()
+    for x, y, isVertical in sorted(candidates):
+        if isVertical:
+            dx, dy = 0, 1
+        else:
+            dx, dy = 1, 0
+        if (x, y) in removed or (x + dx, y + dy) in removed or (x + 2 * dx, y + 2 * dy) in removed:
+            continue # part of this run was already used by an earlier set
+        targetTEACHER = board[x][y]
+        removeSet = []
+        while getTEACHERAt(board, x, y) == targetTEACHER and (x, y) not in removed:
+            removeSet.append((x, y))
+            removed.add((x, y))
+            x += dx
+            y += dy
+        TEACHERsToRemove.append(removeSet)
+    return TEACHERsToRemove
+
+
+def findMatchingTEACHERsNear(board, changedSpaces):
+    # Returns the same list as findMatchingTEACHERs(board), but only looks
+    # at the rows and columns running through changedSpaces (a list of
+    # (x, y) tuples) instead of the whole board.
+    #
+    # This relies on every match on the board going through one of the
+    # changed spaces, which is true during a game: the board has no matches
+    # left before a swap (so only the two swapped spaces can make one) and
+    # none left after each cascade step (see getCascadeChangedSpaces()).
+    if not isinstance(board, list):
+        # NumPy board, see USENUMPYBOARD
+        import TeacherArray
+        return TeacherArray.findMatchingTEACHERsNearArray(board, changedSpaces)
+    candidates = set()
+    width = len(board)
+    for x, y in changedSpaces:
+        column = board[x]
+        targetTEACHER = column[y]
+        if targetTEACHER == EMPTY_SPACE:
+            continue
+
+        # find the ends of the horizontal run through this space (indexing
+        # the board directly, as isPartOfMatch() does)
+        left = x
+        while left > 0 and board[left - 1][y] == targetTEACHER:
+            left -= 1
+        right = x
+        while right < width - 1 and board[right + 1][y] == targetTEACHER:
+            right += 1
+        for startx in range(left, right - 1):
+            candidates.add((startx, y, False)) # only if the run is 3 or longer
+
+        # find the ends of the vertical run through this space
+        top = y
+        while top > 0 and column[top - 1] == targetTEACHER:
+            top -= 1
+        bottom = y
+        while bottom < len(column) - 1 and column[bottom + 1] == targetTEACHER:
+            bottom += 1
+        for starty in range(top, bottom - 1):
+            candidates.add((x, starty, True))
+
+    matchedTEACHERs = getMatchesFromCandidates(board, candidates)
+    if CHECKINCREMENTALMATCHES:
+        fullMatchedTEACHERs = findMatchingTEACHERs(board)
+        assert matchedTEACHERs == fullMatchedTEACHERs, \
+            'incremental matches %s differ from full scan %s (changed spaces %s)' % (matchedTEACHERs, fullMatchedTEACHERs, sorted(changedSpaces))
+    return matchedTEACHERs
+
+
+def getCascadeChangedSpaces(matchedTEACHERs):
+    # After the TEACHERs in matchedTEACHERs are removed and the board is
+    # pulled down and refilled, every space in a column from the top down to
+    # the lowest removed TEACHER may have changed. Returns those spaces.
+    lowestRemoved = {}
+    for TEACHERSet in matchedTEACHERs:
+        for x, y in TEACHERSet:
+            if y > lowestRemoved.get(x, -1):
+                lowestRemoved[x] = y
+    changedSpaces = []
+    for x in lowestRemoved:
+        for y in range(lowestRemoved[x] + 1):
+            changedSpaces.append((x, y))
+    return changedSpaces
+
+
+def isPartOfMatch(board, x, y):
+    # Returns True if the TEACHER at (x, y) is in a horizontal or vertical
+    # run of 3 or more identical TEACHERs. (This is called for every swap
+    # that gets checked, so it indexes the board directly rather than going
+    # through getTEACHERAt().)
+    column = board[x]
+    targetTEACHER = column[y]
+    if targetTEACHER == EMPTY_SPACE:
+        return False
+
+    top = y
+    while top > 0 and column[top - 1] == targetTEACHER:
+        top -= 1
+    bottom = y
+    while bottom < len(column) - 1 and column[bottom + 1] == targetTEACHER:
+        bottom += 1
+    if bottom - top >= 2:
+        return True
+
+    left = x
+    while left > 0 and board[left - 1][y] == targetTEACHER:
+        left -= 1
+    right = x
+    while right < len(board) - 1 and board[right + 1][y] == targetTEACHER:
+        right += 1
+    return right - left >= 2
+
+
+def isValidSwap(board, first, second):
+    # Returns True if swapping the TEACHERs at the (x, y) tuples first and
+    # second (which must be adjacent) would make a match. The board is
+    # swapped back before returning.
+    firstTEACHER = board[first[0]][first[1]]
+    secondTEACHER = board[second[0]][second[1]]
+    if firstTEACHER == secondTEACHER:
+        return False
+    board[first[0]][first[1]] = secondTEACHER
+    board[second[0]][second[1]] = firstTEACHER
+    isValid = isPartOfMatch(board, first[0], first[1]) or isPartOfMatch(board, second[0], second[1])
+    board[first[0]][first[1]] = firstTEACHER
+    board[second[0]][second[1]] = secondTEACHER
+    return isValid
+
+
+def getSwapTable(width, height):
+    # Returns the table of swaps for boards of this size, making it the
+    # first time it's needed. Spaces are numbered x * height + y, the order
+    # of a board's columns one after the other (see getSpaceList()):
+    #
+    #   'swaps'    for each swap, a (move, first, second, firstPairs,
+    #              secondPairs) tuple: move is the ((x1, y1), (x2, y2))
+    #              tuple, first and second the numbers of its spaces, and
+    #              firstPairs the pairs of spaces that make a match if they
+    #              hold the TEACHER moved into first (secondPairs the same
+    #              for second). This is what isValidSwap() looks at.
+    #   'readers'  for each space, a frozenset of the swaps (by their index
+    #              in 'swaps') whose pairs or spaces include it.
+    tableKey = (width, height)
+    if tableKey not in SWAPTABLES:
+        def getMatchPairs(x, y, awayX, awayY):
+            # The pairs of spaces next to (x, y) that would make a run of 3
+            # with it: two in a row further from the other swapped space
+            # (which is -awayX, -awayY from it), or up and down the other
+            # way.
+            crossX, crossY = awayY, awayX
+            pairs = []
+            for (x1, y1), (x2, y2) in (((x + awayX, y + awayY), (x + 2 * awayX, y + 2 * awayY)),
+                                       ((x - crossX, y - crossY), (x + crossX, y + crossY)),
+                                       ((x - crossX, y - crossY), (x - 2 * crossX, y - 2 * crossY)),
+                                       ((x + crossX, y + crossY), (x + 2 * crossX, y + 2 * crossY))):
+                if 0 <= x1 < width and 0 <= y1 < height and 0 <= x2 < width and 0 <= y2 < height:
+                    pairs.append((x1 * height + y1, x2 * height + y2))
+            return tuple(pairs)
+
+        swaps = []
+        readers = []
+        for i in range(width * height):
+            readers.append(set())
+        for x in range(width):
+            for y in range(height):
+                for move in (((x, y), (x + 1, y)), ((x, y), (x, y + 1))):
+                    (x1, y1), (x2, y2) = move
+                    if x2 >= width or y2 >= height:
+                        continue
+                    firstPairs = getMatchPairs(x1, y1, x1 - x2, y1 - y2)
+                    secondPairs = getMatchPairs(x2, y2, x2 - x1, y2 - y1)
+                    first = x1 * height + y1
+                    second = x2 * height + y2
+                    for space in itertools.chain((first, second), *(firstPairs + secondPairs)):
+                        readers[space].add(len(swaps))
+                    swaps.append((move, first, second, firstPairs, secondPairs))
+        SWAPTABLES[tableKey] = {'swaps': swaps, 'readers': [frozenset(spaceReaders) for spaceReaders in readers]}
+    return SWAPTABLES[tableKey]
+
+
+def getSpaceList(board):
+    # The board's spaces as one list, numbered the way getSwapTable() does.
+    return list(itertools.chain.from_iterable(board))
+
+
+def updateSwaps(validMoves, spaces, swaps, swapNums):
+    # Add the swaps (from getSwapTable()) numbered in swapNums that make a
+    # match on the board (given as a list by getSpaceList()) to the
+    # validMoves set, and take out those that don't. Decides the same way
+    # isValidSwap() does.
+    for swapNum in swapNums:
+        move, first, second, firstPairs, secondPairs = swaps[swapNum]
+        firstTEACHER = spaces[first]
+        secondTEACHER = spaces[second]
+        isValid = False
+        if firstTEACHER != secondTEACHER:
+            if secondTEACHER != EMPTY_SPACE:
+                for space1, space2 in firstPairs:
+                    if spaces[space1] == secondTEACHER == spaces[space2]:
+                        isValid = True
+                        break
+            if not isValid and firstTEACHER != EMPTY_SPACE:
+                for space1, space2 in secondPairs:
+                    if spaces[space1] == firstTEACHER == spaces[space2]:
+                        isValid = True
+                        break
+        if isValid:
+            validMoves.add(move)
+        else:
+            validMoves.discard(move)
+
+
+def getValidMoves(board):
+    # Returns the set of every swap that would make a match, each one a
+    # ((x1, y1), (x2, y2)) tuple with the right or lower space second.
+    # This is the full scan; use updateValidMoves() to keep it current.
+    if not isinstance(board, list):
+        # NumPy board, see USENUMPYBOARD
+        import TeacherArray
+        return TeacherArray.getValidMovesArray(board)
+    validMoves = set()
+    if len(board) * len(board[0]) <= SWAPTABLESPACES:
+        swaps = getSwapTable(len(board), len(board[0]))['swaps']
+        updateSwaps(validMoves, getSpaceList(board), swaps, range(len(swaps)))
+        return validMoves
+    for x in range(len(board)):
+        for y in range(len(board[x])):
+            for move in (((x, y), (x + 1, y)), ((x, y), (x, y + 1))):
+                if move[1][0] < len(board) and move[1][1] < len(board[x]) and isValidSwap(board, move[0], move[1]):
+                    validMoves.add(move)
+    return validMoves
+
+
+def updateValidMoves(validMoves, board, changedSpaces):
+    # Brings the validMoves set (from getValidMoves()) up to date after the
+    # TEACHERs at changedSpaces have changed. Whether a swap makes a match
+    # only depends on the spaces up to 2 away from either swapped space in
+    # the same row or column, so only swaps touching those are rechecked.
+    if not isinstance(board, list):
+        # NumPy board, see USENUMPYBOARD
+        import TeacherArray
+        TeacherArray.updateValidMovesArray(validMoves, board, changedSpaces)
+        return
+    width = len(board)
+    height = len(board[0])
+    if width * height <= SWAPTABLESPACES:
+        # Recheck the swaps that look at a changed space, from the table.
+        table = getSwapTable(width, height)
+        readers = table['readers']
+        swapNums = set().union(*[readers[x * height + y] for x, y in changedSpaces])
+        updateSwaps(validMoves, getSpaceList(board), table['swaps'], swapNums)
+        if CHECKINCREMENTALMATCHES:
+            assert validMoves == getValidMoves(board), 'valid move index is out of date after changes at %s' % (sorted(set(changedSpaces)))
+        return
+    changedSpaces = set(changedSpaces) # a cascade can change a space more than once
+    if len(changedSpaces) * 4 >= len(board) * len(board[0]):
+        # So much of the board changed (a long cascade on a small board)
+        # that a full scan is quicker than working out what to recheck.
+        validMoves.clear()
+        validMoves.update(getValidMoves(board))
+        return
+
+    nearbySpaces = set()
+    for x, y in changedSpaces:
+        for offset in range(-2, 3):
+            nearbySpaces.add((x + offset, y))
+            nearbySpaces.add((x, y + offset))
+
+    movesToCheck = set()
+    for x, y in nearbySpaces:
+        movesToCheck.add(((x, y), (x + 1, y)))
+        movesToCheck.add(((x - 1, y), (x, y)))
+        movesToCheck.add(((x, y), (x, y + 1)))
+        movesToCheck.add(((x, y - 1), (x, y)))
+
+    width = len(board)
+    height = len(board[0])
+    for move in movesToCheck:
+        if move[0][0] < 0 or move[0][1] < 0 or move[1][0] >= width or move[1][1] >= height:
+            continue # off the edge of the board
+        if isValidSwap(board, move[0], move[1]):
+            validMoves.add(move)
+        else:
+            validMoves.discard(move)
+
+    if CHECKINCREMENTALMATCHES:
+        assert validMoves == getValidMoves(board), 'valid move index is out of date after changes at %s' % (sorted(changedSpaces))
+
+
+def getDroppingTEACHERs(board):
+    # Find all the TEACHERs that have an empty space somewhere below them
+    # (they all drop one space together).
+    droppingTEACHERs = []
+    for x in range(len(board)):
+        column = board[x]
+        gapBelow = False
+        for y in range(len(column) - 1, -1, -1):
+            if column[y] == EMPTY_SPACE:
+                gapBelow = True
+            elif gapBelow:
+                droppingTEACHERs.append(MovingTEACHER(column[y], x, y, DOWN))
+    return droppingTEACHERs
+
+
+def moveTEACHERs(board, movingTEACHERs, boardHash=None):
+    # movingTEACHERs is a list of MovingTEACHER objects. boardHash (from
+    # newBoardHash()) is updated if there is one.
+    for TEACHER in movingTEACHERs:
+        if TEACHER.y != ROWABOVEBOARD and TEACHER.y >= 0:
+            setTEACHER(board, TEACHER.x, TEACHER.y, EMPTY_SPACE, boardHash)
+            starty = TEACHER.y
+        else:
+            # TEACHER is located above the board (where new TEACHERs come from)
+            starty = -1 if TEACHER.y == ROWABOVEBOARD else TEACHER.y
+        movex = 0
+        movey = 0
+        if TEACHER.direction == LEFT:
+            movex = -1
+        elif TEACHER.direction == RIGHT:
+            movex = 1
+        elif TEACHER.direction == DOWN:
+            movey = 1
+        elif TEACHER.direction == UP:
+            movey = -1
+        setTEACHER(board, TEACHER.x + movex * TEACHER.distance, starty + movey * TEACHER.distance, TEACHER.imageNum, boardHash)
+
+
+def getBoardCopyMinusTEACHERs(board, TEACHERs):
+    # Creates and returns a copy of the passed board data structure,
+    # with the TEACHERs in the "TEACHERs" list removed from it.
+    #
+    # TEACHERs is a list of MovingTEACHER objects. (The game itself doesn't
+    # copy the board for this any more; the renderer just skips the spaces
+    # of the moving TEACHERs.)
+
+    boardCopy = copyBoard(board)
+
+    # Remove some of the TEACHERs from this board data structure copy.
+    for TEACHER in TEACHERs:
+        if TEACHER.y != ROWABOVEBOARD and TEACHER.y >= 0:
+            boardCopy[TEACHER.x][TEACHER.y] = EMPTY_SPACE
+    return boardCopy
+
+
+def getMatchScore(matchedTEACHERs, scoreAdd=0):
+    # Returns the running scoreAdd after the sets in matchedTEACHERs have been
+    # scored. runGame() keeps adding to scoreAdd across the steps of a
+    # cascade (so later steps of a combo are worth more), which is why the
+    # previous value is passed in.
+    for TEACHERSet in matchedTEACHERs:
+        scoreAdd += (10 + (len(TEACHERSet) - 3) * 10)
+    return scoreAdd
+
+
+def getFallingTEACHERs(board, dropSlots):
+    # Returns a list of MovingTEACHERs (falling DOWN by their distance) for
+    # every TEACHER that moves when the board is pulled down and the drop
+    # slots are emptied into it. New TEACHERs start above the board, at
+    # negative y values, so that every TEACHER falls at the same speed.
+    fallingTEACHERs = []
+    for x in range(len(board)):
+        toY = len(board[x]) - 1
+        for fromY in range(len(board[x]) - 1, -1, -1):
+            if board[x][fromY] == EMPTY_SPACE:
+                continue
+            if fromY != toY:
+                fallingTEACHERs.append(MovingTEACHER(board[x][fromY], x, fromY, DOWN, toY - fromY))
+            toY -= 1
+        for i in range(len(dropSlots[x])):
+            # dropSlots[x][0] is the lowest new TEACHER in the column
+            fallingTEACHERs.append(MovingTEACHER(dropSlots[x][i], x, -1 - i, DOWN, toY + 1))
+    return fallingTEACHERs
+
+
+def getRefillTEACHERs(dropSlots):
+    # The new TEACHERs of getFallingTEACHERs() on their own: MovingTEACHERs
+    # that start above the board and fall into the top of a pulled down
+    # board.
+    refillTEACHERs = []
+    for x in range(len(dropSlots)):
+        for i in range(len(dropSlots[x])):
+            refillTEACHERs.append(MovingTEACHER(dropSlots[x][i], x, -1 - i, DOWN, len(dropSlots[x])))
+    return refillTEACHERs
+
+
+def refillBoard(board, dropSlots, boardHash=None):
+    # Puts the contents of the drop slots into the empty spaces at the top
+    # of a pulled down board.
+    for x in range(len(dropSlots)):
+        for i in range(len(dropSlots[x])):
+            setTEACHER(board, x, len(dropSlots[x]) - 1 - i, dropSlots[x][i], boardHash)
+
+
+def fillBoard(board, numTEACHERTypes=NUMTEACHERIMAGES, rng=random, boardHash=None):
+    # Pulls the TEACHERs down and puts the contents of the drop slots into
+    # the empty spaces at the top. Returns the TEACHERs that moved, see
+    # getFallingTEACHERs(). boardHash is updated if there is one.
+    if not isinstance(board, list):
+        # NumPy board, see USENUMPYBOARD
+        import TeacherArray
+        fallDistances = TeacherArray.fillBoardArray(board, numTEACHERTypes, rng, boardHash)
+        return TeacherArray.getFallingTEACHERsArray(board, fallDistances)
+    oldBoard = list(board) # pullDownAndRefill() leaves the old columns alone
+    dropSlots = pullDownAndRefill(board, numTEACHERTypes, rng, boardHash)
+    return getFallingTEACHERs(oldBoard, dropSlots)
+
+
+def newGame(seed=None, width=BOARDWIDTH, height=BOARDHEIGHT, numTEACHERTypes=NUMTEACHERIMAGES, numpyBoard=None):
+    # Create and return a game: a dict holding a filled board and everything
+    # needed to keep playing it. All randomness comes from game['random'],
+    # so two games made with the same seed (and the same kind of board, see
+    # getBlankBoard()) play out identically.
+    game = {'board': getBlankBoard(width, height, numpyBoard),
+            'random': random.Random(seed),
+            'seed': seed,
+            'numTEACHERTypes': numTEACHERTypes,
+            'score': 0,
+            'moves': 0}
+    fillBoard(game['board'], numTEACHERTypes, game['random'])
+    game['hash'] = newBoardHash(game['board'], numTEACHERTypes)
+    game['validMoves'] = getValidMovesForGame(game)
+    return game
+
+
+def copyGame(game, seed=None):
+    # Returns a copy of game that can be played on without changing the
+    # original (for looking ahead). The copy gets its own random.Random(seed),
+    # so it doesn't know which TEACHERs the real game will drop next.
+    gameCopy = dict(game)
+    gameCopy['board'] = copyBoard(game['board'])
+    gameCopy['hash'] = dict(game['hash'])
+    gameCopy['validMoves'] = set(game['validMoves'])
+    gameCopy['random'] = random.Random(seed)
+    return gameCopy
+
+
+def applySwap(game, firstXY, secondXY):
+    # Swaps the TEACHERs at firstXY and secondXY (dicts with keys x and y)
+    # if they are adjacent and the swap makes a match. Returns True if the
+    # swap was made, otherwise the board is left unchanged and False is
+    # returned. Call resolveCascades() afterwards to clear the matches.
+    board = game['board']
+    firstSwappingTEACHER, secondSwappingTEACHER = getSwappingTEACHERs(board, firstXY, secondXY)
+    if firstSwappingTEACHER == None and secondSwappingTEACHER == None:
+        return False # not adjacent
+
+    setTEACHER(board, firstSwappingTEACHER.x, firstSwappingTEACHER.y, secondSwappingTEACHER.imageNum, game['hash'])
+    setTEACHER(board, secondSwappingTEACHER.x, secondSwappingTEACHER.y, firstSwappingTEACHER.imageNum, game['hash'])
+    swappedSpaces = [(firstXY['x'], firstXY['y']), (secondXY['x'], secondXY['y'])]
+    if getMatchesForGame(game, swappedSpaces) == []:
+        # Was not a matching move; swap the TEACHERs back
+        setTEACHER(board, firstSwappingTEACHER.x, firstSwappingTEACHER.y, firstSwappingTEACHER.imageNum, game['hash'])
+        setTEACHER(board, secondSwappingTEACHER.x, secondSwappingTEACHER.y, secondSwappingTEACHER.imageNum, game['hash'])
+        return False
+    game['moves'] += 1
+    return True
+
+
+def resolveCascades(game, changedSpaces=None):
+    # Removes matches, pulls down and refills the board until no matches are
+    # left, scoring them the same way runGame() does. Returns a list with the
+    # matched TEACHER sets of each cascade step (so its length is the depth
+    # of the combo).
+    #
+    # If changedSpaces (e.g. the two swapped spaces) is given, only matches
+    # through those spaces are looked for; see findMatchingTEACHERsNear().
+    # game['validMoves'] is updated to match the final board either way.
+    for event in iterCascades(game, changedSpaces, False):
+        if event['type'] == 'done':
+            return event['cascadeSteps']
+
+
+def iterCascades(game, changedSpaces=None, withMoves=True):
+    # A generator that resolves the cascades of a move one step at a time
+    # (see resolveCascades()), yielding an event dict as each part of a step
+    # is done to the game. Every event has a 'type' and the 'step' number
+    # (0 for the first matches of the move):
+    #
+    #   'match'    the sets in 'matchedTEACHERs' were removed and scored.
+    #              'points' has the running points of the move after each
+    #              set, 'scoreAdd' after all of them.
+    #   'gravity'  the TEACHERs left were pulled down. 'fallingTEACHERs'
+    #              are MovingTEACHERs falling to their new spaces.
+    #   'refill'   new TEACHERs were put in the empty spaces at the top.
+    #              'newTEACHERs' are MovingTEACHERs falling in from above.
+    #   'done'     no matches are left and game['validMoves'] is up to
+    #              date. 'cascadeSteps' is what resolveCascades() returns.
+    #
+    # Nothing is worked out until it's asked for, so a renderer can wait
+    # for each step's animations before resuming. With withMoves False the
+    # gravity and refill events are left out (and their lists of
+    # MovingTEACHERs aren't made), for callers that only want the result.
+    #
+    # A NumPy board (see USENUMPYBOARD) is pulled down and refilled in one
+    # go, so its gravity and refill events both come once it's refilled.
+    board = game['board']
+    cascadeSteps = []
+    scoreAdd = 0
+    if changedSpaces == None:
+        matchedTEACHERs = findMatchingTEACHERs(board)
+    else:
+        changedSpaces = list(changedSpaces)
+        matchedTEACHERs = getMatchesForGame(game, changedSpaces)
+    while matchedTEACHERs != []:
+        step = len(cascadeSteps)
+        points = []
+        for TEACHERSet in matchedTEACHERs:
+            scoreAdd = getMatchScore([TEACHERSet], scoreAdd)
+            points.append(scoreAdd)
+            for TEACHER in TEACHERSet:
+                setTEACHER(board, TEACHER[0], TEACHER[1], EMPTY_SPACE, game['hash'])
+        game['score'] += scoreAdd
+        cascadeSteps.append(matchedTEACHERs)
+        yield {'type': 'match', 'step': step, 'matchedTEACHERs': matchedTEACHERs, 'points': points, 'scoreAdd': scoreAdd}
+
+        # pullDownAndRefill() picks the same TEACHERs whether or not the
+        # board was pulled down first, so the random numbers are used in
+        # the same order as fillBoard().
+        if not isinstance(board, list):
+            import TeacherArray
+            fallDistances = TeacherArray.fillBoardArray(board, game['numTEACHERTypes'], game['random'], game['hash'])
+            if withMoves:
+                fallingTEACHERs = TeacherArray.getFallingTEACHERsArray(board, fallDistances)
+                yield {'type': 'gravity', 'step': step,
+                       'fallingTEACHERs': [TEACHER for TEACHER in fallingTEACHERs if TEACHER.y >= 0]}
+                yield {'type': 'refill', 'step': step,
+                       'newTEACHERs': [TEACHER for TEACHER in fallingTEACHERs if TEACHER.y < 0]}
+        elif withMoves:
+            fallingTEACHERs = getFallingTEACHERs(board, [[] for x in range(len(board))])
+            pullDownAllTEACHERs(board, game['hash'])
+            yield {'type': 'gravity', 'step': step, 'fallingTEACHERs': fallingTEACHERs}
+            dropSlots = pullDownAndRefill(board, game['numTEACHERTypes'], game['random'], game['hash'])
+            yield {'type': 'refill', 'step': step, 'newTEACHERs': getRefillTEACHERs(dropSlots)}
+        else:
+            pullDownAndRefill(board, game['numTEACHERTypes'], game['random'], game['hash'])
+
+        cascadeChangedSpaces = getCascadeChangedSpaces(matchedTEACHERs)
+        if changedSpaces != None:
+            changedSpaces.extend(cascadeChangedSpaces)
+        matchedTEACHERs = getMatchesForGame(game, cascadeChangedSpaces)
+
+    if changedSpaces == None:
+        game['validMoves'] = getValidMovesForGame(game)
+    else:
+        updateValidMovesForGame(game, changedSpaces)
+    yield {'type': 'done', 'step': len(cascadeSteps), 'cascadeSteps': cascadeSteps}
+
+
+def getMatchesForGame(game, changedSpaces):
+    # findMatchingTEACHERsNear() for the game's board, remembered by the
+    # board's hash. (Between moves a game's board never has matches, so the
+    # matches near the changed spaces are all the matches on the board, and
+    # are the same whichever spaces changed to get there.)
+    if CHECKINCREMENTALMATCHES:
+        assert game['hash']['value'] == newBoardHash(game['board'], game['numTEACHERTypes'])['value'], 'board hash is out of date'
+    matchedTEACHERs = getMemo('matches', game['hash'])
+    if matchedTEACHERs == None:
+        matchedTEACHERs = findMatchingTEACHERsNear(game['board'], changedSpaces)
+        putMemo('matches', game['hash'], matchedTEACHERs)
+    elif CHECKINCREMENTALMATCHES:
+        assert matchedTEACHERs == findMatchingTEACHERs(game['board']), 'remembered matches are wrong'
+    return matchedTEACHERs
+
+
+def getValidMovesForGame(game):
+    # getValidMoves() for the game's board, remembered by the board's hash.
+    validMoves = getMemo('validMoves', game['hash'])
+    if validMoves == None:
+        validMoves = getValidMoves(game['board'])
+        putMemo('validMoves', game['hash'], frozenset(validMoves))
+        return validMoves
+    if CHECKINCREMENTALMATCHES:
+        assert validMoves == getValidMoves(game['board']), 'remembered valid moves are wrong'
+    return set(validMoves)
+
+
+def updateValidMovesForGame(game, changedSpaces):
+    # updateValidMoves() for game['validMoves'], unless the new board's
+    # valid moves are already remembered.
+    validMoves = getMemo('validMoves', game['hash'])
+    if validMoves == None:
+        updateValidMoves(game['validMoves'], game['board'], changedSpaces)
+        putMemo('validMoves', game['hash'], frozenset(game['validMoves']))
+    else:
+        if CHECKINCREMENTALMATCHES:
+            assert validMoves == getValidMoves(game['board']), 'remembered valid moves are wrong'
+        game['validMoves'] = set(validMoves)
+
+
+def playMove(game, firstXY, secondXY):
+    # Swap two TEACHERs and resolve the resulting cascades. Returns the
+    # cascade steps (see resolveCascades()), or None if the swap was not a
+    # legal move.
+    if not applySwap(game, firstXY, secondXY):
+        return None
+    return resolveCascades(game, [(firstXY['x'], firstXY['y']), (secondXY['x'], secondXY['y'])])
+
+
+def getSwapScore(game, move):
+    # The points the first cascade step of move (an ((x1, y1), (x2, y2))
+    # tuple) would score: the part that doesn't depend on what TEACHERs
+    # drop in next. The board is left as it was.
+    board = game['board']
+    (x1, y1), (x2, y2) = move
+    board[x1][y1], board[x2][y2] = board[x2][y2], board[x1][y1]
+    matchedTEACHERs = findMatchingTEACHERsNear(board, [(x1, y1), (x2, y2)])
+    board[x1][y1], board[x2][y2] = board[x2][y2], board[x1][y1]
+    return getMatchScore(matchedTEACHERs)
+
+
+def listValidMoves(game):
+    # Returns a list of every swap that would make a match right now, as
+    # ((x1, y1), (x2, y2)) tuples. Useful for hints.
+    return list(game['validMoves'])
+
+
+def countValidMoves(game):
+    return len(game['validMoves'])
+
+
+def isGameOver(game):
+    return len(game['validMoves']) == 0
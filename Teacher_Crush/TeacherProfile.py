@@ -0,0 +1,194 @@
+# Frame timing for finding out where the time goes when frames drop.
+#
+# The game loop calls startFrame() at the top of each frame and endFrame()
+# at the bottom, and wraps each phase of the frame (event handling, the
+# match and cascade logic, drawing the board, rendering text, updating the
+# display, waiting for the next frame) in startSpan(name) and
+# endSpan(name). Spans can be nested. Each finished frame's time, and the
+# time spent in each span name during it, is kept for getStats() (frame
+# rate, p50/p99 frame time and the average time of each phase) and can be
+# written out as it happens, to a CSV file with one row per frame or to a
+# Chrome trace (open it at chrome://tracing or ui.perfetto.dev):
+#
+#   python TeacherCrush.py --profile --profile-output frames.csv
+#   python TeacherCrush.py --profile-output frames.json
+#
+# Nothing is timed until startProfiling() is called, and until then every
+# function here returns straight away, so the hooks can stay in the code.
+# Spans are only for the thread running the game loop.
+
+import time, json, csv, collections
+
+# The phases the game loop times, in the order they're shown and written
+# to CSV files. Spans with other names are timed too, but only show up in
+# Chrome traces and the overlay.
+PHASES = ['events', 'logic', 'drawBoard', 'text', 'display.update', 'wait']
+
+STATSFRAMES = 120 # how many of the latest frames getStats() looks at
+
+PROFILE = {'enabled': False,
+           'frames': collections.deque(maxlen=STATSFRAMES),
+           'frameNum': 0,
+           'frameStart': None,
+           'spans': [], # (name, start, end) for the spans of this frame
+           'openSpans': [], # (name, start) for the spans started but not ended
+           'startTime': 0.0,
+           'output': None, # see openOutput()
+           'outputFile': None}
+
+
+def startProfiling(outputPath=None):
+    # Start timing frames. If outputPath ends in .csv every frame is
+    # written to it as a row, otherwise it's written as a Chrome trace.
+    if PROFILE['enabled']:
+        return
+    PROFILE['enabled'] = True
+    PROFILE['frames'].clear()
+    PROFILE['frameStart'] = None
+    PROFILE['startTime'] = time.perf_counter()
+    if outputPath != None:
+        openOutput(outputPath)
+
+
+def stopProfiling():
+    # Stop timing and finish the output file, if there is one. Safe to call
+    # more than once.
+    PROFILE['enabled'] = False
+    PROFILE['frameStart'] = None
+    del PROFILE['spans'][:]
+    del PROFILE['openSpans'][:]
+    outputFile = PROFILE['outputFile']
+    if outputFile == None:
+        return
+    if PROFILE['output'] == 'trace':
+        outputFile.write('\n]\n')
+    outputFile.close()
+    PROFILE['outputFile'] = None
+    PROFILE['output'] = None
+
+
+def isProfiling():
+    return PROFILE['enabled']
+
+
+def openOutput(path):
+    outputFile = open(path, 'w', newline='')
+    PROFILE['outputFile'] = outputFile
+    if path.endswith('.csv'):
+        PROFILE['output'] = 'csv'
+        PROFILE['csvWriter'] = csv.writer(outputFile)
+        PROFILE['csvWriter'].writerow(['frame', 'start', 'frameMs'] + ['%sMs' % phase for phase in PHASES])
+    else:
+        # The trace event format allows the array to be left open, so a
+        # trace is still readable if the game crashes before it's closed.
+        PROFILE['output'] = 'trace'
+        PROFILE['traceEvents'] = 0
+        outputFile.write('[\n')
+        writeTraceEvent({'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': 1, 'args': {'name': 'game loop'}})
+
+
+def startFrame():
+    if not PROFILE['enabled']:
+        return
+    del PROFILE['spans'][:] # from a frame that was never ended
+    del PROFILE['openSpans'][:]
+    PROFILE['frameStart'] = time.perf_counter()
+
+
+def endFrame():
+    # Finish the frame started by startFrame(): keep its times and write
+    # it to the output file.
+    if not PROFILE['enabled'] or PROFILE['frameStart'] == None:
+        return
+    frameEnd = time.perf_counter()
+    frameStart = PROFILE['frameStart']
+    phaseTimes = {}
+    for name, start, end in PROFILE['spans']:
+        phaseTimes[name] = phaseTimes.get(name, 0.0) + (end - start)
+    frame = {'num': PROFILE['frameNum'],
+             'start': frameStart - PROFILE['startTime'],
+             'time': frameEnd - frameStart,
+             'phases': phaseTimes}
+    PROFILE['frames'].append(frame)
+    PROFILE['frameNum'] += 1
+
+    if PROFILE['output'] == 'csv':
+        PROFILE['csvWriter'].writerow([frame['num'], '%.6f' % frame['start'], '%.3f' % (frame['time'] * 1000)] +
+                                      ['%.3f' % (phaseTimes.get(phase, 0.0) * 1000) for phase in PHASES])
+    elif PROFILE['output'] == 'trace':
+        writeTraceSpan('frame %s' % frame['num'], frameStart, frameEnd)
+        for name, start, end in PROFILE['spans']:
+            writeTraceSpan(name, start, end)
+    if PROFILE['outputFile'] != None:
+        PROFILE['outputFile'].flush() # so the file is complete if the game crashes
+
+    PROFILE['frameStart'] = None
+
+
+def startSpan(name):
+    if not PROFILE['enabled']:
+        return
+    PROFILE['openSpans'].append((name, time.perf_counter()))
+
+
+def endSpan(name):
+    # Ends the latest span started with this name.
+    if not PROFILE['enabled']:
+        return
+    end = time.perf_counter()
+    openSpans = PROFILE['openSpans']
+    for i in range(len(openSpans) - 1, -1, -1):
+        if openSpans[i][0] == name:
+            PROFILE['spans'].append((name, openSpans[i][1], end))
+            del openSpans[i]
+            return
+
+
+def writeTraceSpan(name, start, end):
+    # A complete ('X') event. Times in a trace are in microseconds.
+    writeTraceEvent({'name': name, 'ph': 'X', 'pid': 1, 'tid': 1,
+                     'ts': round((start - PROFILE['startTime']) * 1000000, 1),
+                     'dur': round((end - start) * 1000000, 1)})
+
+
+def writeTraceEvent(event):
+    separator = ',\n' if PROFILE['traceEvents'] > 0 else ''
+    PROFILE['outputFile'].write(separator + json.dumps(event, separators=(',', ':')))
+    PROFILE['traceEvents'] += 1
+
+
+def getPercentile(values, fraction):
+    # The nearest rank percentile of values (fraction 0.5 is the median).
+    if len(values) == 0:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def getStats():
+    # Returns a dict about the last STATSFRAMES frames: 'fps', 'p50' and
+    # 'p99' frame times and 'phases', a list of (name, average time per
+    # frame) tuples. Times are in seconds.
+    frames = PROFILE['frames']
+    frameTimes = [frame['time'] for frame in frames]
+    totalTime = sum(frameTimes)
+    phaseTotals = {}
+    for frame in frames:
+        for name, phaseTime in frame['phases'].items():
+            phaseTotals[name] = phaseTotals.get(name, 0.0) + phaseTime
+    names = [phase for phase in PHASES if phase in phaseTotals]
+    names.extend(sorted([name for name in phaseTotals if name not in PHASES]))
+    return {'frames': len(frames),
+            'fps': len(frames) / totalTime if totalTime > 0 else 0.0,
+            'p50': getPercentile(frameTimes, 0.5),
+            'p99': getPercentile(frameTimes, 0.99),
+            'phases': [(name, phaseTotals[name] / len(frames)) for name in names]}
+
+
+def getStatsLines():
+    # getStats() as lines of text, for the on-screen overlay.
+    stats = getStats()
+    lines = ['%.1f fps  p50 %.1f ms  p99 %.1f ms' % (stats['fps'], stats['p50'] * 1000, stats['p99'] * 1000)]
+    for name, phaseTime in stats['phases']:
+        lines.append('%s: %.2f ms' % (name, phaseTime * 1000))
+    return lines
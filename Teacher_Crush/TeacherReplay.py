@@ -0,0 +1,286 @@
+# Recording and replaying Teacher Crush games.
+#
+# A game log is a JSON Lines file. The first line is a header with the
+# game's seed, board size and kind of board (NumPy boards pick their refills
+# differently, see TeacherEngine.USENUMPYBOARD), which is all newGame()
+# needs to deal the same board and drop the same TEACHERs. After that comes one line per swap the
+# player tried (with the points deducted for waiting before it), a snapshot
+# of the whole game every SNAPSHOTINTERVAL swaps, and an end line with the
+# final score.
+#
+#   python TeacherReplay.py replays/game-....jsonl --validate
+#   python TeacherReplay.py replays/game-....jsonl --seek 40
+#
+# Replaying uses the headless engine, so it runs as fast as the board
+# functions do. The snapshots let seekReplay() start from the nearest one
+# instead of the beginning of the game. TeacherCrush.py --replay shows a
+# log on screen at any speed.
+
+import os, sys, time, json, random, argparse
+from TeacherEngine import *
+
+REPLAYDIR = 'replays' # where the game saves its logs
+REPLAYVERSION = 2 # 2 added numpyBoard to the header
+SNAPSHOTINTERVAL = 25 # swaps between the snapshots in a log
+
+
+def getSeed():
+    # A fresh seed for a game that should be recorded (newGame(None) would
+    # seed from the OS, and then the log couldn't say how to get it back).
+    return random.SystemRandom().randrange(2 ** 32)
+
+
+def getReplayPath(game):
+    return os.path.join(REPLAYDIR, 'game-%s-%s.jsonl' % (time.strftime('%Y%m%d-%H%M%S'), game['seed']))
+
+
+def newRecorder(game, path=None):
+    # Start a log for game (which must have been made with a seed, see
+    # getSeed()) and return a recorder dict for the record*() functions.
+    # Lines are flushed as they're written, so the log is complete up to
+    # the last swap even if the game crashes.
+    if path == None:
+        path = getReplayPath(game)
+    directory = os.path.dirname(path)
+    if directory != '' and not os.path.isdir(directory):
+        os.makedirs(directory)
+    recorder = {'file': open(path, 'w'),
+                'path': path,
+                'swaps': 0,
+                'deducted': 0, # points deducted since the last line
+                'lastSnapshot': 0}
+    board = game['board']
+    writeLine(recorder, {'type': 'header',
+                         'version': REPLAYVERSION,
+                         'seed': game['seed'],
+                         'width': len(board),
+                         'height': len(board[0]),
+                         'numTEACHERTypes': game['numTEACHERTypes'],
+                         'numpyBoard': not isinstance(board, list)})
+    return recorder
+
+
+def writeLine(recorder, line):
+    recorder['file'].write(json.dumps(line, separators=(',', ':')) + '\n')
+    recorder['file'].flush()
+
+
+def recordDeduction(recorder, points=1):
+    recorder['deducted'] += points
+
+
+def recordSwap(recorder, firstXY, secondXY):
+    # firstXY and secondXY are dicts with keys x and y. Record every swap of
+    # two adjacent TEACHERs, even ones that don't make a match.
+    writeLine(recorder, {'type': 'swap',
+                         'first': [firstXY['x'], firstXY['y']],
+                         'second': [secondXY['x'], secondXY['y']],
+                         'deducted': recorder['deducted']})
+    recorder['swaps'] += 1
+    recorder['deducted'] = 0
+
+
+def recordMoveDone(recorder, game):
+    # Call once a swap's cascades have all been resolved. Writes a snapshot
+    # if it's time for one.
+    if recorder['swaps'] - recorder['lastSnapshot'] >= SNAPSHOTINTERVAL:
+        line = getSnapshot(game)
+        line['swaps'] = recorder['swaps']
+        writeLine(recorder, line)
+        recorder['lastSnapshot'] = recorder['swaps']
+
+
+def closeRecorder(recorder, game):
+    # Write the end line (with the points deducted after the last swap) and
+    # close the log. Safe to call more than once.
+    if recorder['file'].closed:
+        return
+    writeLine(recorder, {'type': 'end',
+                         'deducted': recorder['deducted'],
+                         'score': game['score'],
+                         'moves': game['moves'],
+                         'gameOver': isGameOver(game)})
+    recorder['file'].close()
+
+
+def getSnapshot(game):
+    # Everything needed to carry on playing game from where it is now.
+    board = game['board']
+    if not isinstance(board, list):
+        board = board.tolist() # NumPy board
+    version, state, gaussNext = game['random'].getstate()
+    return {'type': 'snapshot',
+            'board': board,
+            'random': [version, list(state), gaussNext],
+            'score': game['score'],
+            'moves': game['moves']}
+
+
+def restoreSnapshot(header, snapshot):
+    # Returns a game dict in the state saved by getSnapshot().
+    board = getBlankBoard(header['width'], header['height'], header['numpyBoard'])
+    for x in range(header['width']):
+        for y in range(header['height']):
+            board[x][y] = snapshot['board'][x][y]
+    rng = random.Random()
+    version, state, gaussNext = snapshot['random']
+    rng.setstate((version, tuple(state), gaussNext))
+    game = {'board': board,
+            'random': rng,
+            'seed': header['seed'],
+            'numTEACHERTypes': header['numTEACHERTypes'],
+            'score': snapshot['score'],
+            'moves': snapshot['moves'],
+            'hash': newBoardHash(board, header['numTEACHERTypes'])}
+    game['validMoves'] = getValidMovesForGame(game)
+    return game
+
+
+def loadLog(path):
+    # Returns a dict with the log's header, its list of swaps and
+    # snapshots, and its end line (None if the game never finished, e.g.
+    # because it crashed).
+    log = {'path': path, 'header': None, 'swaps': [], 'snapshots': [], 'end': None}
+    with open(path) as logFile:
+        for lineNum, text in enumerate(logFile, 1):
+            if text.strip() == '':
+                continue
+            line = json.loads(text)
+            if lineNum == 1:
+                if line.get('type') != 'header':
+                    raise ValueError('%s is not a Teacher Crush game log' % path)
+                if line['version'] > REPLAYVERSION:
+                    raise ValueError('%s was written by a newer version (log version %s)' % (path, line['version']))
+                line.setdefault('numpyBoard', False) # version 1 logs are all of list boards
+                log['header'] = line
+            elif line['type'] == 'swap':
+                log['swaps'].append(line)
+            elif line['type'] == 'snapshot':
+                log['snapshots'].append(line)
+            elif line['type'] == 'end':
+                log['end'] = line
+    if log['header'] == None:
+        raise ValueError('%s is empty' % path)
+    return log
+
+
+def startReplay(log):
+    # The game as it was before the first swap.
+    header = log['header']
+    return newGame(header['seed'], header['width'], header['height'], header['numTEACHERTypes'], header['numpyBoard'])
+
+
+def applyLoggedSwap(game, swap):
+    # Plays one swap line of a log: takes off the points deducted before it,
+    # then makes the swap. Returns the cascade steps, or None if the swap
+    # didn't make a match (just like playMove()).
+    deductPoints(game, swap['deducted'])
+    return playMove(game, {'x': swap['first'][0], 'y': swap['first'][1]},
+                          {'x': swap['second'][0], 'y': swap['second'][1]})
+
+
+def deductPoints(game, points):
+    # The game only deducts points while the score is above zero, so a log
+    # asking for more than that has been tampered with (or is from a bug).
+    if points > game['score']:
+        raise ValueError('%s points deducted from a score of %s' % (points, game['score']))
+    game['score'] -= points
+
+
+def seekReplay(log, swapNum):
+    # Returns the game as it was right after swap number swapNum (0 for the
+    # start of the game), starting from the latest snapshot before it.
+    swapNum = min(max(swapNum, 0), len(log['swaps']))
+    game = None
+    startSwap = 0
+    for snapshot in log['snapshots']:
+        if startSwap < snapshot['swaps'] <= swapNum:
+            startSwap = snapshot['swaps']
+            game = restoreSnapshot(log['header'], snapshot)
+    if game == None:
+        game = startReplay(log)
+    for swap in log['swaps'][startSwap:swapNum]:
+        applyLoggedSwap(game, swap)
+    return game
+
+
+def replayLog(log):
+    # Plays the whole log from the start and returns the final game
+    # (including the points deducted after the last swap).
+    game = startReplay(log)
+    for swap in log['swaps']:
+        applyLoggedSwap(game, swap)
+    if log['end'] != None:
+        deductPoints(game, log['end']['deducted'])
+    return game
+
+
+def validateLog(log):
+    # Replays the log from the start, without trusting its snapshots, and
+    # returns a list of messages about everything that doesn't add up: the
+    # snapshots and the final score have to match what the engine gets.
+    problems = []
+    snapshots = {}
+    for snapshot in log['snapshots']:
+        snapshots[snapshot['swaps']] = snapshot
+    game = startReplay(log)
+    for swapNum in range(1, len(log['swaps']) + 1):
+        try:
+            applyLoggedSwap(game, log['swaps'][swapNum - 1])
+        except ValueError as e:
+            problems.append('swap %s: %s' % (swapNum, e))
+        if swapNum in snapshots:
+            expected = getSnapshot(game)
+            for key in ('board', 'random', 'score', 'moves'):
+                if snapshots[swapNum][key] != expected[key]:
+                    problems.append('swap %s: snapshot %s is different from the replay' % (swapNum, key))
+
+    end = log['end']
+    if end == None:
+        problems.append('the log has no end line (the game may have crashed)')
+        return problems
+    try:
+        deductPoints(game, end['deducted'])
+    except ValueError as e:
+        problems.append('end: %s' % e)
+    if end['score'] != game['score']:
+        problems.append('final score is %s in the log but %s when replayed' % (end['score'], game['score']))
+    if end['moves'] != game['moves']:
+        problems.append('%s moves in the log but %s when replayed' % (end['moves'], game['moves']))
+    if end['gameOver'] != isGameOver(game):
+        problems.append('the log and the replay disagree on whether the game is over')
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay a recorded Teacher Crush game headlessly.')
+    parser.add_argument('log', help='game log (.jsonl) to replay')
+    parser.add_argument('--seek', type=int, help='print the board after this many swaps')
+    parser.add_argument('--validate', action='store_true', help='check the snapshots and final score against a full replay')
+    args = parser.parse_args(argv)
+
+    log = loadLog(args.log)
+    startTime = time.time()
+    if args.seek != None:
+        game = seekReplay(log, args.seek)
+        print('After swap %s: score %s, %s moves' % (min(max(args.seek, 0), len(log['swaps'])), game['score'], game['moves']))
+        for y in range(len(game['board'][0])):
+            print(' '.join(['%2s' % game['board'][x][y] for x in range(len(game['board']))]))
+        return 0
+
+    if args.validate:
+        problems = validateLog(log)
+        for problem in problems:
+            print('PROBLEM ' + problem)
+        print('%s swaps replayed in %.3fs, %s' % (len(log['swaps']), time.time() - startTime,
+                                                 'log is valid' if problems == [] else '%s problems' % len(problems)))
+        return 1 if problems else 0
+
+    game = replayLog(log)
+    print('%s swaps replayed in %.3fs: score %s, %s moves%s' % (len(log['swaps']), time.time() - startTime, game['score'],
+                                                              game['moves'], ', game over' if isGameOver(game) else ''))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
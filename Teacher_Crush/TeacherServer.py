@@ -0,0 +1,554 @@
+# A server for head-to-head Teacher Crush matches over a LAN, with any
+# number of spectators.
+#
+#   python TeacherServer.py --port 7733
+#   python TeacherServer.py --selftest --rooms 200 --spectators 2
+#
+# Players and spectators join a room by name. Each room has PLAYERSPERROOM
+# players, who get boards dealt from the same seed and MATCHMOVES swaps
+# each; the highest score when both are done wins. The server keeps the
+# real games (headless, with TeacherEngine.py) and checks every swap
+# itself, so clients only ever send the two spaces they want to swap.
+#
+# Messages are JSON objects, one per line, both ways. Clients send:
+#
+#   {"type": "join", "room": "lobby", "name": "al", "role": "player"}
+#   {"type": "swap", "first": [2, 3], "second": [2, 4]}
+#
+# (a join can also ask for a "queueSize" smaller than SENDQUEUESIZE, see
+# below, for a client that would rather get a snapshot than fall behind)
+#
+# and the server sends a 'snapshot' when a client joins (the room's
+# settings, who is playing and every board in full; a client that joined
+# as a player finds its own name among the players), then only what
+# changes: a 'move' for each swap made in the room, with the matches of
+# each cascade step and the spaces whose TEACHER is different afterwards
+# ("deltas", [x, y, TEACHER] lists), and 'joined', 'left', 'start',
+# 'badSwap', 'result' and 'error' messages.
+#
+# Each client has a queue of at most SENDQUEUESIZE messages waiting to be
+# sent to it, and the server waits for the socket to drain before sending
+# more (so the queue is what fills up when a client reads slowly). If the
+# queue overflows, the client is too far behind to catch up on deltas:
+# what's waiting is thrown away and replaced by a fresh snapshot. Nothing
+# a slow client does holds up the room or anyone else in it.
+#
+# --selftest runs a server and lots of stand-in clients (players that pick
+# random valid moves, spectators, and a slow spectator in some rooms) in
+# one process, and checks that every client's copy of the boards ended up
+# the same as the server's.
+
+import sys, time, json, random, socket, argparse, asyncio
+from TeacherEngine import *
+
+SERVERHOST = '0.0.0.0'
+SERVERPORT = 7733
+PLAYERSPERROOM = 2
+MATCHMOVES = 30 # swaps each player gets in a match
+SENDQUEUESIZE = 64 # messages waiting for a client before it gets a snapshot instead
+SENDBUFFERSIZE = 16384 # bytes the socket may buffer before the server waits for it
+MAXLINELENGTH = 4096 # bytes; clients never need to send more in one message
+SLOWQUEUESIZE = 4 # the queue the self test's slow spectators ask for, so they do fall behind
+
+
+def newServer(width=BOARDWIDTH, height=BOARDHEIGHT, numTEACHERTypes=NUMTEACHERIMAGES,
+              matchMoves=MATCHMOVES, sendQueueSize=SENDQUEUESIZE):
+    # The server's state: its rooms (by name), the settings new rooms get
+    # and counters for the self test.
+    return {'rooms': {},
+            'width': width,
+            'height': height,
+            'numTEACHERTypes': numTEACHERTypes,
+            'matchMoves': matchMoves,
+            'sendQueueSize': sendQueueSize,
+            'stats': {'clients': 0, 'rooms': 0, 'moves': 0, 'badSwaps': 0,
+                      'messages': 0, 'bytes': 0, 'snapshots': 0, 'overflows': 0}}
+
+
+def newRoom(server, name, seed=None):
+    if seed == None:
+        seed = random.SystemRandom().randrange(2 ** 32)
+    server['stats']['rooms'] += 1
+    return {'name': name,
+            'seed': seed,
+            'players': {}, # player name -> player dict, see addPlayer()
+            'clients': [], # everyone in the room, players and spectators
+            'started': False,
+            'finished': False,
+            'result': None} # the 'result' message, once the match is over
+
+
+def addPlayer(server, room, client):
+    # Deal the player's board. sentBoard is the board as the room's clients
+    # last heard it, which the deltas of the next move are worked out from.
+    # (A board can be dealt with no moves on it, which is game over.)
+    game = newGame(room['seed'], server['width'], server['height'], server['numTEACHERTypes'])
+    room['players'][client['name']] = {'client': client,
+                                       'game': game,
+                                       'sentBoard': copyBoard(game['board']),
+                                       'movesLeft': server['matchMoves'],
+                                       'done': isGameOver(game)}
+
+
+def getSnapshot(server, room):
+    # Everything about the room, with every board in full, for clients that
+    # are new or have fallen behind. Anything a client missed is in here.
+    players = {}
+    for name, player in room['players'].items():
+        board = player['game']['board']
+        if not isinstance(board, list):
+            board = board.tolist() # NumPy board, which json can't encode
+        players[name] = {'board': board,
+                         'score': player['game']['score'],
+                         'movesLeft': player['movesLeft'],
+                         'done': player['done']}
+    return {'type': 'snapshot',
+            'room': room['name'],
+            'width': server['width'],
+            'height': server['height'],
+            'numTEACHERTypes': server['numTEACHERTypes'],
+            'matchMoves': server['matchMoves'],
+            'players': players,
+            'started': room['started'],
+            'finished': room['finished'],
+            'result': room['result']}
+
+
+def encodeMessage(message):
+    return (json.dumps(message, separators=(',', ':')) + '\n').encode('utf-8')
+
+
+def sendMessage(server, client, message):
+    # Queue message (a dict) for client without waiting. A message sent to
+    # lots of clients can be passed already encoded, as bytes.
+    if isinstance(message, dict):
+        message = encodeMessage(message)
+    queue = client['queue']
+    if queue.qsize() >= client['queueSize']:
+        # Too slow to keep up: the waiting deltas are no use any more, so
+        # swap them for the boards as they are now. Everything sent after
+        # this follows on from the snapshot.
+        server['stats']['overflows'] += 1
+        while not queue.empty():
+            queue.get_nowait()
+        if client['room'] != None:
+            queue.put_nowait(encodeMessage(getSnapshot(server, client['room'])))
+            server['stats']['snapshots'] += 1
+        return
+    queue.put_nowait(message)
+
+
+def broadcast(server, room, message, skipClient=None):
+    # Send message to everyone in the room. It is encoded once, however
+    # many spectators there are.
+    data = encodeMessage(message)
+    for client in room['clients']:
+        if client is not skipClient:
+            sendMessage(server, client, data)
+
+
+async def writeMessages(server, client):
+    # Runs for as long as the client is connected, sending what's queued
+    # for it. drain() waits while the socket's buffer is full, which is
+    # what lets the queue fill up when the client isn't reading.
+    writer = client['writer']
+    try:
+        while True:
+            data = await client['queue'].get()
+            writer.write(data)
+            server['stats']['messages'] += 1
+            server['stats']['bytes'] += len(data)
+            await writer.drain()
+    except ConnectionError:
+        pass # disconnected; handleClient() cleans up
+
+
+async def handleClient(server, reader, writer):
+    # Runs for each connection: reads the client's messages until it
+    # disconnects.
+    sock = writer.get_extra_info('socket')
+    if sock != None:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SENDBUFFERSIZE)
+    writer.transport.set_write_buffer_limits(SENDBUFFERSIZE)
+    client = {'reader': reader,
+              'writer': writer,
+              'queue': asyncio.Queue(server['sendQueueSize']),
+              'queueSize': server['sendQueueSize'], # can be made smaller by joinRoom()
+              'name': None,
+              'role': None,
+              'room': None}
+    server['stats']['clients'] += 1
+    writerTask = asyncio.ensure_future(writeMessages(server, client))
+    try:
+        while True:
+            try:
+                line = await reader.readuntil(b'\n')
+            except asyncio.LimitOverrunError:
+                break # not a Teacher Crush client
+            except (asyncio.IncompleteReadError, ConnectionError):
+                break # disconnected
+            try:
+                message = json.loads(line.decode('utf-8'))
+            except ValueError:
+                sendMessage(server, client, {'type': 'error', 'message': 'messages must be JSON objects, one per line'})
+                continue
+            if not isinstance(message, dict):
+                sendMessage(server, client, {'type': 'error', 'message': 'messages must be JSON objects, one per line'})
+            elif message.get('type') == 'join':
+                joinRoom(server, client, message)
+            elif message.get('type') == 'swap':
+                makeSwap(server, client, message)
+            else:
+                sendMessage(server, client, {'type': 'error', 'message': 'unknown message type %r' % message.get('type')})
+    finally:
+        leaveRoom(server, client)
+        writerTask.cancel()
+        writer.close()
+
+
+def joinRoom(server, client, message):
+    # Put the client in the room named in message, creating the room if
+    # it's new. It joins as a player if it asked to and there's a free
+    # place, otherwise as a spectator.
+    if client['room'] != None:
+        sendMessage(server, client, {'type': 'error', 'message': 'already in room %s' % client['room']['name']})
+        return
+    roomName = str(message.get('room', 'lobby'))
+    name = str(message.get('name', 'guest'))
+    room = server['rooms'].get(roomName)
+    if room == None:
+        seed = message.get('seed')
+        room = newRoom(server, roomName, seed if isinstance(seed, int) else None)
+        server['rooms'][roomName] = room
+    takenNames = [otherClient['name'] for otherClient in room['clients']]
+    if name in takenNames:
+        sendMessage(server, client, {'type': 'error', 'message': 'the name %s is taken in room %s' % (name, roomName)})
+        return
+
+    client['name'] = name
+    client['room'] = room
+    queueSize = message.get('queueSize')
+    if isinstance(queueSize, int) and 1 <= queueSize < client['queueSize']:
+        client['queueSize'] = queueSize
+    if message.get('role') == 'player' and len(room['players']) < PLAYERSPERROOM and not room['started']:
+        client['role'] = 'player'
+        addPlayer(server, room, client)
+    else:
+        client['role'] = 'spectator'
+    room['clients'].append(client)
+
+    broadcast(server, room, {'type': 'joined', 'name': name, 'role': client['role']}, client)
+    if client['role'] == 'player':
+        # Everyone needs the new player's board, so they all get a snapshot.
+        broadcast(server, room, getSnapshot(server, room))
+        server['stats']['snapshots'] += len(room['clients'])
+    else:
+        sendMessage(server, client, getSnapshot(server, room))
+        server['stats']['snapshots'] += 1
+    if len(room['players']) == PLAYERSPERROOM and not room['started']:
+        room['started'] = True
+        broadcast(server, room, {'type': 'start', 'players': sorted(room['players'])})
+        if all([player['done'] for player in room['players'].values()]):
+            finishMatch(server, room)
+
+
+def leaveRoom(server, client):
+    room = client['room']
+    if room == None:
+        return
+    client['room'] = None
+    room['clients'].remove(client)
+    broadcast(server, room, {'type': 'left', 'name': client['name']})
+    if client['role'] == 'player' and not room['finished']:
+        # A player walking out of a match loses it.
+        room['players'][client['name']]['done'] = True
+        if room['started']:
+            finishMatch(server, room, client['name'])
+        else:
+            del room['players'][client['name']]
+    if room['clients'] == [] and server['rooms'].get(room['name']) is room:
+        del server['rooms'][room['name']]
+
+
+def getSpace(message, key, game):
+    # Returns the {'x': x, 'y': y} dict for message[key], or None if it
+    # isn't a space on the game's board.
+    space = message.get(key)
+    if not isinstance(space, list) or len(space) != 2:
+        return None
+    x, y = space
+    if not isinstance(x, int) or not isinstance(y, int):
+        return None
+    if not (0 <= x < len(game['board']) and 0 <= y < len(game['board'][0])):
+        return None
+    return {'x': x, 'y': y}
+
+
+def makeSwap(server, client, message):
+    # A player's swap: check it, play it out on the player's game and tell
+    # the room what changed.
+    room = client['room']
+    if client['role'] != 'player' or room == None:
+        sendMessage(server, client, {'type': 'badSwap', 'reason': 'spectators can\'t swap'})
+        return
+    player = room['players'][client['name']]
+    game = player['game']
+    if not room['started'] or room['finished'] or player['done']:
+        sendMessage(server, client, {'type': 'badSwap', 'reason': 'not playing'})
+        return
+    firstXY = getSpace(message, 'first', game)
+    secondXY = getSpace(message, 'second', game)
+    if firstXY == None or secondXY == None:
+        sendMessage(server, client, {'type': 'badSwap', 'reason': 'not a space on the board'})
+        return
+    firstSwappingTEACHER, secondSwappingTEACHER = getSwappingTEACHERs(game['board'], firstXY, secondXY)
+    if firstSwappingTEACHER == None:
+        sendMessage(server, client, {'type': 'badSwap', 'reason': 'not adjacent'})
+        server['stats']['badSwaps'] += 1
+        return
+    if not applySwap(game, firstXY, secondXY):
+        sendMessage(server, client, {'type': 'badSwap', 'reason': 'no match'})
+        server['stats']['badSwaps'] += 1
+        return
+
+    # Play out the cascades (without the falling TEACHERs, which clients
+    # can work out for themselves) and note which spaces they touched.
+    swappedSpaces = [(firstXY['x'], firstXY['y']), (secondXY['x'], secondXY['y'])]
+    changedSpaces = set(swappedSpaces)
+    cascades = []
+    for event in iterCascades(game, swappedSpaces, False):
+        if event['type'] == 'match':
+            cascades.append({'sets': event['matchedTEACHERs'], 'scoreAdd': event['scoreAdd']})
+            changedSpaces.update(getCascadeChangedSpaces(event['matchedTEACHERs']))
+    player['movesLeft'] -= 1
+    if player['movesLeft'] == 0 or isGameOver(game):
+        player['done'] = True
+    server['stats']['moves'] += 1
+
+    broadcast(server, room, {'type': 'move',
+                             'player': client['name'],
+                             'swap': [list(swappedSpaces[0]), list(swappedSpaces[1])],
+                             'cascades': cascades,
+                             'deltas': getDeltas(game['board'], player['sentBoard'], changedSpaces),
+                             'score': game['score'],
+                             'movesLeft': player['movesLeft'],
+                             'done': player['done']})
+
+    if all([otherPlayer['done'] for otherPlayer in room['players'].values()]):
+        finishMatch(server, room)
+
+
+def getDeltas(board, sentBoard, changedSpaces):
+    # Returns [x, y, TEACHER] for each of changedSpaces that is different
+    # from sentBoard, and brings sentBoard up to date. (int() because a
+    # NumPy board holds NumPy ints, which json can't encode.)
+    deltas = []
+    for x, y in sorted(changedSpaces):
+        if board[x][y] != sentBoard[x][y]:
+            sentBoard[x][y] = board[x][y]
+            deltas.append([x, y, int(board[x][y])])
+    return deltas
+
+
+def finishMatch(server, room, forfeitedBy=None):
+    # Tell the room who won. The hash of each board lets clients check
+    # that their copies ended up right.
+    room['finished'] = True
+    scores = {}
+    hashes = {}
+    for name, player in room['players'].items():
+        scores[name] = player['game']['score']
+        hashes[name] = player['game']['hash']['value']
+    if forfeitedBy != None:
+        winners = [name for name in scores if name != forfeitedBy]
+    else:
+        bestScore = max(scores.values())
+        winners = sorted([name for name in scores if scores[name] == bestScore])
+    room['result'] = {'type': 'result', 'scores': scores, 'winners': winners,
+                      'forfeitedBy': forfeitedBy, 'hashes': hashes}
+    broadcast(server, room, room['result'])
+
+
+async def startServer(server, host=SERVERHOST, port=SERVERPORT):
+    # Returns the asyncio server, already listening.
+    return await asyncio.start_server(lambda reader, writer: handleClient(server, reader, writer),
+                                      host, port, limit=MAXLINELENGTH)
+
+
+# The rest of this file is the self test: stand-in clients that talk to a
+# server over real sockets, the same way a game would.
+
+async def runStandIn(host, port, roomName, name, role, rng, readDelay=0.0, receiveBuffer=None, welcomed=None,
+                     queueSize=None):
+    # Joins roomName and follows the match to the end, keeping its own copy
+    # of every board from the snapshots and deltas. Players make a random
+    # valid move on their copy of their board whenever they can. Waits
+    # readDelay seconds before reading each message (a slow client, which
+    # can ask for a small queueSize), and sets the asyncio.Event welcomed
+    # once it's in the room. Returns a dict of what happened.
+    if receiveBuffer != None:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, receiveBuffer)
+        sock.setblocking(False)
+        await asyncio.get_event_loop().sock_connect(sock, (host, port))
+        reader, writer = await asyncio.open_connection(sock=sock, limit=2 ** 20)
+    else:
+        reader, writer = await asyncio.open_connection(host, port, limit=2 ** 20)
+
+    def send(message):
+        writer.write(encodeMessage(message))
+
+    join = {'type': 'join', 'room': roomName, 'name': name, 'role': role}
+    if queueSize != None:
+        join['queueSize'] = queueSize
+    send(join)
+    standIn = {'name': name, 'role': role, 'boards': {}, 'done': False, 'snapshots': 0, 'moves': 0,
+               'badSwaps': 0, 'result': None, 'mismatches': []}
+    header = None
+    waitingForMove = False
+    while True:
+        if readDelay > 0:
+            await asyncio.sleep(readDelay)
+        line = await reader.readline()
+        if line == b'':
+            break
+        message = json.loads(line.decode('utf-8'))
+        if message['type'] == 'snapshot':
+            if header == None:
+                header = message # the room's settings
+                if name not in message['players']:
+                    standIn['role'] = 'spectator' # no place left to play
+                if welcomed != None:
+                    welcomed.set()
+            standIn['snapshots'] += 1
+            standIn['boards'] = dict([(playerName, info['board']) for playerName, info in message['players'].items()])
+            if name in message['players']:
+                # The reply to a swap may have been dropped for this.
+                waitingForMove = False
+                standIn['done'] = message['players'][name]['done']
+        elif message['type'] == 'move':
+            standIn['moves'] += 1
+            board = standIn['boards'][message['player']]
+            for x, y, TEACHER in message['deltas']:
+                board[x][y] = TEACHER
+            if message['player'] == name:
+                waitingForMove = False
+                standIn['done'] = message['done']
+        elif message['type'] == 'badSwap':
+            standIn['badSwaps'] += 1
+            waitingForMove = False
+        if message['type'] == 'snapshot' and message['result'] != None:
+            message = message['result'] # fell behind (or came in late), and missed the end
+        if message['type'] == 'result':
+            standIn['result'] = message
+            for playerName, boardHash in message['hashes'].items():
+                board = standIn['boards'].get(playerName)
+                if board == None or newBoardHash(board, header['numTEACHERTypes'])['value'] != boardHash:
+                    standIn['mismatches'].append(playerName)
+            break
+
+        if standIn['role'] == 'player' and not standIn['done'] and not waitingForMove and name in standIn['boards'] and \
+           (message['type'] in ('start', 'move', 'badSwap') or (message['type'] == 'snapshot' and message['started'])):
+            validMoves = sorted(getValidMoves(standIn['boards'][name]))
+            if validMoves != []:
+                first, second = rng.choice(validMoves)
+                send({'type': 'swap', 'first': list(first), 'second': list(second)})
+                waitingForMove = True
+    writer.close()
+    return standIn
+
+
+async def runSelfTest(server, numRooms, numSpectators, slowEvery):
+    asyncioServer = await startServer(server, '127.0.0.1', 0)
+    port = asyncioServer.sockets[0].getsockname()[1]
+    rng = random.Random(0)
+    tasks = []
+    startTime = time.time()
+    # The spectators go in first (so none of them turns up to an empty room
+    # after a short match), then the players.
+    welcomedEvents = []
+    for roomNum in range(numRooms):
+        roomName = 'room%s' % roomNum
+        for spectatorNum in range(numSpectators):
+            welcomedEvents.append(asyncio.Event())
+            tasks.append(asyncio.ensure_future(runStandIn('127.0.0.1', port, roomName, 'spectator%s' % spectatorNum,
+                                                          'spectator', None, 0.0, None, welcomedEvents[-1])))
+        if slowEvery > 0 and roomNum % slowEvery == 0:
+            welcomedEvents.append(asyncio.Event())
+            tasks.append(asyncio.ensure_future(runStandIn('127.0.0.1', port, roomName, 'slow', 'spectator',
+                                                          None, 0.005, 4096, welcomedEvents[-1], SLOWQUEUESIZE)))
+    for welcomed in welcomedEvents:
+        await welcomed.wait()
+    for roomNum in range(numRooms):
+        for playerNum in range(PLAYERSPERROOM):
+            tasks.append(asyncio.ensure_future(runStandIn('127.0.0.1', port, 'room%s' % roomNum, 'player%s' % playerNum,
+                                                          'player', random.Random(rng.random()))))
+    standIns = await asyncio.gather(*tasks)
+    elapsed = time.time() - startTime
+    asyncioServer.close()
+    await asyncioServer.wait_closed()
+    return standIns, elapsed
+
+
+def selfTest(server, numRooms, numSpectators, slowEvery):
+    # Plays matches on server (from newServer()) between stand-in clients.
+    # Returns 0 if every stand-in saw its match through and has the right
+    # boards at the end (and, if there were slow spectators, some of them
+    # fell behind and caught up from a snapshot), otherwise 1.
+    standIns, elapsed = asyncio.run(runSelfTest(server, numRooms, numSpectators, slowEvery))
+    stats = server['stats']
+    problems = 0
+    for standIn in standIns:
+        if standIn['result'] == None:
+            print('PROBLEM %s never got a result' % standIn['name'])
+            problems += 1
+        elif standIn['mismatches'] != []:
+            print('PROBLEM %s has the wrong boards for %s' % (standIn['name'], ', '.join(standIn['mismatches'])))
+            problems += 1
+    print('%s rooms, %s clients: %s moves in %.1fs (%.0f moves/s), %s messages (%.1f MB), %s bad swaps' %
+          (stats['rooms'], stats['clients'], stats['moves'], elapsed, stats['moves'] / elapsed,
+           stats['messages'], stats['bytes'] / 1048576.0, stats['badSwaps']))
+    if slowEvery > 0 and stats['overflows'] == 0:
+        print('PROBLEM no slow spectator fell behind, so catching up from a snapshot went untested')
+        problems += 1
+    print('%s snapshots sent, %s of them to clients that fell behind' % (stats['snapshots'], stats['overflows']))
+    print('self test %s' % ('passed' if problems == 0 else 'FAILED with %s problems' % problems))
+    return 1 if problems else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve head-to-head Teacher Crush matches.')
+    parser.add_argument('--host', default=SERVERHOST)
+    parser.add_argument('--port', type=int, default=SERVERPORT)
+    parser.add_argument('--width', type=int, default=BOARDWIDTH)
+    parser.add_argument('--height', type=int, default=BOARDHEIGHT)
+    parser.add_argument('--types', type=int, default=NUMTEACHERIMAGES, help='number of TEACHER types')
+    parser.add_argument('--moves', type=int, default=MATCHMOVES, help='swaps each player gets in a match')
+    parser.add_argument('--queue-size', type=int, default=SENDQUEUESIZE, help='messages queued for a client before it gets a snapshot instead')
+    parser.add_argument('--selftest', action='store_true', help='play matches between stand-in clients and check them')
+    parser.add_argument('--rooms', type=int, default=100, help='rooms for --selftest')
+    parser.add_argument('--spectators', type=int, default=2, help='spectators in each room for --selftest')
+    parser.add_argument('--slow-every', type=int, default=10, help='put a slow spectator in every Nth room for --selftest (0 for none)')
+    args = parser.parse_args(argv)
+
+    if args.types < 5:
+        parser.error('the game needs at least 5 types of TEACHERs')
+    server = newServer(args.width, args.height, args.types, args.moves, args.queue_size)
+    if args.selftest:
+        return selfTest(server, args.rooms, args.spectators, args.slow_every)
+
+    async def serve():
+        asyncioServer = await startServer(server, args.host, args.port)
+        print('Serving Teacher Crush on %s:%s' % (args.host, args.port))
+        async with asyncioServer:
+            await asyncioServer.serve_forever()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
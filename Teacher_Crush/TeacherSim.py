@@ -0,0 +1,180 @@
+# Plays lots of Teacher Crush games headlessly with bots, for tuning the
+# number of TEACHER types, the board size and DEDUCTSPEED. Games are spread
+# over a pool of processes and each finished game is written out as one
+# CSV or JSON Lines row as soon as it's done.
+#
+#   python TeacherSim.py --games 100000 --policy greedy --output results.csv
+#
+# Every game gets its own seed, made from --seed and the game's number, so
+# any game can be played again (with playOneGame()) whatever the number of
+# workers was.
+
+import sys, time, random, json, csv, argparse, multiprocessing
+from TeacherEngine import *
+
+SECONDSPERMOVE = 1.5 # how long the simulated player thinks before each move
+MAXMOVES = 1000 # give up on games that go on longer than this
+
+LOOKAHEADSAMPLES = 3 # refills tried for each move by the lookahead policy
+
+RESULTFIELDS = ['game', 'seed', 'policy', 'width', 'height', 'numTEACHERTypes',
+                'score', 'moves', 'cascades', 'maxCascadeDepth', 'pointsDeducted', 'gameOver']
+
+
+def chooseRandomMove(game, rng):
+    return rng.choice(sorted(game['validMoves']))
+
+
+def chooseGreedyMove(game, rng):
+    # Pick the move that scores the most right away (ties broken at random).
+    bestScore = None
+    bestMoves = []
+    for move in sorted(game['validMoves']):
+        score = getSwapScore(game, move)
+        if bestScore == None or score > bestScore:
+            bestScore = score
+            bestMoves = [move]
+        elif score == bestScore:
+            bestMoves.append(move)
+    return rng.choice(bestMoves)
+
+
+def chooseLookaheadMove(game, rng):
+    # Pick the move with the best total of its own points plus the best
+    # greedy move after it, averaged over a few guesses of the refills.
+    bestScore = None
+    bestMove = None
+    for move in sorted(game['validMoves']):
+        total = 0
+        for i in range(LOOKAHEADSAMPLES):
+            gameCopy = copyGame(game, rng.random())
+            playMove(gameCopy, {'x': move[0][0], 'y': move[0][1]}, {'x': move[1][0], 'y': move[1][1]})
+            total += gameCopy['score'] - game['score']
+            if not isGameOver(gameCopy):
+                total += max([getSwapScore(gameCopy, nextMove) for nextMove in gameCopy['validMoves']])
+        if bestScore == None or total > bestScore:
+            bestScore = total
+            bestMove = move
+    return bestMove
+
+
+POLICIES = {'random': chooseRandomMove,
+            'greedy': chooseGreedyMove,
+            'lookahead': chooseLookaheadMove}
+
+
+def getGameSeed(baseSeed, gameNum):
+    return '%s-%s' % (baseSeed, gameNum)
+
+
+def playOneGame(policy, seed, width=BOARDWIDTH, height=BOARDHEIGHT, numTEACHERTypes=NUMTEACHERIMAGES,
+                deductSpeed=DEDUCTSPEED, secondsPerMove=SECONDSPERMOVE, maxMoves=MAXMOVES):
+    # Plays a game until no move is left (or maxMoves is reached) and returns
+    # a dict of stats about it. While the player thinks, the score drops by a
+    # point every deductSpeed seconds, like in runGame().
+    game = newGame(seed, width, height, numTEACHERTypes)
+    rng = random.Random(seed) # the bot's own randomness, apart from the board's
+    chooseMove = POLICIES[policy]
+    cascades = 0
+    maxCascadeDepth = 0
+    pointsDeducted = 0
+    idleTime = 0.0
+    while not isGameOver(game) and game['moves'] < maxMoves:
+        idleTime += secondsPerMove
+        while idleTime >= deductSpeed:
+            idleTime -= deductSpeed
+            if game['score'] > 0:
+                game['score'] -= 1
+                pointsDeducted += 1
+
+        move = chooseMove(game, rng)
+        cascadeSteps = playMove(game, {'x': move[0][0], 'y': move[0][1]}, {'x': move[1][0], 'y': move[1][1]})
+        cascades += len(cascadeSteps)
+        maxCascadeDepth = max(maxCascadeDepth, len(cascadeSteps))
+
+    return {'seed': seed,
+            'policy': policy,
+            'width': width,
+            'height': height,
+            'numTEACHERTypes': numTEACHERTypes,
+            'score': game['score'],
+            'moves': game['moves'],
+            'cascades': cascades,
+            'maxCascadeDepth': maxCascadeDepth,
+            'pointsDeducted': pointsDeducted,
+            'gameOver': isGameOver(game)}
+
+
+def playGameTask(task):
+    # Runs in a worker process. task is (gameNum, playOneGame() arguments).
+    gameNum, kwargs = task
+    result = playOneGame(**kwargs)
+    result['game'] = gameNum
+    return result
+
+
+def getTasks(args):
+    for gameNum in range(args.games):
+        yield (gameNum, {'policy': args.policy,
+                         'seed': getGameSeed(args.seed, gameNum),
+                         'width': args.width,
+                         'height': args.height,
+                         'numTEACHERTypes': args.types,
+                         'deductSpeed': args.deduct_speed,
+                         'secondsPerMove': args.seconds_per_move,
+                         'maxMoves': args.max_moves})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Simulate Teacher Crush games with bots.')
+    parser.add_argument('--games', type=int, default=1000, help='number of games to play')
+    parser.add_argument('--policy', choices=sorted(POLICIES), default='greedy', help='how the bot picks its moves')
+    parser.add_argument('--width', type=int, default=BOARDWIDTH)
+    parser.add_argument('--height', type=int, default=BOARDHEIGHT)
+    parser.add_argument('--types', type=int, default=NUMTEACHERIMAGES, help='number of TEACHER types')
+    parser.add_argument('--deduct-speed', type=float, default=DEDUCTSPEED)
+    parser.add_argument('--seconds-per-move', type=float, default=SECONDSPERMOVE)
+    parser.add_argument('--max-moves', type=int, default=MAXMOVES)
+    parser.add_argument('--seed', default='0', help='base seed; game N uses "<seed>-N"')
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count(), help='processes to play games in')
+    parser.add_argument('--output', default='-', help='.csv or .jsonl file to write results to (default: JSON Lines on stdout)')
+    args = parser.parse_args(argv)
+    if args.types < 5:
+        parser.error('the game needs at least 5 types of TEACHERs')
+
+    if args.output == '-':
+        outFile = sys.stdout
+    else:
+        outFile = open(args.output, 'w', newline='')
+    if args.output.endswith('.csv'):
+        writer = csv.DictWriter(outFile, fieldnames=RESULTFIELDS)
+        writer.writeheader()
+        writeResult = writer.writerow
+    else:
+        writeResult = lambda result: outFile.write(json.dumps(result, sort_keys=True) + '\n')
+
+    startTime = time.time()
+    totalScore = 0
+    totalMoves = 0
+    pool = multiprocessing.Pool(args.workers)
+    try:
+        # imap_unordered hands out games in chunks and yields each result as
+        # soon as it is ready, so results stream out while games are played.
+        chunkSize = max(1, min(100, args.games // (args.workers * 4)))
+        for result in pool.imap_unordered(playGameTask, getTasks(args), chunkSize):
+            writeResult(result)
+            totalScore += result['score']
+            totalMoves += result['moves']
+    finally:
+        pool.terminate()
+        if outFile is not sys.stdout:
+            outFile.close()
+
+    elapsed = time.time() - startTime
+    if args.games > 0:
+        sys.stderr.write('%s games in %.1fs (%.0f games/s), average score %.1f, average moves %.1f\n' %
+                         (args.games, elapsed, args.games / elapsed, totalScore / float(args.games), totalMoves / float(args.games)))
+
+
+if __name__ == '__main__':
+    main()
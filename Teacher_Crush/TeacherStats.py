@@ -0,0 +1,408 @@
+# Scores and statistics of the games played, kept in an SQLite database.
+#
+# Every game gets a row in the games table (its board, final score, moves,
+# deepest cascade and how long it was played for) and every swap gets a
+# row in the moves table (when it was made, whether it matched, how deep
+# its cascade went and how many points it got). Queries:
+#
+#   python TeacherStats.py --top 10
+#   python TeacherStats.py --top 10 --width 8 --height 8
+#
+# The game never waits for the database. The record*() functions only
+# put rows on a queue. A writer thread takes them off it and writes them
+# in batches. A batch is up to BATCHSIZE rows, or what arrives within
+# BATCHTIME seconds of its first row, and is written in one transaction.
+# The database is in WAL mode, so reading it (getLeaderboard(), and so
+# on) doesn't block the writer, and the writer doesn't block readers. If
+# the database can't be opened or written to, the rows are dropped and
+# the error is kept in store['error']; the game plays on either way.
+#
+# Run this file with --benchmark to time recording and queries on a
+# scratch database.
+
+import os, sys, time, queue, random, sqlite3, argparse, threading
+from TeacherEngine import isGameOver
+
+STATSPATH = 'stats.sqlite3' # where the game keeps its statistics
+STATSVERSION = 1 # kept in the database's user_version
+
+BATCHSIZE = 500 # most rows written in one transaction
+BATCHTIME = 2.0 # seconds the writer waits for more rows before writing a batch
+
+SCHEMA = ['''CREATE TABLE IF NOT EXISTS games (
+                 id INTEGER PRIMARY KEY,
+                 seed INTEGER,
+                 width INTEGER NOT NULL,
+                 height INTEGER NOT NULL,
+                 numTEACHERTypes INTEGER NOT NULL,
+                 autoplay INTEGER NOT NULL, -- 1 if the computer made the moves
+                 startTime REAL NOT NULL, -- seconds since the epoch
+                 seconds REAL, -- how long the game was played for
+                 score INTEGER,
+                 moves INTEGER, -- swaps that made a match
+                 badSwaps INTEGER, -- swaps that didn't
+                 cascadeSteps INTEGER, -- cascade steps of all the moves together
+                 maxCascadeDepth INTEGER,
+                 pointsDeducted INTEGER, -- points lost to waiting
+                 gameOver INTEGER) -- 0 if the game was left before it ended''',
+          '''CREATE TABLE IF NOT EXISTS moves (
+                 gameId INTEGER NOT NULL REFERENCES games(id),
+                 moveNum INTEGER NOT NULL, -- counts bad swaps too
+                 seconds REAL NOT NULL, -- since the start of the game
+                 firstX INTEGER NOT NULL,
+                 firstY INTEGER NOT NULL,
+                 secondX INTEGER NOT NULL,
+                 secondY INTEGER NOT NULL,
+                 matched INTEGER NOT NULL,
+                 cascadeDepth INTEGER NOT NULL, -- 0 for a bad swap
+                 TEACHERsMatched INTEGER NOT NULL,
+                 points INTEGER NOT NULL,
+                 PRIMARY KEY (gameId, moveNum))''',
+          # The leaderboards, overall and for each kind of board, are read
+          # straight off these in score order, and the average combo
+          # lengths are worked out from them without reading the table.
+          'CREATE INDEX IF NOT EXISTS gamesByScore ON games (autoplay, score DESC, moves, cascadeSteps)',
+          'CREATE INDEX IF NOT EXISTS gamesByBoardAndScore ON games (width, height, numTEACHERTypes, autoplay, score DESC, moves, cascadeSteps)']
+
+# The values of each kind of row, in the order they're queued in (see
+# queueRow()). A game's 'end' row fills in the rest of its games row.
+COLUMNS = {'games': ['seed', 'width', 'height', 'numTEACHERTypes', 'autoplay', 'startTime'],
+           'moves': ['moveNum', 'seconds', 'firstX', 'firstY', 'secondX', 'secondY',
+                     'matched', 'cascadeDepth', 'TEACHERsMatched', 'points'],
+           'end': ['autoplay', 'seconds', 'score', 'moves', 'badSwaps', 'cascadeSteps', 'maxCascadeDepth', 'pointsDeducted', 'gameOver']}
+INSERTGAME = 'INSERT INTO games (%s) VALUES (%s)' % (', '.join(COLUMNS['games']), ', '.join(['?'] * len(COLUMNS['games'])))
+INSERTMOVE = 'INSERT INTO moves (gameId, %s) VALUES (?, %s)' % (', '.join(COLUMNS['moves']), ', '.join(['?'] * len(COLUMNS['moves'])))
+ENDGAME = 'UPDATE games SET %s WHERE id = ?' % ', '.join(['%s = ?' % column for column in COLUMNS['end']])
+
+
+def openStats(path=STATSPATH):
+    # Start the writer thread for the database at path (made if it isn't
+    # there) and return a store dict for startGameStats() and closeStats().
+    # The database is opened in the writer thread, so this doesn't wait
+    # for the disk.
+    store = {'path': path,
+             'queue': queue.Queue(), # never full, so putting rows on it never waits
+             'nextGameKey': 0,
+             'stats': {'rows': 0, 'batches': 0, 'dropped': 0, 'writeTime': 0.0},
+             'error': None}
+    thread = threading.Thread(target=writeStats, args=(store,), name='stats writer')
+    thread.daemon = True
+    thread.start()
+    store['thread'] = thread
+    return store
+
+
+def closeStats(store, timeout=5.0):
+    # Write whatever is still queued and close the database. Waits for the
+    # writer at most timeout seconds. Safe to call more than once.
+    if store['thread'].is_alive():
+        store['queue'].put(None)
+        store['thread'].join(timeout)
+
+
+def connect(path):
+    connection = sqlite3.connect(path)
+    connection.execute('PRAGMA journal_mode = WAL')
+    connection.execute('PRAGMA synchronous = NORMAL') # WAL commits don't need to wait for fsync
+    return connection
+
+
+def createTables(connection):
+    version = connection.execute('PRAGMA user_version').fetchone()[0]
+    if version > STATSVERSION:
+        raise sqlite3.DatabaseError('written by a newer version (stats version %s)' % version)
+    with connection:
+        for statement in SCHEMA:
+            connection.execute(statement)
+        connection.execute('PRAGMA user_version = %d' % STATSVERSION)
+
+
+def writeStats(store):
+    # Runs in the writer thread until closeStats() puts None on the queue.
+    # Rows on the queue are (table or 'end', game key, values) tuples.
+    try:
+        connection = connect(store['path'])
+        createTables(connection)
+    except sqlite3.Error as e:
+        connection = None
+        store['error'] = '%s: %s' % (store['path'], e)
+
+    gameIds = {} # game key (see startGameStats()) -> id of its games row
+    closing = False
+    while not closing:
+        # Wait for a row, then gather the batch that comes with it.
+        batch = [store['queue'].get()]
+        deadline = time.time() + BATCHTIME
+        while batch[-1] != None and len(batch) < BATCHSIZE:
+            try:
+                batch.append(store['queue'].get(timeout=max(0.0, deadline - time.time())))
+            except queue.Empty:
+                break
+        if batch[-1] == None:
+            closing = True
+            batch.pop()
+        if batch == []:
+            continue
+        if connection == None:
+            store['stats']['dropped'] += len(batch)
+            continue
+
+        startTime = time.perf_counter()
+        batchGameIds = dict(gameIds) # a batch that fails is rolled back, ids and all
+        try:
+            with connection: # one transaction for the whole batch
+                writeBatch(connection, batchGameIds, batch)
+        except sqlite3.Error as e:
+            store['error'] = '%s: %s' % (store['path'], e)
+            store['stats']['dropped'] += len(batch)
+            continue
+        gameIds = batchGameIds
+        store['stats']['writeTime'] += time.perf_counter() - startTime
+        store['stats']['rows'] += len(batch)
+        store['stats']['batches'] += 1
+    if connection != None:
+        connection.close()
+
+
+def writeBatch(connection, gameIds, batch):
+    # The writer thread shares the GIL with the game loop, so it does as
+    # little as it can in Python: the rows come ready to write, and all the
+    # moves go to SQLite in one executemany().
+    moveRows = []
+    for table, key, values in batch:
+        if table == 'games':
+            gameIds[key] = connection.execute(INSERTGAME, values).lastrowid
+        elif key not in gameIds:
+            continue # the game's row was in a batch that couldn't be written
+        elif table == 'moves':
+            moveRows.append((gameIds[key],) + values)
+        else:
+            connection.execute(ENDGAME, values + (gameIds.pop(key),))
+    connection.executemany(INSERTMOVE, moveRows)
+
+
+def startGameStats(store, game, autoplay=False):
+    # Start recording game (a game dict from newGame()). Returns a game
+    # stats dict for the record*() functions.
+    gameStats = {'store': store,
+                 'key': store['nextGameKey'],
+                 'startTime': time.time(),
+                 'moves': 0,
+                 'badSwaps': 0,
+                 'cascadeSteps': 0,
+                 'maxCascadeDepth': 0,
+                 'pointsScored': 0,
+                 'autoplay': autoplay,
+                 'swap': None, # the swap being played out, see recordSwapStats()
+                 'ended': False}
+    store['nextGameKey'] += 1
+    board = game['board']
+    queueRow(gameStats, 'games', {'seed': game['seed'],
+                                  'width': len(board),
+                                  'height': len(board[0]),
+                                  'numTEACHERTypes': game['numTEACHERTypes'],
+                                  'autoplay': int(autoplay),
+                                  'startTime': gameStats['startTime']})
+    return gameStats
+
+
+def queueRow(gameStats, table, values):
+    # values is a dict with the table's COLUMNS.
+    row = tuple([values[column] for column in COLUMNS[table]])
+    gameStats['store']['queue'].put((table, gameStats['key'], row))
+
+
+def recordSwapStats(gameStats, game, firstXY, secondXY, autoplay=False):
+    # Call when a swap of two adjacent TEACHERs (dicts with keys x and y)
+    # starts, then recordMoveDoneStats() once its cascades are resolved.
+    # autoplay is True if the computer made the swap; a game with any of
+    # those in it is counted as the computer's.
+    gameStats['autoplay'] = gameStats['autoplay'] or autoplay
+    gameStats['swap'] = {'seconds': time.time() - gameStats['startTime'],
+                         'firstX': firstXY['x'],
+                         'firstY': firstXY['y'],
+                         'secondX': secondXY['x'],
+                         'secondY': secondXY['y'],
+                         'score': game['score']}
+
+
+def recordMoveDoneStats(gameStats, game, cascadeSteps):
+    # cascadeSteps is what resolveCascades() returns for the swap, or None
+    # if it didn't make a match.
+    swap = gameStats['swap']
+    if swap == None:
+        return
+    gameStats['swap'] = None
+    points = game['score'] - swap.pop('score')
+    if cascadeSteps == None:
+        cascadeSteps = []
+        gameStats['badSwaps'] += 1
+    else:
+        gameStats['moves'] += 1
+        gameStats['cascadeSteps'] += len(cascadeSteps)
+        gameStats['maxCascadeDepth'] = max(gameStats['maxCascadeDepth'], len(cascadeSteps))
+        gameStats['pointsScored'] += points
+    swap['moveNum'] = gameStats['moves'] + gameStats['badSwaps']
+    swap['matched'] = int(cascadeSteps != [])
+    swap['cascadeDepth'] = len(cascadeSteps)
+    swap['TEACHERsMatched'] = sum([len(TEACHERSet) for matchedTEACHERs in cascadeSteps for TEACHERSet in matchedTEACHERs])
+    swap['points'] = points
+    queueRow(gameStats, 'moves', swap)
+
+
+def endGameStats(gameStats, game):
+    # Record how the game finished. Safe to call more than once. A swap
+    # that's still being played out has to be finished (and passed to
+    # recordMoveDoneStats()) first, or the game's totals wouldn't agree
+    # with its moves.
+    if gameStats['ended']:
+        return
+    if gameStats['swap'] != None:
+        raise ValueError('game %s ended during a swap' % gameStats['key'])
+    gameStats['ended'] = True
+    queueRow(gameStats, 'end', {'autoplay': int(gameStats['autoplay']),
+                                'seconds': time.time() - gameStats['startTime'],
+                                'score': game['score'],
+                                'moves': gameStats['moves'],
+                                'badSwaps': gameStats['badSwaps'],
+                                'cascadeSteps': gameStats['cascadeSteps'],
+                                'maxCascadeDepth': gameStats['maxCascadeDepth'],
+                                'pointsDeducted': gameStats['pointsScored'] - game['score'],
+                                'gameOver': int(isGameOver(game))})
+
+
+def getBoardFilter(width=None, height=None, numTEACHERTypes=None, autoplay=False):
+    # A WHERE clause and its values for the games on one kind of board (or
+    # any board, for None). With autoplay False only games a person played
+    # are counted, True only the computer's, and None both.
+    conditions = []
+    values = []
+    for column, value in (('width', width), ('height', height), ('numTEACHERTypes', numTEACHERTypes)):
+        if value != None:
+            conditions.append('%s = ?' % column)
+            values.append(value)
+    if autoplay != None:
+        conditions.append('autoplay = ?')
+        values.append(int(autoplay))
+    conditions.append('score IS NOT NULL') # games still being played aren't counted
+    return ' AND '.join(conditions), values
+
+
+def getLeaderboard(connection, limit=10, width=None, height=None, numTEACHERTypes=None, autoplay=False):
+    # The best limit games (see getBoardFilter()), best first, as a list
+    # of dicts.
+    where, values = getBoardFilter(width, height, numTEACHERTypes, autoplay)
+    cursor = connection.execute('SELECT id, score, moves, maxCascadeDepth, seconds, width, height, numTEACHERTypes, startTime '
+                                'FROM games WHERE %s ORDER BY score DESC LIMIT ?' % where, values + [limit])
+    columns = [description[0] for description in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor]
+
+
+def getAverageCombo(connection, width=None, height=None, numTEACHERTypes=None, autoplay=False):
+    # The average number of cascade steps of the moves that made a match in
+    # the games (see getBoardFilter()), or None if there are none.
+    where, values = getBoardFilter(width, height, numTEACHERTypes, autoplay)
+    totalSteps, totalMoves = connection.execute('SELECT SUM(cascadeSteps), SUM(moves) FROM games WHERE %s' % where, values).fetchone()
+    if not totalMoves:
+        return None
+    return totalSteps / float(totalMoves)
+
+
+def getTotals(connection, autoplay=False):
+    # Games played, moves made and hours played.
+    where, values = getBoardFilter(autoplay=autoplay)
+    games, moves, seconds = connection.execute('SELECT COUNT(*), SUM(moves), SUM(seconds) FROM games WHERE %s' % where, values).fetchone()
+    return {'games': games, 'moves': moves or 0, 'hours': (seconds or 0.0) / 3600.0}
+
+
+def runBenchmark(path, numGames=2000, movesPerGame=50, seed=0):
+    # Record numGames made up games through a store, the way the game does,
+    # then time the queries. Prints the results; returns the longest any
+    # record*() call took, in seconds.
+    rng = random.Random(seed)
+    store = openStats(path)
+    longestCall = 0.0
+    startTime = time.perf_counter()
+    for gameNum in range(numGames):
+        size = rng.choice([6, 8, 10])
+        game = {'board': [[0] * size] * size, 'seed': gameNum, 'numTEACHERTypes': rng.choice([5, 6, 7]),
+                'score': 0, 'validMoves': set([((0, 0), (0, 1))])}
+        callStart = time.perf_counter()
+        gameStats = startGameStats(store, game, rng.random() < 0.2)
+        longestCall = max(longestCall, time.perf_counter() - callStart)
+        for moveNum in range(movesPerGame):
+            callStart = time.perf_counter()
+            recordSwapStats(gameStats, game, {'x': 0, 'y': 0}, {'x': 1, 'y': 0})
+            longestCall = max(longestCall, time.perf_counter() - callStart)
+            cascadeSteps = None
+            if rng.random() < 0.9:
+                cascadeSteps = [[[(0, y) for y in range(3)]] for step in range(min(rng.randint(1, 3), rng.randint(1, 6)))]
+                game['score'] += 10 * len(cascadeSteps)
+            callStart = time.perf_counter()
+            recordMoveDoneStats(gameStats, game, cascadeSteps)
+            longestCall = max(longestCall, time.perf_counter() - callStart)
+        game['validMoves'] = set()
+        callStart = time.perf_counter()
+        endGameStats(gameStats, game)
+        longestCall = max(longestCall, time.perf_counter() - callStart)
+    recordTime = time.perf_counter() - startTime
+    closeStats(store, None)
+    if store['error'] != None:
+        print('error: %s' % store['error'])
+    stats = store['stats']
+    print('%s games, %s rows recorded in %.2fs, longest call %.3f ms' % (numGames, stats['rows'], recordTime, longestCall * 1000))
+    print('%s batches written in %.2fs by the writer thread, %s rows dropped' % (stats['batches'], stats['writeTime'], stats['dropped']))
+
+    connection = connect(path)
+    for name, query in (('leaderboard', lambda: getLeaderboard(connection, 10)),
+                        ('8x8 leaderboard', lambda: getLeaderboard(connection, 10, 8, 8, 7)),
+                        ('average combo', lambda: getAverageCombo(connection, autoplay=None)),
+                        ('8x8 average combo', lambda: getAverageCombo(connection, 8, 8, 7))):
+        queryStart = time.perf_counter()
+        for i in range(100):
+            query()
+        print('%s: %.3f ms' % (name, (time.perf_counter() - queryStart) * 10))
+    connection.close()
+    return longestCall
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Show the Teacher Crush leaderboard and statistics.')
+    parser.add_argument('--stats', default=STATSPATH, help='the statistics database')
+    parser.add_argument('--top', type=int, default=10, help='how many games to show')
+    parser.add_argument('--width', type=int, help='only games on boards this wide')
+    parser.add_argument('--height', type=int, help='only games on boards this high')
+    parser.add_argument('--types', type=int, help='only games with this many TEACHER types')
+    parser.add_argument('--autoplay', action='store_true', help="show the computer's games instead")
+    parser.add_argument('--benchmark', type=int, metavar='GAMES', help='time recording and queries on a scratch database')
+    args = parser.parse_args(argv)
+
+    if args.benchmark != None:
+        path = 'stats-benchmark-%s.sqlite3' % os.getpid()
+        try:
+            runBenchmark(path, args.benchmark)
+        finally:
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+        return 0
+
+    if not os.path.exists(args.stats):
+        print('No games have been recorded in %s yet.' % args.stats)
+        return 1
+    connection = connect(args.stats)
+    games = getLeaderboard(connection, args.top, args.width, args.height, args.types, args.autoplay)
+    for rank, game in enumerate(games, 1):
+        print('%3s. %6s points  %4s moves  combo %s  %dx%d/%s  %s' % (rank, game['score'], game['moves'], game['maxCascadeDepth'],
+                                                                     game['width'], game['height'], game['numTEACHERTypes'],
+                                                                     time.strftime('%Y-%m-%d %H:%M', time.localtime(game['startTime']))))
+    averageCombo = getAverageCombo(connection, args.width, args.height, args.types, args.autoplay)
+    totals = getTotals(connection, args.autoplay)
+    print('%s games, %s moves, %.1f hours played, average combo %s' % (totals['games'], totals['moves'], totals['hours'],
+                                                                      '%.2f' % averageCombo if averageCombo != None else '-'))
+    connection.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,76 @@
+# Time-based animation of TEACHERs sliding across the board.
+#
+# A scheduler is a dict holding its own clock and the tweens (TEACHERs
+# moving from one board space to another) that are running. The game loop
+# calls updateScheduler() with the time since the last frame, so animations
+# run at the same speed whatever the frame rate is, and any number of them
+# can run at once. Nothing in here blocks or draws; the renderer asks for
+# getMovingTEACHERs() and getHiddenSpaces() each frame.
+
+class Tween(object):
+    # One TEACHER moving between two board spaces. A cascade starts lots of
+    # these at once, so __slots__ keeps them small.
+    __slots__ = ('imageNum', 'fromXY', 'toXY', 'start', 'duration')
+
+    def __init__(self, imageNum, fromXY, toXY, start, duration):
+        self.imageNum = imageNum
+        self.fromXY = fromXY
+        self.toXY = toXY
+        self.start = start
+        self.duration = duration
+
+
+def newScheduler():
+    return {'time': 0.0, 'tweens': []}
+
+
+def addTween(scheduler, imageNum, fromXY, toXY, duration):
+    # Start moving TEACHER imageNum from the board space fromXY to toXY
+    # (both (x, y) tuples) over duration seconds. toXY should already hold
+    # the TEACHER on the board; it is hidden until the tween finishes.
+    scheduler['tweens'].append(Tween(imageNum, fromXY, toXY, scheduler['time'], duration))
+
+
+def updateScheduler(scheduler, elapsed):
+    # Move the scheduler's clock on by elapsed seconds and drop the tweens
+    # that have finished.
+    scheduler['time'] += elapsed
+    now = scheduler['time']
+    tweens = scheduler['tweens']
+    for tween in tweens:
+        if now >= tween.start + tween.duration:
+            # Something finished, so filter the list (most frames nothing
+            # has, and the list is left alone).
+            scheduler['tweens'] = [tween for tween in tweens if now < tween.start + tween.duration]
+            break
+
+
+def isIdle(scheduler):
+    return len(scheduler['tweens']) == 0
+
+
+def getMovingTEACHERs(scheduler):
+    # Returns a list of (imageNum, x, y) tuples, where x and y are the
+    # (fractional) board coordinates each moving TEACHER is at now.
+    movingTEACHERs = []
+    for tween in scheduler['tweens']:
+        if tween.duration > 0:
+            progress = (scheduler['time'] - tween.start) / tween.duration
+            progress = min(max(progress, 0.0), 1.0)
+        else:
+            progress = 1.0
+        fromX, fromY = tween.fromXY
+        toX, toY = tween.toXY
+        movingTEACHERs.append((tween.imageNum,
+                               fromX + (toX - fromX) * progress,
+                               fromY + (toY - fromY) * progress))
+    return movingTEACHERs
+
+
+def getHiddenSpaces(scheduler):
+    # The board spaces that shouldn't be drawn because the TEACHER in them
+    # is still on its way there.
+    hiddenSpaces = set()
+    for tween in scheduler['tweens']:
+        hiddenSpaces.add(tween.toXY)
+    return hiddenSpaces
@@ -0,0 +1,76 @@
+import TeacherCrush, TeacherAudio, TeacherTween, TeacherReplay, TeacherStats
+from TeacherEngine import *
+
+
+def findCascadingGame(minSteps=2):
+    # Returns a game and a valid move on it whose cascade takes at least
+    # minSteps steps.
+    for seed in range(1000):
+        game = newGame(seed, 8, 8, 7)
+        for move in sorted(game['validMoves']):
+            lookahead = copyGame(game)
+            lookahead['random'].setstate(game['random'].getstate())
+            if len(playMove(lookahead, {'x': move[0][0], 'y': move[0][1]}, {'x': move[1][0], 'y': move[1][1]})) >= minSteps:
+                return game, move
+    raise AssertionError('no seed has a cascading move')
+
+
+def setGlobals():
+    # What TeacherCrush.main() would set up, without a window or sounds.
+    TeacherCrush.GAMESOUNDS = TeacherAudio.newSoundManager(TeacherCrush.NUMMATCHSOUNDS)
+    TeacherCrush.AUTOPLAY = False
+
+
+def quitDuringMove(tmp_path, stepsShown):
+    # Record a game, start a cascading move, show stepsShown steps of it and
+    # then quit the way the Escape key does. Returns the loaded log.
+    setGlobals()
+    game, move = findCascadingGame()
+    path = str(tmp_path / 'game.jsonl')
+    recorder = TeacherReplay.newRecorder(game, path)
+    animations = TeacherTween.newScheduler()
+    moveInProgress = TeacherCrush.startMove(game, animations, [], recorder, None,
+                                            {'x': move[0][0], 'y': move[0][1]},
+                                            {'x': move[1][0], 'y': move[1][1]})
+    for i in range(stepsShown):
+        next(moveInProgress)
+    TeacherCrush.stopRecording(recorder, None, game, moveInProgress)
+    return TeacherReplay.loadLog(path)
+
+
+def test_quit_before_swap_is_shown(tmp_path):
+    log = quitDuringMove(tmp_path, 0)
+    assert TeacherReplay.validateLog(log) == []
+
+
+def test_quit_mid_cascade(tmp_path):
+    # After the swap and the first refill the board can still have matches.
+    log = quitDuringMove(tmp_path, 2)
+    assert log['end']['moves'] == 1
+    assert TeacherReplay.validateLog(log) == []
+
+
+def test_quit_mid_cascade_stats(tmp_path):
+    # The games row of a game left during a cascade has to add up to its
+    # moves rows.
+    setGlobals()
+    game, move = findCascadingGame()
+    path = str(tmp_path / 'stats.sqlite3')
+    store = TeacherStats.openStats(path)
+    gameStats = TeacherStats.startGameStats(store, game)
+    moveInProgress = TeacherCrush.startMove(game, TeacherTween.newScheduler(), [], None, gameStats,
+                                            {'x': move[0][0], 'y': move[0][1]},
+                                            {'x': move[1][0], 'y': move[1][1]})
+    next(moveInProgress)
+    next(moveInProgress)
+    TeacherCrush.stopRecording(None, gameStats, game, moveInProgress)
+    TeacherStats.closeStats(store)
+    assert store['error'] == None
+
+    connection = TeacherStats.connect(path)
+    score, moves, cascadeSteps, pointsDeducted = connection.execute('SELECT score, moves, cascadeSteps, pointsDeducted FROM games').fetchone()
+    movesRows, depths, points = connection.execute('SELECT SUM(matched), SUM(cascadeDepth), SUM(points) FROM moves').fetchone()
+    assert (score, moves, cascadeSteps) == (game['score'], 1, depths)
+    assert moves == movesRows
+    assert score == points - pointsDeducted
+    assert cascadeSteps >= 2